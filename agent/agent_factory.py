@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from strands.agent.state import AgentState
+from strands.telemetry.metrics import EventLoopMetrics
+from config import AGENT_POOL_SIZE
+
+
+def reset_agent(agent):
+    """Clear conversation and state so a pooled agent can serve an unrelated request."""
+    agent.messages.clear()
+    agent.state = AgentState()
+    agent.event_loop_metrics = EventLoopMetrics()
+    if hasattr(agent.conversation_manager, "removed_message_count"):
+        agent.conversation_manager.removed_message_count = 0
+    if hasattr(agent.conversation_manager, "reset"):
+        agent.conversation_manager.reset()
+
+
+def attach_session_manager(agent, session_manager):
+    """
+    Attach a session manager to an already built agent, doing what
+    Agent.__init__ does when one is passed in: register its hooks and
+    restore (or create) the persisted session.
+    """
+    agent._session_manager = session_manager
+    agent.hooks.add_hook(session_manager)
+    session_manager.initialize(agent)
+    return agent
+
+
+class AgentPool:
+    """
+    Warm pool of pre-built agents for one role.
+
+    `build(key)` constructs an agent; `key` identifies what the agent was
+    built against (e.g. the MCP tool list) so agents built for an old key
+    are dropped instead of reused. Agents are reset before going back to
+    the pool, and the pool is refilled in the background so construction
+    stays off the request path.
+    """
+
+    def __init__(self, name, build, size=AGENT_POOL_SIZE):
+        self.name = name
+        self.build = build
+        self.size = size
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._refilling = False
+        self.hits = 0
+        self.misses = 0
+        self.build_seconds = 0.0
+        self.builds = 0
+
+    def _build(self, key):
+        started = time.perf_counter()
+        agent = self.build(key)
+        with self._lock:
+            self.builds += 1
+            self.build_seconds += time.perf_counter() - started
+        return agent
+
+    def _take(self, key):
+        with self._lock:
+            while self._idle:
+                idle_key, agent = self._idle.popleft()
+                if idle_key is key:
+                    self.hits += 1
+                    return agent
+            self.misses += 1
+        return None
+
+    def _refill(self, key):
+        try:
+            while True:
+                with self._lock:
+                    if len(self._idle) >= self.size:
+                        return
+                agent = self._build(key)
+                with self._lock:
+                    self._idle.append((key, agent))
+        except Exception as e:
+            print(f"Agent pool {self.name} refill failed: {e}")
+        finally:
+            with self._lock:
+                self._refilling = False
+
+    def refill_async(self, key=None):
+        with self._lock:
+            if self._refilling or len(self._idle) >= self.size:
+                return
+            self._refilling = True
+        threading.Thread(target=self._refill, args=(key,), name=f"agent-pool-{self.name}", daemon=True).start()
+
+    def warm(self, key=None):
+        with self._lock:
+            self._refilling = True
+        self._refill(key)
+
+    def take(self, key=None):
+        """Take an agent out of the pool for good (e.g. to bind it to a session)."""
+        agent = self._take(key) or self._build(key)
+        self.refill_async(key)
+        return agent
+
+    def release(self, agent, key=None):
+        reset_agent(agent)
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((key, agent))
+
+    @contextmanager
+    def acquire(self, key=None):
+        """Borrow a clean agent for one request and return it to the pool afterwards."""
+        agent = self.take(key)
+        yield agent
+        # Only reached on success: an agent whose turn failed half way is not recycled
+        self.release(agent, key)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "idle": len(self._idle),
+                "hits": self.hits,
+                "misses": self.misses,
+                "builds": self.builds,
+                "avg_build_ms": round(self.build_seconds / self.builds * 1000, 2) if self.builds else 0.0,
+            }
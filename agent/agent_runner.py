@@ -0,0 +1,92 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import AGENT_MAX_CONCURRENCY, AGENT_MAX_QUEUE
+
+
+class AgentBusyError(Exception):
+    """Raised when the agent queue of this worker is full."""
+
+
+class AgentRunner:
+    """
+    Runs blocking agent turns on a bounded thread pool so the event loop
+    stays free for other WebSocket sessions and webhooks.
+    """
+
+    def __init__(self, max_concurrency=AGENT_MAX_CONCURRENCY, max_queue=AGENT_MAX_QUEUE):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="agent")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._max_queue_depth = 0
+        self._total_wait = 0.0
+        self._total_run = 0.0
+
+    def _enter_queue(self):
+        with self._lock:
+            if self.max_queue and self._queued >= self.max_queue:
+                self._rejected += 1
+                raise AgentBusyError("Agent queue is full, please retry shortly")
+            self._queued += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._queued)
+
+    def _call(self, fn, enqueued_at):
+        with self._lock:
+            self._queued -= 1
+            self._in_flight += 1
+            self._total_wait += time.perf_counter() - enqueued_at
+        started = time.perf_counter()
+        try:
+            result = fn()
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+        else:
+            with self._lock:
+                self._completed += 1
+            return result
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._total_run += time.perf_counter() - started
+
+    async def run_sync(self, fn, *args, **kwargs):
+        """Run any blocking callable on the agent pool."""
+        self._enter_queue()
+        loop = asyncio.get_running_loop()
+        enqueued_at = time.perf_counter()
+        return await loop.run_in_executor(self.executor, self._call, lambda: fn(*args, **kwargs), enqueued_at)
+
+    async def run(self, agent, message, **kwargs) -> str:
+        """Run one agent turn and return its text response."""
+        return await self.run_sync(lambda: str(agent(message, **kwargs)))
+
+    def metrics(self) -> dict:
+        with self._lock:
+            finished = self._completed + self._failed
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "queue_depth": self._queued,
+                "max_queue_depth": self._max_queue_depth,
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(self._total_wait / finished * 1000, 2) if finished else 0.0,
+                "avg_run_ms": round(self._total_run / finished * 1000, 2) if finished else 0.0,
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+agent_runner = AgentRunner()
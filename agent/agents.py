@@ -1,25 +1,54 @@
 from strands import Agent
 from strands.models import BedrockModel as StrandsBedrockModel
-from strands.session.s3_session_manager import S3SessionManager
 from strands_tools import retrieve
 from tools import salesforceAgent, orchestratedInvoice, sendSNSEmail, reminderAgent, getSalesforceDetails, approveAndSendInvoice, updateInvoiceDatabase
+from tools import salesforce_agents, reminder_agents, salesforce_mcp
+from tool_catalog import tool_catalog
+from agent_factory import AgentPool, attach_session_manager
+from mcp_pool import MCPUnavailableError
 from prompts import ORCHESTRATOR_AGENT_PROMPT
 from config import MODEL_ID
+from session_store import session_manager
+from context_manager import TokenBudgetConversationManager
+from prompt_cache import PromptCacheHook, model_cache_config
 
-model = StrandsBedrockModel(model_id=MODEL_ID, streaming=True)
+# The orchestrator prompt and its tool specs are the stable prefix of every request
+model = StrandsBedrockModel(model_id=MODEL_ID, streaming=True, **model_cache_config())
 
-def create_orchestrator_agent(session_id: str) -> Agent:
-    """Create orchestrator agent with unique session ID"""
-    session_manager = S3SessionManager(
-        session_id=session_id,
-        bucket="hackathon-session-context-great-ai-hackathon-2",
-        prefix="production/",
-        region_name="ap-southeast-5"
-    )
-    
+def build_orchestrator_agent(_=None) -> Agent:
+    """Orchestrator agent without a session; the session manager is attached when the agent is handed out"""
     return Agent(
         system_prompt=ORCHESTRATOR_AGENT_PROMPT,
         tools=[salesforceAgent, getSalesforceDetails, orchestratedInvoice, approveAndSendInvoice, sendSNSEmail, reminderAgent, retrieve, updateInvoiceDatabase],
-        session_manager=session_manager,
-        model=model
-    )
\ No newline at end of file
+        model=model,
+        # Long-lived WebSocket sessions: elide old tool output and summarize old turns to stay in budget
+        conversation_manager=TokenBudgetConversationManager(),
+        hooks=[PromptCacheHook("orchestrator")]
+    )
+
+orchestrator_agents = AgentPool("orchestrator", build_orchestrator_agent)
+
+def create_orchestrator_agent(session_id: str) -> Agent:
+    """Create orchestrator agent with unique session ID"""
+    # Messages are kept in memory and written behind the turn as one snapshot per session
+    agent = attach_session_manager(orchestrator_agents.take(), session_manager(session_id))
+    # Lets tools that hand work to background jobs report back to this session
+    agent.state.set("session_id", session_id)
+    return agent
+
+def warm_agent_pools():
+    """Pre-build orchestrator and sub-agents so the first requests skip construction"""
+    orchestrator_agents.warm()
+    reminder_agents.warm()
+    try:
+        with salesforce_mcp.session() as connection:
+            salesforce_agents.warm(tool_catalog.get_tools(connection))
+    except MCPUnavailableError as e:
+        print(f"Salesforce agent warm-up skipped: {e}")
+
+def agent_pool_metrics() -> dict:
+    return {
+        "orchestrator": orchestrator_agents.metrics(),
+        "salesforce": salesforce_agents.metrics(),
+        "reminder": reminder_agents.metrics(),
+    }
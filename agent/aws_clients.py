@@ -0,0 +1,112 @@
+import threading
+import time
+import boto3
+from botocore.config import Config
+from config import (
+    AWS_REGION, AWS_MAX_POOL_CONNECTIONS, AWS_RETRY_MODE, AWS_MAX_ATTEMPTS,
+    AWS_CONNECT_TIMEOUT, AWS_READ_TIMEOUT, AWS_PREWARM_SERVICES,
+    S3_BUCKET_PDF, S3_TEMPLATE_BUCKET, S3_SESSION_BUCKET
+)
+
+
+class AWSClients:
+    """
+    Process-wide boto3 clients and resources, created lazily once per
+    (service, region, config) and shared by all threads.
+
+    boto3 clients are thread safe; resources are only used for their action
+    calls (get_item, query, ...), which go straight to the underlying client.
+    All of them come from one boto3 Session so service models are loaded once,
+    and share a Config with a connection pool sized for the agent thread pool.
+    """
+
+    def __init__(self, region=AWS_REGION):
+        self.region = region
+        self.session = boto3.session.Session(region_name=region)
+        self.config = Config(
+            max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+            retries={'mode': AWS_RETRY_MODE, 'max_attempts': AWS_MAX_ATTEMPTS},
+            connect_timeout=AWS_CONNECT_TIMEOUT,
+            read_timeout=AWS_READ_TIMEOUT,
+        )
+        self._clients = {}
+        self._resources = {}
+        self._bucket_regions = {}
+        # boto3 Session is not thread safe for creating clients
+        self._lock = threading.Lock()
+        self.created = 0
+        self.creation_seconds = 0.0
+        self.bucket_region_lookups = 0
+
+    def _config(self, overrides):
+        return self.config.merge(Config(**dict(overrides))) if overrides else self.config
+
+    def client(self, service, region=None, **config_overrides):
+        """Shared client; config_overrides are botocore Config options, e.g. signature_version='s3v4'"""
+        key = (service, region or self.region, tuple(sorted(config_overrides.items())))
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    started = time.perf_counter()
+                    client = self.session.client(service, region_name=key[1], config=self._config(key[2]))
+                    self._clients[key] = client
+                    self.created += 1
+                    self.creation_seconds += time.perf_counter() - started
+        return client
+
+    def resource(self, service, region=None):
+        key = (service, region or self.region)
+        resource = self._resources.get(key)
+        if resource is None:
+            with self._lock:
+                resource = self._resources.get(key)
+                if resource is None:
+                    started = time.perf_counter()
+                    resource = self.session.resource(service, region_name=key[1], config=self.config)
+                    self._resources[key] = resource
+                    self.created += 1
+                    self.creation_seconds += time.perf_counter() - started
+        return resource
+
+    def bucket_region(self, bucket):
+        """Region of an S3 bucket, looked up once per process"""
+        region = self._bucket_regions.get(bucket)
+        if region is None:
+            try:
+                response = self.client('s3').get_bucket_location(Bucket=bucket)
+                region = response.get('LocationConstraint') or 'us-east-1'
+            except Exception as e:
+                print(f"Bucket region lookup failed for {bucket}: {e}")
+                return 'us-east-1'
+            self.bucket_region_lookups += 1
+            self._bucket_regions[bucket] = region
+        return region
+
+    def s3_for_bucket(self, bucket):
+        """SigV4 S3 client in the bucket's own region, so presigned URLs work without redirects"""
+        return self.client('s3', self.bucket_region(bucket), signature_version='s3v4')
+
+    def warm(self, services=AWS_PREWARM_SERVICES, buckets=(S3_BUCKET_PDF, S3_TEMPLATE_BUCKET, S3_SESSION_BUCKET)):
+        """Create the usual clients and resolve bucket regions ahead of the first request"""
+        for service in services:
+            self.client(service)
+        self.resource('dynamodb')
+        for bucket in buckets:
+            self.s3_for_bucket(bucket)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "clients": sorted(f"{service}@{region}" for service, region, _ in self._clients),
+                "resources": sorted(f"{service}@{region}" for service, region in self._resources),
+                "created": self.created,
+                "creation_seconds": round(self.creation_seconds, 3),
+                "bucket_regions": dict(self._bucket_regions),
+                "bucket_region_lookups": self.bucket_region_lookups,
+                "max_pool_connections": self.config.max_pool_connections,
+            }
+
+
+aws_clients = AWSClients()
@@ -0,0 +1,71 @@
+"""
+Per-request agent setup cost: building agents on every call vs. borrowing from a warm AgentPool.
+
+    python bench_agent_factory.py --iterations 200
+
+Runs offline: no model calls are made and no session manager is attached
+(the S3 session setup is network bound and measured separately by the
+session metrics). Pass --with-mcp to build Salesforce agents with the real
+MCP tool catalog instead of an empty tool list.
+"""
+import argparse
+import statistics
+import time
+from strands import Agent
+from prompts import SALESFORCE_AGENT_PROMPT, REMINDER_AGENT_PROMPT
+from agent_factory import AgentPool
+from agents import build_orchestrator_agent
+from tools import model
+
+
+def timed(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:<40} mean {statistics.mean(samples):8.3f} ms   p50 {statistics.median(samples):8.3f} ms   p95 {p95:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--with-mcp", action="store_true")
+    args = parser.parse_args()
+
+    tools = []
+    if args.with_mcp:
+        from tools import salesforce_mcp
+        from tool_catalog import tool_catalog
+        with salesforce_mcp.session() as connection:
+            tools = tool_catalog.get_tools(connection)
+
+    roles = {
+        "orchestrator": build_orchestrator_agent,
+        "salesforce": lambda key: Agent(system_prompt=SALESFORCE_AGENT_PROMPT, model=model, tools=key or []),
+        "reminder": lambda _: Agent(system_prompt=REMINDER_AGENT_PROMPT, model=model),
+    }
+
+    for role, build in roles.items():
+        key = tools if role == "salesforce" else None
+        report(f"{role}: construct per request", timed(lambda: build(key), args.iterations))
+
+        pool = AgentPool(role, build, size=2)
+        pool.warm(key)
+
+        def borrow():
+            with pool.acquire(key):
+                pass
+
+        report(f"{role}: warm pool acquire/release", timed(borrow, args.iterations))
+        print(f"{'':<40} pool {pool.metrics()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Load test the invoice read paths against the local SQLite store, no AWS needed.
+
+    python bench_invoice_store.py --rows 1000000 --db /tmp/invoices-bench.db
+
+Loads --rows synthetic invoices (skipped when the database already holds
+them), then times the dashboard read, the overdue recurring page walk and aging
+buckets (InvoiceAging, as the API serves them) and per-status / per-customer
+queries through the same Invoice model the API uses.
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from model.accounting import Invoice, InvoiceStats, InvoiceAging
+from model.sqlite_repository import SQLiteInvoiceRepository
+
+STATUSES = ['pending', 'processing', 'success', 'fail', 'overdue']
+TYPES = ['recurring', 'opportunity']
+
+
+def synthetic_invoices(count, customers):
+    started = datetime.now() - timedelta(days=365)
+    for i in range(count):
+        yield {
+            'invoice_id': f'BENCH-{i:08d}',
+            'customer_name': f'Customer {random.randrange(customers)}',
+            'amount': round(random.uniform(50, 5000), 2),
+            'invoice_type': random.choice(TYPES),
+            'status': random.choice(STATUSES),
+            'created_at': (started + timedelta(seconds=random.randrange(365 * 86400))).isoformat()
+        }
+
+
+def timed(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[max(0, int(len(samples) * 0.95) - 1)]
+    print(f"{label:<40} mean {statistics.mean(samples):9.3f} ms   p50 {statistics.median(samples):9.3f} ms   p95 {p95:9.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--customers", type=int, default=5000)
+    parser.add_argument("--db", default=":memory:")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--min-days", type=int, default=4, help="Days past due for the overdue recurring query")
+    args = parser.parse_args()
+
+    repository = SQLiteInvoiceRepository(args.db)
+    invoice_model = Invoice(repository)
+    stats = InvoiceStats(repository)
+    aging = InvoiceAging(repository)
+
+    existing = sum(int(value) for key, value in stats.get().items() if key.startswith('count_'))
+    if existing < args.rows:
+        print(f"Loading {args.rows} invoices into {args.db}")
+        load = invoice_model.create_invoices_bulk(synthetic_invoices(args.rows, args.customers))
+        print(f"  {load['written']} written in {load['seconds']}s ({load['items_per_second']} items/sec)")
+    if args.db != ":memory:":
+        print(f"Database size {os.path.getsize(args.db) / 1e6:.1f} MB")
+
+    report("dashboard", timed(stats.dashboard, args.iterations))
+
+    def overdue_walk():
+        start_key = None
+        while True:
+            _, start_key = aging.overdue('overdue', min_days=args.min_days, invoice_type='recurring',
+                                         limit=args.page_size, start_key=start_key)
+            if not start_key:
+                return
+
+    report("overdue recurring, first page", timed(
+        lambda: aging.overdue('overdue', min_days=args.min_days, invoice_type='recurring', limit=args.page_size),
+        args.iterations))
+    report("overdue recurring, all pages", timed(overdue_walk, max(1, args.iterations // 10)))
+    report("aging buckets", timed(aging.buckets, max(1, args.iterations // 10)))
+    report("aging buckets, recurring", timed(lambda: aging.buckets(invoice_type='recurring'), max(1, args.iterations // 10)))
+    report("status pending, last 30 days", timed(
+        lambda: invoice_model.query_by_status('pending', created_from=(datetime.now() - timedelta(days=30)).isoformat(), limit=args.page_size),
+        args.iterations))
+    report("customer history", timed(
+        lambda: invoice_model.get_invoices_by_customer(f'Customer {random.randrange(args.customers)}'), args.iterations))
+
+
+if __name__ == "__main__":
+    main()
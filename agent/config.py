@@ -1,5 +1,6 @@
 import os
 import platform
+import tempfile
 
 SALESFORCE_ZAPIER_MCP_URL ="https://mcp.zapier.com/api/mcp/s/NDgzZmM0ODQtMmViOC00NzQ0LThjYzQtM2NmMmI4ZDNmZThhOjA5YjczM2UyLWMwMDgtNDBlYy1iNjQ2LTFjZTliZTg4Yzk3Mg==/mcp"
 STRIPE_MCP_URL = ""
@@ -20,3 +21,157 @@ def get_wkhtmltopdf_path():
         return "/usr/bin/wkhtmltopdf"
 
 WKHTMLTOPDF_PATH = get_wkhtmltopdf_path()
+
+# Agent turns run on a bounded thread pool per uvicorn worker
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", "32"))
+AGENT_MAX_QUEUE = int(os.getenv("AGENT_MAX_QUEUE", "256"))
+
+# Persistent MCP sessions (see mcp_pool.py)
+MCP_MAX_IN_FLIGHT = int(os.getenv("MCP_MAX_IN_FLIGHT", "8"))
+MCP_ACQUIRE_TIMEOUT = float(os.getenv("MCP_ACQUIRE_TIMEOUT", "30"))
+MCP_HEALTH_CHECK_INTERVAL = float(os.getenv("MCP_HEALTH_CHECK_INTERVAL", "60"))
+MCP_RECONNECT_ATTEMPTS = int(os.getenv("MCP_RECONNECT_ATTEMPTS", "4"))
+MCP_RECONNECT_BACKOFF = float(os.getenv("MCP_RECONNECT_BACKOFF", "0.5"))
+MCP_RECONNECT_BACKOFF_MAX = float(os.getenv("MCP_RECONNECT_BACKOFF_MAX", "8"))
+MCP_TOOL_CATALOG_TTL = float(os.getenv("MCP_TOOL_CATALOG_TTL", "900"))
+
+# Pre-built agents kept warm per role (see agent_factory.py)
+AGENT_POOL_SIZE = int(os.getenv("AGENT_POOL_SIZE", "4"))
+
+# Salesforce entity cache in front of salesforceAgent, TTLs in seconds
+SF_CACHE_MAX_ENTRIES = int(os.getenv("SF_CACHE_MAX_ENTRIES", "2000"))
+SF_CACHE_TTL_ACCOUNT = float(os.getenv("SF_CACHE_TTL_ACCOUNT", "900"))
+SF_CACHE_TTL_CONTACT = float(os.getenv("SF_CACHE_TTL_CONTACT", "900"))
+SF_CACHE_TTL_OPPORTUNITY = float(os.getenv("SF_CACHE_TTL_OPPORTUNITY", "120"))
+SF_CACHE_TTL_PRODUCTS = float(os.getenv("SF_CACHE_TTL_PRODUCTS", "300"))
+
+# Salesforce REST API, used for direct reads that skip the LLM (see salesforce_client.py)
+SF_DOMAIN = os.getenv("SF_DOMAIN", "customer-velocity-7923")
+SF_USERNAME = os.getenv("SF_USERNAME", "")
+SF_PASSWORD = os.getenv("SF_PASSWORD", "")
+SF_SECURITY_TOKEN = os.getenv("SF_SECURITY_TOKEN", "Pr3GWeSxORs5YmMYIS22CmCot")
+SF_CLIENT_ID = os.getenv("SF_CLIENT_ID", "")
+SF_CLIENT_SECRET = os.getenv("SF_CLIENT_SECRET", "")
+SF_API_VERSION = os.getenv("SF_API_VERSION", "v58.0")
+SF_REQUEST_TIMEOUT = float(os.getenv("SF_REQUEST_TIMEOUT", "15"))
+
+# Invoice storage backend: "dynamodb", or "sqlite" for local development and load tests
+INVOICE_STORE = os.getenv("INVOICE_STORE", "dynamodb")
+INVOICE_SQLITE_PATH = os.getenv("INVOICE_SQLITE_PATH", "invoices.db")
+
+# Shared boto3 clients (see aws_clients.py)
+AWS_REGION = os.getenv("AWS_REGION", "ap-southeast-5")
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "50"))
+AWS_RETRY_MODE = os.getenv("AWS_RETRY_MODE", "standard")
+AWS_MAX_ATTEMPTS = int(os.getenv("AWS_MAX_ATTEMPTS", "5"))
+AWS_CONNECT_TIMEOUT = float(os.getenv("AWS_CONNECT_TIMEOUT", "5"))
+AWS_READ_TIMEOUT = float(os.getenv("AWS_READ_TIMEOUT", "30"))
+AWS_PREWARM_SERVICES = [service for service in os.getenv("AWS_PREWARM_SERVICES", "sns,s3,dynamodb").split(",") if service]
+
+S3_BUCKET_PDF = os.getenv("S3_BUCKET_PDF", "hackathon-generated-invoice-agent-pdf")
+S3_TEMPLATE_BUCKET = os.getenv("S3_TEMPLATE_BUCKET", "hackathon-static-invoice-template")
+S3_SESSION_BUCKET = os.getenv("S3_SESSION_BUCKET", "hackathon-session-context-great-ai-hackathon-2")
+
+# Invoice HTML templates (see template_cache.py); S3 copies are revalidated every TEMPLATE_TTL seconds
+TEMPLATE_S3_PREFIX = os.getenv("TEMPLATE_S3_PREFIX", "")
+TEMPLATE_LOCAL_DIR = os.getenv("TEMPLATE_LOCAL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates"))
+TEMPLATE_TTL = float(os.getenv("TEMPLATE_TTL", "300"))
+TEMPLATE_CACHE_SIZE = int(os.getenv("TEMPLATE_CACHE_SIZE", "50"))
+# Template names remembered as missing (per-customer variants that do not exist)
+TEMPLATE_MISSING_MAX = int(os.getenv("TEMPLATE_MISSING_MAX", "1000"))
+TEMPLATE_BYTECODE_DIR = os.getenv("TEMPLATE_BYTECODE_DIR", os.path.join(tempfile.gettempdir(), "invoice-template-bytecode"))
+TEMPLATE_WARM = [name for name in os.getenv("TEMPLATE_WARM", "invoice_template.html").split(",") if name]
+
+# Invoice PDF rendering (see pdf_renderer.py): "auto" uses WeasyPrint when installed, else wkhtmltopdf
+PDF_ENGINE = os.getenv("PDF_ENGINE", "auto")
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_RENDER_TIMEOUT = float(os.getenv("PDF_RENDER_TIMEOUT", "60"))
+# Stylesheets/images each WeasyPrint worker keeps in memory across renders
+PDF_ASSET_CACHE_SIZE = int(os.getenv("PDF_ASSET_CACHE_SIZE", "64"))
+
+SNS_TOPIC_ARN = os.getenv("SNS_TOPIC_ARN", "arn:aws:sns:ap-southeast-5:757834573545:HackathonTopic")
+
+# Month-end invoice batches (see invoice_batch.py): worker threads per pipeline stage
+INVOICE_BATCH_CONCURRENCY = {
+    stage: int(workers)
+    for stage, workers in (
+        entry.split("=") for entry in os.getenv(
+            "INVOICE_BATCH_CONCURRENCY", "fetch=8,render=4,pdf=4,upload=16,notify=8,record=8"
+        ).split(",") if entry
+    )
+}
+INVOICE_BATCH_HISTORY = int(os.getenv("INVOICE_BATCH_HISTORY", "20"))
+
+# Invoice PDF uploads (see pdf_uploader.py); sizes in bytes
+PDF_URL_EXPIRY = int(os.getenv("PDF_URL_EXPIRY", "86400"))
+PDF_MULTIPART_THRESHOLD = int(os.getenv("PDF_MULTIPART_THRESHOLD", str(8 * 1024 * 1024)))
+PDF_MULTIPART_CHUNKSIZE = int(os.getenv("PDF_MULTIPART_CHUNKSIZE", str(8 * 1024 * 1024)))
+PDF_UPLOAD_CONCURRENCY = int(os.getenv("PDF_UPLOAD_CONCURRENCY", "4"))
+
+# Content hash -> uploaded invoice PDF, so retried sends reuse it (see invoice_dedup.py)
+INVOICE_DEDUP_DB = os.getenv("INVOICE_DEDUP_DB", "invoice_dedup.db")
+# A sender holds an invoice for at most INVOICE_CLAIM_SECONDS; others wait up to INVOICE_CLAIM_WAIT for it
+INVOICE_CLAIM_SECONDS = float(os.getenv("INVOICE_CLAIM_SECONDS", "600"))
+INVOICE_CLAIM_WAIT = float(os.getenv("INVOICE_CLAIM_WAIT", "60"))
+
+# Durable background jobs (see job_queue.py). JOB_WORKERS threads run in the API process;
+# set it to 0 and start run_job_worker.py to run jobs in separate processes instead
+JOB_QUEUE_DB = os.getenv("JOB_QUEUE_DB", "jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", "2"))
+JOB_RETRY_BACKOFF_MAX = float(os.getenv("JOB_RETRY_BACKOFF_MAX", "300"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+
+# Webhook work runs after the 200 is sent (see webhook_dispatcher.py)
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "8"))
+WEBHOOK_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", "1000"))
+
+# WhatsApp message IDs already handled (see message_dedup.py). Meta redelivers for up to 7 days;
+# set WHATSAPP_DEDUP_DB to "" to keep the IDs in memory only
+WHATSAPP_DEDUP_TTL = float(os.getenv("WHATSAPP_DEDUP_TTL", str(7 * 24 * 3600)))
+WHATSAPP_DEDUP_MAX_ENTRIES = int(os.getenv("WHATSAPP_DEDUP_MAX_ENTRIES", "100000"))
+WHATSAPP_DEDUP_DB = os.getenv("WHATSAPP_DEDUP_DB", "whatsapp_dedup.db")
+
+# Days from created_at to due_at per invoice type; "default" covers types not listed
+PAYMENT_TERMS_DAYS = {
+    invoice_type: int(days)
+    for invoice_type, days in (
+        entry.split("=") for entry in os.getenv(
+            "PAYMENT_TERMS_DAYS", "recurring=7,opportunity=14,default=14"
+        ).split(",") if entry
+    )
+}
+
+# Overdue reminder campaigns (see reminder_campaign.py). REMINDER_SCHEDULE is a 5-field cron
+# expression (minute hour day month weekday), e.g. "0 9 * * 1-5"; empty means campaigns only
+# run on demand. Every process with a schedule tries; the campaign lock lets only one of them send.
+REMINDER_SCHEDULE = os.getenv("REMINDER_SCHEDULE", "")
+REMINDER_MIN_DAYS = int(os.getenv("REMINDER_MIN_DAYS", "1"))
+REMINDER_INTERVAL_DAYS = int(os.getenv("REMINDER_INTERVAL_DAYS", "7"))
+REMINDER_ESCALATE_DAYS = int(os.getenv("REMINDER_ESCALATE_DAYS", "90"))
+REMINDER_RATE_PER_SECOND = float(os.getenv("REMINDER_RATE_PER_SECOND", "10"))
+REMINDER_MAX_ATTEMPTS = int(os.getenv("REMINDER_MAX_ATTEMPTS", "3"))
+REMINDER_AGENT_CONCURRENCY = int(os.getenv("REMINDER_AGENT_CONCURRENCY", "4"))
+REMINDER_HISTORY = int(os.getenv("REMINDER_HISTORY", "20"))
+# Only one non-dry-run campaign runs at a time per host; the lock expires after REMINDER_LOCK_SECONDS
+REMINDER_LOCK_DB = os.getenv("REMINDER_LOCK_DB", "reminder_campaigns.db")
+REMINDER_LOCK_SECONDS = float(os.getenv("REMINDER_LOCK_SECONDS", "3600"))
+
+# Orchestrator conversation sessions (see session_store.py): "s3" or "local" (SESSION_LOCAL_DIR)
+SESSION_STORE = os.getenv("SESSION_STORE", "s3")
+SESSION_S3_PREFIX = os.getenv("SESSION_S3_PREFIX", "production/")
+SESSION_LOCAL_DIR = os.getenv("SESSION_LOCAL_DIR", "sessions")
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "2"))
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "500"))
+
+# Orchestrator context window (see context_manager.py); tokens are estimated at ~4 characters each
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "24000"))
+CONTEXT_RECENT_MESSAGES = int(os.getenv("CONTEXT_RECENT_MESSAGES", "6"))
+CONTEXT_TOOL_RESULT_CHARS = int(os.getenv("CONTEXT_TOOL_RESULT_CHARS", "1500"))
+CONTEXT_SUMMARY_CHARS = int(os.getenv("CONTEXT_SUMMARY_CHARS", "4000"))
+
+# Bedrock prompt caching (see prompt_cache.py): cache point type placed after the system prompt
+# and tool specs, "default" on supported models; empty disables caching
+PROMPT_CACHE = os.getenv("PROMPT_CACHE", "default") or None
@@ -0,0 +1,260 @@
+import json
+import threading
+from collections import deque
+from strands.agent.conversation_manager import ConversationManager
+from strands.types.exceptions import ContextWindowOverflowException
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_RECENT_MESSAGES, CONTEXT_TOOL_RESULT_CHARS, CONTEXT_SUMMARY_CHARS
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:"
+PINNED_PREFIX = "Latest invoice draft (still current):"
+INVOICE_PREVIEW_MARKER = '"invoice_preview"'
+# Characters per token for the budget estimate; close enough for Claude on English and JSON
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(messages) -> int:
+    return sum(len(json.dumps(message, default=str)) for message in messages) // CHARS_PER_TOKEN
+
+
+def describe_payload(text: str) -> str:
+    """Short reference to a bulky tool output: its type and invoice identity when it is JSON"""
+    try:
+        data = json.loads(text[text.find("{"):]) if "{" in text else None
+    except ValueError:
+        data = None
+    if isinstance(data, dict):
+        account = data.get("account")
+        details = [
+            str(data.get("type") or "json"),
+            str(data.get("invoice_number") or data.get("invoice_id") or ""),
+            str(account.get("name") if isinstance(account, dict) else account or ""),
+            str(data.get("status") or ""),
+        ]
+        return ", ".join(detail for detail in details if detail)
+    return text[:120].replace("\n", " ")
+
+
+def message_texts(message):
+    """Text of a message's text blocks and tool results"""
+    for block in message["content"]:
+        if "text" in block:
+            yield block["text"]
+        elif "toolResult" in block:
+            for part in block["toolResult"].get("content", []):
+                if "text" in part:
+                    yield part["text"]
+                elif "json" in part:
+                    yield json.dumps(part["json"], default=str)
+
+
+def elided(text: str) -> str:
+    return f"[elided {len(text)} chars: {describe_payload(text)}]"
+
+
+class ContextMetrics:
+    """Prompt size per turn across all orchestrator sessions of this worker."""
+
+    def __init__(self, history=200):
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.input_tokens = 0
+        self.elided_blocks = 0
+        self.summarized_messages = 0
+        self.recent = deque(maxlen=history)
+
+    def record(self, turn: dict):
+        with self._lock:
+            self.turns += 1
+            self.input_tokens += turn["input_tokens"]
+            self.elided_blocks += turn["elided_blocks"]
+            self.summarized_messages += turn["summarized_messages"]
+            self.recent.append(turn)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "turns": self.turns,
+                "average_input_tokens": round(self.input_tokens / self.turns, 1) if self.turns else 0.0,
+                "elided_blocks": self.elided_blocks,
+                "summarized_messages": self.summarized_messages,
+                "recent_turns": list(self.recent)[-20:],
+            }
+
+
+context_metrics = ContextMetrics()
+
+
+class TokenBudgetConversationManager(ConversationManager):
+    """
+    Keeps the orchestrator's history within a token budget, applied after
+    every turn:
+
+    - tool results and long texts older than the last `recent_messages`
+      messages are replaced by short references (type, invoice number,
+      account), so full preview JSON and final_html are only sent while
+      they are fresh;
+    - when the history is still over `token_budget`, the oldest turns are
+      folded into a short extractive summary (no model call) at the start
+      of the first kept user message;
+    - the latest invoice preview is never elided, and is carried in the
+      summary if its turn is folded, since approval refers back to it.
+
+    Each turn's prompt tokens (as reported by Bedrock) and the history
+    estimate are recorded in context_metrics and logged.
+    """
+
+    def __init__(self, token_budget=CONTEXT_TOKEN_BUDGET, recent_messages=CONTEXT_RECENT_MESSAGES,
+                 tool_result_chars=CONTEXT_TOOL_RESULT_CHARS, summary_chars=CONTEXT_SUMMARY_CHARS):
+        super().__init__()
+        self.token_budget = token_budget
+        self.recent_messages = recent_messages
+        self.tool_result_chars = tool_result_chars
+        self.summary_chars = summary_chars
+        self.reset()
+
+    def reset(self):
+        """Forget everything about the previous conversation (pooled agents are reused)"""
+        self.removed_message_count = 0
+        self.summary = ""
+        self.pinned_draft = ""
+        self._input_tokens_seen = 0
+
+    def get_state(self) -> dict:
+        return {**super().get_state(), "summary": self.summary, "pinned_draft": self.pinned_draft}
+
+    def restore_from_session(self, state: dict):
+        result = super().restore_from_session(state)
+        self.summary = state.get("summary", "")
+        self.pinned_draft = state.get("pinned_draft", "")
+        return result
+
+    # -- per turn --------------------------------------------------------------
+
+    def apply_management(self, agent, **kwargs) -> None:
+        messages = agent.messages
+        pinned = self._latest_draft(messages)
+        elided_blocks = self._elide(messages, pinned)
+        summarized = 0
+        if estimate_tokens(messages) > self.token_budget:
+            summarized = self._summarize(messages, pinned, self.token_budget)
+        self._record_turn(agent, elided_blocks, summarized)
+
+    def reduce_context(self, agent, e=None, **kwargs) -> None:
+        """Called when Bedrock rejects the prompt as too long: fold down to half the budget"""
+        messages = agent.messages
+        pinned = self._latest_draft(messages)
+        self._elide(messages, pinned, keep_recent=2)
+        if not self._summarize(messages, pinned, self.token_budget // 2, keep_recent=2):
+            raise ContextWindowOverflowException("Unable to reduce the conversation any further") from e
+
+    def _record_turn(self, agent, elided_blocks, summarized):
+        usage = getattr(getattr(agent, "event_loop_metrics", None), "accumulated_usage", None) or {}
+        total_input = usage.get("inputTokens", 0)
+        if total_input < self._input_tokens_seen:
+            # Metrics were reset with the agent
+            self._input_tokens_seen = 0
+        turn = {
+            "input_tokens": total_input - self._input_tokens_seen,
+            "history_messages": len(agent.messages),
+            "history_tokens_estimate": estimate_tokens(agent.messages),
+            "elided_blocks": elided_blocks,
+            "summarized_messages": summarized,
+        }
+        self._input_tokens_seen = total_input
+        context_metrics.record(turn)
+        print(
+            f"Context: {turn['input_tokens']} prompt tokens this turn, history {turn['history_messages']} messages "
+            f"(~{turn['history_tokens_estimate']} tokens), elided {elided_blocks}, summarized {summarized}"
+        )
+
+    # -- elision -----------------------------------------------------------------
+
+    @staticmethod
+    def _latest_draft(messages):
+        for index in range(len(messages) - 1, -1, -1):
+            texts = message_texts(messages[index])
+            if any(INVOICE_PREVIEW_MARKER in text and not text.startswith(SUMMARY_PREFIX) for text in texts):
+                return index
+        return None
+
+    def _elide(self, messages, pinned, keep_recent=None):
+        keep_recent = self.recent_messages if keep_recent is None else keep_recent
+        count = 0
+        for index, message in enumerate(messages[:max(0, len(messages) - keep_recent)]):
+            if index == pinned:
+                continue
+            for block in message["content"]:
+                if "text" in block and len(block["text"]) > self.tool_result_chars and not block["text"].startswith(SUMMARY_PREFIX):
+                    block["text"] = elided(block["text"])
+                    count += 1
+                elif "toolResult" in block:
+                    for part in block["toolResult"].get("content", []):
+                        if "text" in part and len(part["text"]) > self.tool_result_chars:
+                            part["text"] = elided(part["text"])
+                            count += 1
+                        elif "json" in part and len(json.dumps(part["json"], default=str)) > self.tool_result_chars:
+                            text = json.dumps(part.pop("json"), default=str)
+                            part["text"] = elided(text)
+                            count += 1
+                elif "toolUse" in block and len(json.dumps(block["toolUse"].get("input"), default=str)) > self.tool_result_chars:
+                    block["toolUse"]["input"] = {"elided": describe_payload(json.dumps(block["toolUse"]["input"], default=str))}
+                    count += 1
+        return count
+
+    # -- summarizing -------------------------------------------------------------
+
+    @staticmethod
+    def _valid_start(message) -> bool:
+        # History must open with a user message that is not a tool result for a dropped tool use
+        return message["role"] == "user" and not any("toolResult" in block for block in message["content"])
+
+    @staticmethod
+    def _summary_lines(messages):
+        lines = []
+        for message in messages:
+            for block in message["content"]:
+                if "text" in block:
+                    if block["text"].startswith(SUMMARY_PREFIX):
+                        continue
+                    lines.append(f"{message['role']}: {' '.join(block['text'].split())[:200]}")
+                elif "toolUse" in block:
+                    lines.append(f"assistant called {block['toolUse'].get('name')}")
+                elif "toolResult" in block:
+                    texts = list(message_texts({"content": [block]}))
+                    lines.append(f"tool result ({block['toolResult'].get('status', 'success')}): {describe_payload(' '.join(texts))[:200]}")
+        return lines
+
+    def _summarize(self, messages, pinned, budget, keep_recent=None) -> int:
+        keep_recent = self.recent_messages if keep_recent is None else keep_recent
+        limit = len(messages) - keep_recent
+        cut = 0
+        # Drop whole turns from the front until the rest fits, always keeping the recent messages
+        while cut < limit:
+            cut += 1
+            while cut < limit and not self._valid_start(messages[cut]):
+                cut += 1
+            if cut >= limit or estimate_tokens(messages[cut:]) + (self.summary_chars // CHARS_PER_TOKEN) <= budget:
+                break
+        while cut < len(messages) and not self._valid_start(messages[cut]):
+            cut += 1
+        if cut <= 0 or cut >= len(messages):
+            return 0
+
+        summary = "\n".join(filter(None, [self.summary, *self._summary_lines(messages[:cut])]))
+        # Oldest lines go first once the summary is over its size
+        self.summary = summary[-self.summary_chars:].split("\n", 1)[-1] if len(summary) > self.summary_chars else summary
+        if pinned is not None and pinned < cut:
+            draft = next(text for text in message_texts(messages[pinned]) if INVOICE_PREVIEW_MARKER in text)
+            self.pinned_draft = draft[draft.find("{"):] if "{" in draft else draft
+        elif pinned is not None:
+            # A newer draft is still in the kept history
+            self.pinned_draft = ""
+        pinned_text = f"\n{PINNED_PREFIX}\n{self.pinned_draft}" if self.pinned_draft else ""
+
+        del messages[:cut]
+        self.removed_message_count += cut
+        first = messages[0]["content"]
+        if first and "text" in first[0] and first[0]["text"].startswith(SUMMARY_PREFIX):
+            first.pop(0)
+        first.insert(0, {"text": f"{SUMMARY_PREFIX}\n{self.summary}{pinned_text}"})
+        return cut
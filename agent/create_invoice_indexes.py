@@ -0,0 +1,16 @@
+import argparse
+from model.accounting import Invoice
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create the invoice indexes and backfill the fields they need")
+    parser.add_argument("--skip-backfill", action="store_true", help="Only create indexes; do not store due dates on older invoices")
+    parser.add_argument("--segments", type=int, default=4, help="Parallel batch writers for the backfill")
+    args = parser.parse_args()
+
+    invoice_model = Invoice()
+    created = invoice_model.ensure_indexes()
+    print(f"Created indexes: {created}" if created else "All invoice indexes already exist")
+
+    if not args.skip_backfill:
+        report = invoice_model.backfill_due_dates(parallel_segments=args.segments)
+        print(f"Due dates backfilled on {report['written']} invoices ({len(report['failed'])} failed) in {report['seconds']}s")
@@ -1,11 +1,6 @@
-import boto3
 from datetime import datetime, timedelta
 import random
-from decimal import Decimal
-
-# Initialize DynamoDB
-dynamodb = boto3.resource('dynamodb', region_name='ap-southeast-5')
-table = dynamodb.Table('hackathon-invoice')
+from model.accounting import Invoice
 
 # Mock data
 customers = [
@@ -37,25 +32,25 @@ customers = [
 invoice_types = ['recurring', 'opportunity']
 statuses = ['pending', 'processing', 'success', 'fail', 'overdue']
 
-def generate_mock_invoices():
-    for i in range(1, 15):
-        # Generate random dates
-        created_date = datetime.now() 
-        updated_date = created_date 
-        
-        invoice = {
-            'invoice_id': f'IV-{i:03d}',
-            'amount': Decimal(str(random.randint(1000, 100000))),
-            'created_at': created_date.isoformat(),
-            'customer_name': random.choice(customers),
-            'invoice_type': random.choice(invoice_types),
-            'status': random.choice(statuses),
-            'updated_at': updated_date.isoformat()
-        }
-        
-        table.put_item(Item=invoice)
-        print(f"Created invoice: {invoice['invoice_id']}")
+def generate_mock_invoices(count=14):
+    def invoices():
+        for i in range(1, count + 1):
+            # Generate random dates
+            created_date = datetime.now() 
+            
+            yield {
+                'invoice_id': f'IV-{i:03d}',
+                'amount': random.randint(1000, 100000),
+                'created_at': created_date.isoformat(),
+                'customer_name': random.choice(customers),
+                'invoice_type': random.choice(invoice_types),
+                'status': random.choice(statuses)
+            }
+    
+    report = Invoice().create_invoices_bulk(invoices())
+    print(f"Created {report['written']} invoices ({report['items_per_second']} items/sec)")
+    return report
 
 if __name__ == "__main__":
     generate_mock_invoices()
-    print("Generated 15 mock invoices successfully!")
+    print("Generated mock invoices successfully!")
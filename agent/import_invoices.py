@@ -0,0 +1,49 @@
+import argparse
+import csv
+import json
+import sys
+from model.accounting import Invoice
+
+def read_rows(path, file_format):
+    """Stream invoice dicts from a CSV (header row) or JSONL file, '-' for stdin"""
+    handle = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+    try:
+        if file_format == 'csv':
+            for row in csv.DictReader(handle):
+                # Empty cells fall back to the model defaults
+                yield {key: value for key, value in row.items() if value not in (None, '')}
+        else:
+            for line in handle:
+                if line.strip():
+                    yield json.loads(line)
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+def print_progress(written, failed):
+    if written and written % 1000 < 25:
+        print(f"  {written} written, {failed} failed", flush=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk create or update invoices from CSV or JSONL")
+    parser.add_argument("path", help="Input file, or - for stdin")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file extension")
+    parser.add_argument("--update", action="store_true", help="Rows are updates to existing invoices (invoice_id + changed fields)")
+    parser.add_argument("--segments", type=int, default=4, help="Parallel batch writers")
+    args = parser.parse_args()
+
+    file_format = args.format or ('csv' if args.path.endswith('.csv') else 'jsonl')
+    rows = read_rows(args.path, file_format)
+
+    invoice_model = Invoice()
+    if args.update:
+        report = invoice_model.update_invoices_bulk(rows, parallel_segments=args.segments, progress=print_progress)
+    else:
+        report = invoice_model.create_invoices_bulk(rows, parallel_segments=args.segments, progress=print_progress)
+
+    print(f"Written: {report['written']}")
+    print(f"Failed: {len(report['failed'])}")
+    print(f"Retried batches: {report['retries']}")
+    print(f"Elapsed: {report['seconds']}s ({report['items_per_second']} items/sec)")
+    if report['failed']:
+        print(f"Failed invoice IDs: {', '.join(map(str, report['failed'][:50]))}")
@@ -0,0 +1,324 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+from config import INVOICE_BATCH_CONCURRENCY, INVOICE_BATCH_HISTORY
+from invoice_service import (
+    InvoiceDataError, normalize_products, build_invoice_preview, finalize_invoice,
+    upload_invoice_pdf, find_sent_invoice, publish_notification, invoice_sent_message
+)
+from invoice_dedup import invoice_dedup, invoice_content_hash
+from pdf_renderer import pdf_renderer
+from salesforce_cache import salesforce_cache, SALESFORCE_ID_PATTERN
+from salesforce_client import salesforce_client, salesforce_fast_path
+
+STAGES = ("fetch", "render", "pdf", "upload", "notify", "record")
+
+
+def opportunity_sources(references):
+    """Batch sources for opportunity IDs or names"""
+    return [{"opportunity": reference.strip()} for reference in references if reference and reference.strip()]
+
+
+def recurring_sources(status="pending", invoice_model=None, page_size=100):
+    """Batch sources for every recurring invoice with `status`, read page by page from the status index"""
+    from model.accounting import Invoice
+    invoice_model = invoice_model or Invoice()
+    sources = []
+    start_key = None
+    while True:
+        items, start_key = invoice_model.query_by_type_and_status("recurring", status, limit=page_size, start_key=start_key)
+        sources.extend(
+            {"invoice_id": item["invoice_id"], "customer_name": item.get("customer_name"), "amount": item.get("amount", 0)}
+            for item in items
+        )
+        if not start_key:
+            return sources
+
+
+# -- stages ------------------------------------------------------------------
+# Each stage reads and extends item["work"]; none of them calls a model.
+
+def fetch_stage(item):
+    source = item["source"]
+    if "opportunity" in source:
+        reference = source["opportunity"]
+        query = f'invoice for "{reference}"'
+        sf_data = salesforce_cache.lookup(query)
+        if sf_data is None:
+            if not salesforce_client.configured:
+                raise InvoiceDataError("Salesforce REST credentials are not configured")
+            kind = "id" if SALESFORCE_ID_PATTERN.fullmatch(reference) else "name"
+            sf_data = salesforce_client.fetch_opportunity_bundle(kind, reference)
+            if sf_data is None:
+                raise InvoiceDataError(f"No single opportunity matches {reference}")
+            salesforce_cache.store(sf_data)
+    else:
+        # Recurring invoice: bill the customer's open opportunity when Salesforce has exactly one,
+        # otherwise the stored amount as a single subscription line
+        query = f'invoice for "{source.get("customer_name")}"'
+        sf_data = salesforce_cache.lookup(query) or salesforce_fast_path(query)
+        if sf_data is None:
+            amount = float(Decimal(str(source.get("amount") or 0)))
+            sf_data = {
+                "account": {"name": source.get("customer_name")},
+                "contact": {},
+                "products": [{
+                    "name": "Recurring subscription",
+                    "code": source["invoice_id"],
+                    "quantity": 1,
+                    "unit_price": amount,
+                    "total_price": amount,
+                }],
+            }
+        else:
+            salesforce_cache.store(sf_data)
+    item["work"]["sf_data"] = sf_data
+
+
+def render_stage(item):
+    invoice_data = build_invoice_preview(normalize_products(item["work"].pop("sf_data")))
+    item["content_hash"] = invoice_content_hash(invoice_data)
+    existing = find_sent_invoice(item["content_hash"])
+    if existing:
+        # Already uploaded by an earlier run or a chat send: keep its number and PDF
+        item["invoice_number"] = existing["invoice_number"]
+        item["pdf_url"] = existing["pdf_url"]
+        item["notified_at"] = existing["notified_at"]
+        item["deduplicated"] = True
+    else:
+        item["work"]["html"] = finalize_invoice(invoice_data)
+        item["invoice_number"] = invoice_data["invoice_number"]
+    item["account"] = (invoice_data.get("account") or {}).get("name")
+    item["total_amount"] = invoice_data.get("total_amount")
+
+
+def pdf_stage(item):
+    if item.get("deduplicated"):
+        return
+    item["work"]["pdf"] = pdf_renderer.render(item["work"].pop("html"))
+    item["pdf_bytes"] = len(item["work"]["pdf"])
+
+
+def upload_stage(item):
+    if item.get("deduplicated"):
+        return
+    item["pdf_url"] = upload_invoice_pdf(item["invoice_number"], item["work"].pop("pdf"), item["content_hash"])
+
+
+def notify_stage(item):
+    if item.get("notified_at"):
+        return
+    message = invoice_sent_message(item.get("account") or "Customer", item["invoice_number"], item["pdf_url"])
+    item["message_id"] = publish_notification(message, "Invoice Generated")
+    invoice_dedup.mark_notified(item["content_hash"], item["message_id"])
+
+
+def record_stage(item):
+    from model.accounting import Invoice
+    invoice_model = Invoice()
+    source = item["source"]
+    if "invoice_id" in source:
+        invoice_model.update_invoice(
+            source["invoice_id"],
+            last_invoice_number=item["invoice_number"],
+            last_invoice_url=item["pdf_url"],
+            last_invoiced_at=datetime.now().isoformat()
+        )
+    elif not (item.get("deduplicated") and invoice_model.get_invoice(item["invoice_number"])):
+        invoice_model.create_invoice(item["invoice_number"], item.get("account") or "Unknown", item.get("total_amount") or 0, "opportunity")
+
+
+STAGE_FUNCTIONS = {
+    "fetch": fetch_stage,
+    "render": render_stage,
+    "pdf": pdf_stage,
+    "upload": upload_stage,
+    "notify": notify_stage,
+    "record": record_stage,
+}
+
+
+class InvoiceBatch:
+    """
+    Month-end invoice run as a staged pipeline: fetch -> render -> pdf ->
+    upload -> notify -> record. Every stage has its own bounded thread pool,
+    so a slow stage (PDF rendering, Salesforce) queues work without stalling
+    the others, and items flow through independently. A failed item stops
+    at the stage that failed and is reported; the rest of the batch goes on.
+
+    Progress is published as events (see events / stream) and the final
+    report lists every item with its status, error and per-stage timings.
+    """
+
+    def __init__(self, sources, concurrency=None, notify=True, dry_run=False, on_event=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.on_event = on_event
+        self.stages = [
+            stage for stage in STAGES
+            if not (dry_run and stage in ("upload", "notify", "record")) and not (stage == "notify" and not notify)
+        ]
+        self.concurrency = {**INVOICE_BATCH_CONCURRENCY, **(concurrency or {})}
+        self.items = [
+            {"index": index, "source": source, "status": "queued", "stage": None, "error": None, "timings": {}, "work": {}}
+            for index, source in enumerate(sources)
+        ]
+        self.dry_run = dry_run
+        self.status = "pending"
+        self.started_at = None
+        self.finished_at = None
+        self._remaining = len(self.items)
+        self._events = []
+        self._condition = threading.Condition()
+        self._executors = {}
+
+    # -- progress ------------------------------------------------------------
+
+    def _emit(self, event_type, **fields):
+        with self._condition:
+            event = {"seq": len(self._events), "type": event_type, "batch_id": self.id, **fields}
+            self._events.append(event)
+            self._condition.notify_all()
+        if self.on_event:
+            self.on_event(event)
+
+    def events(self, after=-1) -> list:
+        with self._condition:
+            return self._events[after + 1:]
+
+    def stream(self, after=-1, poll_seconds=15):
+        """Yield events as they happen until the batch is done; None every poll_seconds of silence (keep-alive)"""
+        while True:
+            with self._condition:
+                if len(self._events) <= after + 1 and self.status in ("pending", "running"):
+                    self._condition.wait(poll_seconds)
+                pending = self._events[after + 1:]
+                finished = self.status not in ("pending", "running")
+            if not pending:
+                if finished:
+                    return
+                yield None
+            for event in pending:
+                after = event["seq"]
+                yield event
+
+    def counts(self) -> dict:
+        counts = {}
+        for item in self.items:
+            counts[item["status"]] = counts.get(item["status"], 0) + 1
+        return counts
+
+    # -- execution -----------------------------------------------------------
+
+    def _submit(self, item, position):
+        stage = self.stages[position]
+        item["stage"] = stage
+        item["status"] = "queued"
+        item["queued_at"] = time.perf_counter()
+        self._executors[stage].submit(self._run_stage, item, position)
+
+    def _run_stage(self, item, position):
+        stage = self.stages[position]
+        started = time.perf_counter()
+        item["status"] = "running"
+        try:
+            STAGE_FUNCTIONS[stage](item)
+        except Exception as e:
+            item["timings"][stage] = round(time.perf_counter() - started, 3)
+            item["status"] = "failed"
+            item["error"] = f"{stage}: {e}"
+            self._emit("item", index=item["index"], stage=stage, status="failed", error=item["error"])
+            self._finish(item)
+            return
+        item["timings"][stage] = round(time.perf_counter() - started, 3)
+        item.setdefault("waits", {})[stage] = round(started - item.pop("queued_at"), 3)
+
+        if position + 1 < len(self.stages):
+            self._emit("item", index=item["index"], stage=stage, status="done")
+            self._submit(item, position + 1)
+        else:
+            item["status"] = "rendered" if self.dry_run else "sent"
+            self._emit("item", index=item["index"], stage=stage, status=item["status"], invoice_number=item.get("invoice_number"))
+            self._finish(item)
+
+    def _finish(self, item):
+        item["work"] = {}
+        with self._condition:
+            self._remaining -= 1
+            self._condition.notify_all()
+
+    def run(self) -> dict:
+        """Run every item through the pipeline and return the report"""
+        self.status = "running"
+        self.started_at = datetime.now().isoformat()
+        self._emit("batch", status="running", total=len(self.items), stages=self.stages)
+        started = time.perf_counter()
+
+        self._executors = {
+            stage: ThreadPoolExecutor(max_workers=max(1, self.concurrency.get(stage, 4)), thread_name_prefix=f"batch-{stage}")
+            for stage in self.stages
+        }
+        try:
+            for item in self.items:
+                self._submit(item, 0)
+            with self._condition:
+                while self._remaining > 0:
+                    self._condition.wait()
+        finally:
+            for executor in self._executors.values():
+                executor.shutdown(wait=True)
+
+        self.seconds = time.perf_counter() - started
+        self.finished_at = datetime.now().isoformat()
+        # Status and final event change together so a streamer never stops before seeing it
+        with self._condition:
+            self.status = "completed"
+            self._emit("batch", status="completed", counts=self.counts(), seconds=round(self.seconds, 3))
+        return self.report()
+
+    def report(self) -> dict:
+        items = [{key: value for key, value in item.items() if key not in ("work", "queued_at")} for item in self.items]
+        stage_seconds = {}
+        for item in items:
+            for stage, seconds in item["timings"].items():
+                stage_seconds.setdefault(stage, []).append(seconds)
+        return {
+            "batch_id": self.id,
+            "status": self.status,
+            "dry_run": self.dry_run,
+            "stages": self.stages,
+            "concurrency": {stage: self.concurrency.get(stage) for stage in self.stages},
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "seconds": round(getattr(self, "seconds", 0.0), 3),
+            "total": len(items),
+            "counts": self.counts(),
+            "average_stage_seconds": {
+                stage: round(sum(values) / len(values), 3) for stage, values in stage_seconds.items()
+            },
+            "items": items,
+        }
+
+
+# Recent batches by ID, for the API progress and report endpoints
+_batches = OrderedDict()
+_batches_lock = threading.Lock()
+
+
+def start_batch(sources, **options) -> InvoiceBatch:
+    """Run a batch on a background thread and return it immediately"""
+    batch = InvoiceBatch(sources, **options)
+    with _batches_lock:
+        _batches[batch.id] = batch
+        while len(_batches) > INVOICE_BATCH_HISTORY:
+            _batches.popitem(last=False)
+    threading.Thread(target=batch.run, name=f"invoice-batch-{batch.id}", daemon=True).start()
+    return batch
+
+
+def get_batch(batch_id):
+    with _batches_lock:
+        return _batches.get(batch_id)
@@ -0,0 +1,237 @@
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from config import INVOICE_DEDUP_DB, INVOICE_CLAIM_SECONDS, INVOICE_CLAIM_WAIT, PDF_URL_EXPIRY
+
+# Presigned URLs closer than this to expiry are re-signed instead of reused
+URL_REFRESH_MARGIN = 3600
+# How often a waiting sender checks whether another process released its claim
+CLAIM_POLL_SECONDS = 0.5
+
+
+class InvoiceClaimed(Exception):
+    """Raised when another worker is still sending the same invoice after INVOICE_CLAIM_WAIT seconds."""
+
+
+def canonical_invoice(invoice_data: dict) -> dict:
+    """
+    The parts of an invoice that make it "the same invoice": who is billed,
+    what for, how much, and on which day. Draft IDs, final numbers and UI
+    fields are left out so a retried approval maps to the same entry.
+    """
+    account = invoice_data.get("account") or {}
+    contact = invoice_data.get("contact") or {}
+    return {
+        "account": {"id": account.get("id"), "name": account.get("name")} if isinstance(account, dict) else {"name": account},
+        "contact": {"id": contact.get("id"), "email": contact.get("email")} if isinstance(contact, dict) else {"name": contact},
+        "line_items": [
+            {key: item.get(key) for key in ("product", "code", "qty", "unit_price", "total")}
+            for item in invoice_data.get("line_items") or []
+        ],
+        "total_amount": invoice_data.get("total_amount"),
+        "currency": invoice_data.get("currency"),
+        "issue_date": invoice_data.get("issue_date") or datetime.now().strftime("%Y-%m-%d"),
+    }
+
+
+def invoice_content_hash(invoice_data: dict) -> str:
+    payload = json.dumps(canonical_invoice(invoice_data), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class InvoiceDedupIndex:
+    """
+    Index of content hash -> rendered invoice (number, S3 key, presigned
+    URL, notification state), so a retried send reuses the PDF that was
+    already uploaded and does not notify the customer twice.
+
+    The index is a SQLite file shared by every process on the host (uvicorn
+    workers, run_job_worker.py). A sender claims the invoice's row before
+    rendering; the claim names its owner and expires after claim_seconds,
+    so a crashed sender does not block the invoice for good. A row whose
+    invoice_number is still empty is a claim, not a sent invoice.
+    """
+
+    def __init__(self, path=INVOICE_DEDUP_DB, claim_seconds=INVOICE_CLAIM_SECONDS, claim_wait=INVOICE_CLAIM_WAIT):
+        self.claim_seconds = claim_seconds
+        self.claim_wait = claim_wait
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        if path != ':memory:':
+            self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS rendered_invoices ("
+            "content_hash TEXT PRIMARY KEY, invoice_number TEXT NOT NULL, s3_key TEXT NOT NULL, "
+            "pdf_url TEXT, url_expires_at REAL, message_id TEXT, notified_at TEXT, created_at TEXT NOT NULL, "
+            "claimed_by TEXT, claim_expires_at REAL)"
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(rendered_invoices)")}
+        for column, kind in (("claimed_by", "TEXT"), ("claim_expires_at", "REAL")):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE rendered_invoices ADD COLUMN {column} {kind}")
+        self._lock = threading.Lock()
+        self._hash_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.claim_waits = 0
+        self.claims_taken_over = 0
+
+    @contextmanager
+    def claim(self, content_hash):
+        """
+        Serialize work on one invoice across threads and processes, so a
+        concurrent send waits for the first one instead of duplicating it.
+        Re-entrant within a thread. Raises InvoiceClaimed when the other
+        sender holds the claim for longer than claim_wait seconds.
+        """
+        with self._lock:
+            entry = self._hash_locks.setdefault(content_hash, [threading.RLock(), 0, None])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                # Only the outermost claim in this process touches the shared row
+                outermost = entry[2] is None
+                if outermost:
+                    entry[2] = self._claim_row(content_hash)
+                try:
+                    yield
+                finally:
+                    if outermost:
+                        self._release_row(content_hash, entry[2])
+                        entry[2] = None
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    self._hash_locks.pop(content_hash, None)
+
+    def _claim_row(self, content_hash):
+        owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        deadline = time.time() + self.claim_wait
+        waited = False
+        while True:
+            holder = self._try_claim(content_hash, owner)
+            if holder is None:
+                return owner
+            if not waited:
+                waited = True
+                with self._lock:
+                    self.claim_waits += 1
+            if time.time() >= deadline:
+                raise InvoiceClaimed(f"Invoice {content_hash[:12]} is being sent by {holder}")
+            time.sleep(CLAIM_POLL_SECONDS)
+
+    def _try_claim(self, content_hash, owner):
+        """Take the invoice's row for `owner`. Returns None on success, else the live claim's owner"""
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT claimed_by, claim_expires_at FROM rendered_invoices WHERE content_hash = ?",
+                    (content_hash,)
+                ).fetchone()
+                if row is None:
+                    self.conn.execute(
+                        "INSERT INTO rendered_invoices (content_hash, invoice_number, s3_key, created_at, "
+                        "claimed_by, claim_expires_at) VALUES (?, '', '', ?, ?, ?)",
+                        (content_hash, datetime.now().isoformat(), owner, now + self.claim_seconds)
+                    )
+                else:
+                    holder, expires_at = row
+                    if holder is not None and expires_at is not None and expires_at > now:
+                        self.conn.execute("ROLLBACK")
+                        return holder
+                    if holder is not None:
+                        self.claims_taken_over += 1
+                        print(f"Invoice {content_hash[:12]} claim of {holder} expired, taking it over")
+                    self.conn.execute(
+                        "UPDATE rendered_invoices SET claimed_by = ?, claim_expires_at = ? WHERE content_hash = ?",
+                        (owner, now + self.claim_seconds, content_hash)
+                    )
+                self.conn.execute("COMMIT")
+                return None
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _release_row(self, content_hash, owner):
+        with self._lock:
+            # A claim that never led to an upload leaves no row behind
+            self.conn.execute(
+                "DELETE FROM rendered_invoices WHERE content_hash = ? AND claimed_by = ? AND invoice_number = ''",
+                (content_hash, owner)
+            )
+            self.conn.execute(
+                "UPDATE rendered_invoices SET claimed_by = NULL, claim_expires_at = NULL "
+                "WHERE content_hash = ? AND claimed_by = ?", (content_hash, owner)
+            )
+
+    def get(self, content_hash):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT invoice_number, s3_key, pdf_url, url_expires_at, message_id, notified_at "
+                "FROM rendered_invoices WHERE content_hash = ? AND invoice_number != ''", (content_hash,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        invoice_number, s3_key, pdf_url, url_expires_at, message_id, notified_at = row
+        return {
+            "invoice_number": invoice_number,
+            "s3_key": s3_key,
+            "pdf_url": pdf_url if url_expires_at and url_expires_at - URL_REFRESH_MARGIN > time.time() else None,
+            "message_id": message_id,
+            "notified_at": notified_at,
+        }
+
+    def record_upload(self, content_hash, invoice_number, s3_key, pdf_url, expires_in=PDF_URL_EXPIRY):
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO rendered_invoices (content_hash, invoice_number, s3_key, pdf_url, url_expires_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(content_hash) DO UPDATE SET "
+                "invoice_number = excluded.invoice_number, s3_key = excluded.s3_key, "
+                "pdf_url = excluded.pdf_url, url_expires_at = excluded.url_expires_at",
+                (content_hash, invoice_number, s3_key, pdf_url, time.time() + expires_in, datetime.now().isoformat())
+            )
+
+    def update_url(self, content_hash, pdf_url, expires_in=PDF_URL_EXPIRY):
+        with self._lock:
+            self.conn.execute(
+                "UPDATE rendered_invoices SET pdf_url = ?, url_expires_at = ? WHERE content_hash = ?",
+                (pdf_url, time.time() + expires_in, content_hash)
+            )
+
+    def mark_notified(self, content_hash, message_id=None):
+        with self._lock:
+            self.conn.execute(
+                "UPDATE rendered_invoices SET message_id = ?, notified_at = ? WHERE content_hash = ?",
+                (message_id, datetime.now().isoformat(), content_hash)
+            )
+
+    def metrics(self) -> dict:
+        with self._lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM rendered_invoices WHERE invoice_number != ''").fetchone()[0]
+            claimed = self.conn.execute(
+                "SELECT COUNT(*) FROM rendered_invoices WHERE claim_expires_at > ?", (time.time(),)
+            ).fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "claimed": claimed,
+                "claim_waits": self.claim_waits,
+                "claims_taken_over": self.claims_taken_over,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+invoice_dedup = InvoiceDedupIndex()
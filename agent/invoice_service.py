@@ -0,0 +1,229 @@
+"""
+Invoice document steps shared by the chat tools and the batch pipeline:
+preview from Salesforce data, final numbering and HTML, PDF upload and the
+email notification. Nothing here calls a model.
+"""
+import uuid
+from datetime import datetime, timedelta
+from aws_clients import aws_clients
+from config import SNS_TOPIC_ARN
+from invoice_dedup import invoice_dedup, invoice_content_hash
+from job_queue import job_queue
+from pdf_renderer import pdf_renderer
+from pdf_uploader import pdf_uploader
+from template_cache import template_cache
+
+
+class InvoiceDataError(Exception):
+    """Raised when Salesforce data is not enough to build an invoice."""
+
+
+class InvoiceSendError(Exception):
+    """Raised when a final invoice could not be rendered, converted to PDF or uploaded."""
+
+
+def normalize_products(sf_data: dict) -> dict:
+    """Ensure all line items are under the "products" key"""
+    if "opportunity" in sf_data and "line_items" in sf_data["opportunity"]:
+        if "products" not in sf_data:
+            sf_data["products"] = sf_data["opportunity"]["line_items"]
+    return sf_data
+
+
+def build_invoice_preview(sf_data: dict) -> dict:
+    """Draft invoice (type "invoice_preview") from a salesforceAgent-shaped response"""
+    account = sf_data.get("account", {})
+    contact = sf_data.get("contact", {})
+    opportunity = sf_data.get("opportunity", {})
+
+    # Build line items from products (priority: top-level products → product → opportunity.line_items)
+    line_items = []
+    total_amount = 0
+
+    if sf_data.get("products"):
+        line_items = [
+            {
+                "product": item.get("name", "Product"),
+                "code": item.get("code", "N/A"),
+                "qty": item.get("quantity", 1),
+                "unit_price": item.get("unit_price", 0),
+                "total": item.get("total_price", 0)
+            }
+            for item in sf_data["products"]
+        ]
+        total_amount = sum(item["total"] for item in line_items)
+
+    elif sf_data.get("product"):
+        product = sf_data["product"]
+        line_items = [{
+            "product": product.get("name", "Product"),
+            "code": product.get("code", "N/A"),
+            "qty": product.get("quantity", 1),
+            "unit_price": product.get("unit_price", 0),
+            "total": product.get("total_price", 0)
+        }]
+        total_amount = line_items[0]["total"]
+
+    elif opportunity.get("line_items"):
+        line_items = [
+            {
+                "product": item.get("product_name", "Product"),
+                "code": item.get("product_code", "N/A"),
+                "qty": item.get("quantity", 1),
+                "unit_price": item.get("unit_price", 0),
+                "total": item.get("total_price", 0)
+            }
+            for item in opportunity["line_items"]
+        ]
+        total_amount = sum(item["total"] for item in line_items)
+
+    else:
+        raise InvoiceDataError("No product data was found in Salesforce response.")
+
+    # Dates & metadata
+    invoice_id = f"DRAFT-{datetime.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:6]}"
+    issue_date = datetime.now().strftime("%Y-%m-%d")
+    due_date = (datetime.now() + timedelta(days=14)).strftime("%Y-%m-%d")
+
+    return {
+        "type": "invoice_preview",
+        "invoice_id": invoice_id,
+        "status": "Draft",
+        "issue_date": issue_date,
+        "due_date": due_date,
+        "account": account,
+        "contact": contact,
+        "line_items": line_items,
+        "total_amount": total_amount,
+        "currency": "USD",
+        "actions": ["✓ Approve & Send Invoice PDF to Email"]
+    }
+
+
+def finalize_invoice(invoice_data: dict, invoice_number: str = None) -> str:
+    """Assign the final invoice number (INV-<date>-<uuid> unless given) and render the HTML"""
+    if invoice_number is None:
+        today_str = datetime.now().strftime("%Y%m%d")
+        unique_suffix = str(uuid.uuid4())[:8]
+        invoice_number = f"INV-{today_str}-{unique_suffix}"
+    invoice_data["invoice_number"] = invoice_number
+    invoice_data["invoice_id"] = invoice_number
+    return template_cache.render_invoice(invoice_data)
+
+
+def upload_invoice_pdf(invoice_number: str, pdf_bytes: bytes, content_hash: str = None) -> str:
+    """
+    Upload straight to S3 (multipart for large files). Returns a download URL
+    once the object is durable, and records it under content_hash for reuse.
+    """
+    pdf_url = pdf_uploader.upload(invoice_number, pdf_bytes)
+    if content_hash:
+        invoice_dedup.record_upload(content_hash, invoice_number, pdf_uploader.key_for(invoice_number), pdf_url)
+    return pdf_url
+
+
+def find_sent_invoice(content_hash: str):
+    """
+    The earlier upload of an invoice with the same content, with a usable
+    download URL (re-signed if the stored one is close to expiry), or None.
+    """
+    existing = invoice_dedup.get(content_hash)
+    if existing is None:
+        return None
+    if existing["pdf_url"] is None:
+        existing["pdf_url"] = pdf_uploader.presign(existing["s3_key"])
+        invoice_dedup.update_url(content_hash, existing["pdf_url"])
+    return existing
+
+
+def publish_notification(message: str, subject: str = 'Customer Notification') -> str:
+    """Publish to the notification topic. Returns the SNS message ID."""
+    response = aws_clients.client('sns').publish(
+        TopicArn=SNS_TOPIC_ARN,
+        Message=message,
+        Subject=subject
+    )
+    return response['MessageId']
+
+
+def invoice_sent_message(account_name: str, invoice_number: str, pdf_url: str) -> str:
+    return (
+        f"Invoice {invoice_number} has been generated for {account_name}. "
+        f"PDF available at: {pdf_url}"
+    )
+
+
+def send_invoice_document(invoice_data: dict) -> dict:
+    """
+    Number, render, convert and upload an approved invoice (type "invoice_sent").
+    Sending the same invoice content again reuses the uploaded PDF and number.
+    """
+    content_hash = invoice_content_hash(invoice_data)
+    with invoice_dedup.claim(content_hash):
+        existing = find_sent_invoice(content_hash)
+
+        try:
+            html_content = finalize_invoice(invoice_data, existing["invoice_number"] if existing else None)
+            invoice_number = invoice_data["invoice_number"]
+        except Exception as e:
+            raise InvoiceSendError(f"Template fetching/rendering failed: {str(e)}") from e
+
+        if existing:
+            presigned_url = existing["pdf_url"]
+        else:
+            try:
+                pdf_bytes = pdf_renderer.render(html_content)
+            except Exception as e:
+                raise InvoiceSendError(f"PDF generation failed: {str(e)}") from e
+            try:
+                presigned_url = upload_invoice_pdf(invoice_number, pdf_bytes, content_hash)
+            except Exception as e:
+                raise InvoiceSendError(f"S3 upload failed: {str(e)}") from e
+
+    return {
+        "type": "invoice_sent",
+        "invoice_number": invoice_number,
+        "account": invoice_data.get("account", {}).get("name", "Unknown"),
+        "contact": invoice_data.get("contact", {}).get("name", "Unknown"),
+        "pdf_s3_url": presigned_url,
+        "final_html": html_content,
+        "content_hash": content_hash,
+        "deduplicated": bool(existing),
+        "notified_at": existing["notified_at"] if existing else None,
+        "status": "Invoice PDF already uploaded to S3" if existing else "Invoice PDF uploaded to S3"
+    }
+
+
+def approve_and_send_invoice(invoice_data: dict) -> dict:
+    """
+    Send the invoice document and email the customer once (type "invoice_approved_sent").
+    Safe to retry: an invoice that was already uploaded or notified is not done again.
+    """
+    content_hash = invoice_content_hash(invoice_data)
+    with invoice_dedup.claim(content_hash):
+        document = send_invoice_document(invoice_data)
+        account_name = invoice_data.get("account", {}).get("name", "Customer")
+        invoice_number = document["invoice_number"]
+        pdf_url = document["pdf_s3_url"]
+
+        if document["notified_at"]:
+            sns_status = "already_sent"
+            message = f"Invoice {invoice_number} was already sent on {document['notified_at']}; no new email was sent"
+        else:
+            message_id = publish_notification(invoice_sent_message(account_name, invoice_number, pdf_url), "Invoice Generated")
+            invoice_dedup.mark_notified(content_hash, message_id)
+            sns_status = "success"
+            message = f"Invoice {invoice_number} approved, PDF generated, and email notification sent"
+
+    return {
+        "type": "invoice_approved_sent",
+        "invoice_number": invoice_number,
+        "account": account_name,
+        "pdf_url": pdf_url,
+        "sns_status": sns_status,
+        "deduplicated": document["deduplicated"],
+        "message": message
+    }
+
+
+job_queue.register("approve_and_send_invoice", approve_and_send_invoice)
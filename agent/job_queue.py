@@ -0,0 +1,270 @@
+import json
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from config import (
+    JOB_QUEUE_DB, JOB_MAX_ATTEMPTS, JOB_RETRY_BACKOFF, JOB_RETRY_BACKOFF_MAX, JOB_LEASE_SECONDS,
+    JOB_POLL_SECONDS
+)
+
+FINISHED = ("succeeded", "failed")
+
+
+class UnknownJobKind(Exception):
+    """Raised when a job is enqueued for a kind no handler was registered for."""
+
+
+class JobQueue:
+    """
+    Durable job queue in a local SQLite file, for work that should not hold
+    an agent turn or a request open (PDF, upload, notification chains).
+
+    Jobs survive restarts. A worker leases a job and keeps extending the
+    lease while the handler runs; if the worker dies the lease expires and
+    another worker picks the job up.
+    Failures are retried with exponential backoff up to max_attempts,
+    except for the handler's permanent_errors. Any number of threads and
+    processes (see run_job_worker.py) can work the same file.
+
+    Handlers are registered per kind and take the job payload; whatever
+    they return (JSON-serializable) is stored as the job result. Jobs
+    enqueued with the same ordering_key run one at a time in enqueue order:
+    a job waits while an earlier one with its key is queued or running.
+    """
+
+    def __init__(self, path=JOB_QUEUE_DB, lease_seconds=JOB_LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        if path != ':memory:':
+            self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, session_id TEXT, "
+            "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, max_attempts INTEGER NOT NULL, "
+            "run_at REAL NOT NULL, lease_until REAL, worker TEXT, result TEXT, error TEXT, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, finished_seq INTEGER, ordering_key TEXT)"
+        )
+        if "ordering_key" not in {row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")}:
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN ordering_key TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_ordering_key ON jobs (ordering_key, status)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_run_at ON jobs (status, run_at)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_finished_seq ON jobs (finished_seq)")
+        self._lock = threading.RLock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._workers = []
+        self.handlers = {}
+        self.retried = 0
+
+    def register(self, kind, handler, permanent_errors=(), max_attempts=JOB_MAX_ATTEMPTS):
+        """Run `handler(payload)` for jobs of `kind`; `permanent_errors` fail the job without retrying"""
+        self.handlers[kind] = (handler, tuple(permanent_errors), max_attempts)
+
+    # -- producers -------------------------------------------------------------
+
+    def enqueue(self, kind, payload, session_id=None, delay=0.0, ordering_key=None) -> str:
+        if kind not in self.handlers:
+            raise UnknownJobKind(kind)
+        job_id = f"job-{uuid.uuid4().hex[:16]}"
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO jobs (job_id, kind, payload, session_id, status, max_attempts, run_at, created_at, ordering_key) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload, default=str), session_id, self.handlers[kind][2], now + delay, now,
+                 ordering_key)
+            )
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT job_id, kind, session_id, status, attempts, max_attempts, run_at, result, error, "
+                "created_at, started_at, finished_at, finished_seq FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return self._job(row) if row else None
+
+    def finished_after(self, seq, limit=100) -> list:
+        """Jobs that finished after `seq` (finished_seq), in the order they finished"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT job_id, kind, session_id, status, attempts, max_attempts, run_at, result, error, "
+                "created_at, started_at, finished_at, finished_seq FROM jobs "
+                "WHERE finished_seq > ? ORDER BY finished_seq LIMIT ?", (seq, limit)
+            ).fetchall()
+        return [self._job(row) for row in rows]
+
+    def last_finished_seq(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COALESCE(MAX(finished_seq), 0) FROM jobs").fetchone()[0]
+
+    @staticmethod
+    def _job(row) -> dict:
+        (job_id, kind, session_id, status, attempts, max_attempts, run_at, result, error,
+         created_at, started_at, finished_at, finished_seq) = row
+        return {
+            "job_id": job_id,
+            "kind": kind,
+            "session_id": session_id,
+            "status": status,
+            "attempts": attempts,
+            "max_attempts": max_attempts,
+            "next_attempt_at": run_at if status == "queued" else None,
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+            "finished_seq": finished_seq,
+        }
+
+    # -- workers ---------------------------------------------------------------
+
+    def claim(self, worker):
+        """Lease the next due job (or one whose worker's lease expired). Returns (job_id, kind, payload, attempts) or None"""
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    row = self.conn.execute(
+                        "SELECT job_id, kind, payload, attempts, max_attempts, status FROM jobs "
+                        "WHERE ((status = 'queued' AND run_at <= ?) OR (status = 'running' AND lease_until <= ?)) "
+                        "AND (ordering_key IS NULL OR NOT EXISTS (SELECT 1 FROM jobs AS earlier "
+                        "WHERE earlier.ordering_key = jobs.ordering_key AND earlier.rowid < jobs.rowid "
+                        "AND earlier.status IN ('queued', 'running'))) "
+                        "ORDER BY run_at LIMIT 1", (now, now)
+                    ).fetchone()
+                    if row is None:
+                        self.conn.execute("COMMIT")
+                        return None
+                    job_id, kind, payload, attempts, max_attempts, status = row
+                    if status == "running" and attempts >= max_attempts:
+                        # Its last attempt died with the worker: give up instead of running it again
+                        self._finish(job_id, "failed", error="Worker stopped during the last attempt")
+                        continue
+                    self.conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, worker = ?, "
+                        "started_at = COALESCE(started_at, ?) WHERE job_id = ?",
+                        (now + self.lease_seconds, worker, now, job_id)
+                    )
+                    self.conn.execute("COMMIT")
+                    return job_id, kind, json.loads(payload), attempts + 1
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _finish(self, job_id, status, result=None, error=None, worker=None):
+        # finished_seq is assigned inside the write, so it follows commit order across processes
+        self.conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, lease_until = NULL, finished_at = ?, "
+            "finished_seq = (SELECT COALESCE(MAX(finished_seq), 0) + 1 FROM jobs) "
+            "WHERE job_id = ? AND (? IS NULL OR worker = ?)",
+            (status, json.dumps(result, default=str) if result is not None else None, error, time.time(),
+             job_id, worker, worker)
+        )
+
+    def _keep_leased(self, job_id, worker, done):
+        """Extend the job's lease every third of lease_seconds until `done` is set"""
+        while not done.wait(self.lease_seconds / 3):
+            try:
+                with self._lock:
+                    renewed = self.conn.execute(
+                        "UPDATE jobs SET lease_until = ? WHERE job_id = ? AND worker = ? AND status = 'running'",
+                        (time.time() + self.lease_seconds, job_id, worker)
+                    ).rowcount
+                if not renewed:
+                    print(f"Job {job_id} lease was lost by {worker}")
+                    return
+            except sqlite3.OperationalError as e:
+                print(f"Job {job_id} lease renewal failed: {e}")
+
+    def run_one(self, worker) -> bool:
+        """Claim and run one job. Returns False when nothing was due."""
+        claimed = self.claim(worker)
+        if claimed is None:
+            return False
+        job_id, kind, payload, attempt = claimed
+        handler, permanent_errors, max_attempts = self.handlers.get(kind, (None, (), 0))
+        done = threading.Event()
+        try:
+            if handler is None:
+                raise UnknownJobKind(kind)
+            threading.Thread(target=self._keep_leased, args=(job_id, worker, done), name=f"lease-{job_id[:8]}", daemon=True).start()
+            try:
+                result = handler(payload)
+            finally:
+                done.set()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            with self._lock:
+                if handler is None or isinstance(e, permanent_errors) or attempt >= max_attempts:
+                    self._finish(job_id, "failed", error=error, worker=worker)
+                    print(f"Job {job_id} ({kind}) failed after {attempt} attempt(s): {error}")
+                else:
+                    delay = min(JOB_RETRY_BACKOFF_MAX, JOB_RETRY_BACKOFF * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+                    self.conn.execute(
+                        "UPDATE jobs SET status = 'queued', run_at = ?, error = ?, lease_until = NULL "
+                        "WHERE job_id = ? AND worker = ?",
+                        (time.time() + delay, error, job_id, worker)
+                    )
+                    self.retried += 1
+                    print(f"Job {job_id} ({kind}) attempt {attempt} failed, retrying in {delay:.1f}s: {error}")
+            return True
+        with self._lock:
+            self._finish(job_id, "succeeded", result=result, worker=worker)
+        return True
+
+    def work(self, name=None, poll_seconds=JOB_POLL_SECONDS):
+        """Worker loop: run due jobs until stop() is called"""
+        worker = f"{socket.gethostname()}:{name or threading.current_thread().name}:{uuid.uuid4().hex[:6]}"
+        while not self._stopping.is_set():
+            try:
+                if self.run_one(worker):
+                    continue
+            except sqlite3.OperationalError as e:
+                print(f"Job worker {worker} database error: {e}")
+            self._wakeup.wait(poll_seconds)
+            self._wakeup.clear()
+
+    def start_workers(self, count):
+        """Start `count` worker threads in this process"""
+        for index in range(count):
+            thread = threading.Thread(target=self.work, args=(f"job-worker-{index}",), name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._workers.append(thread)
+
+    def stop(self, timeout=5.0):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._workers:
+            thread.join(timeout)
+        self._workers = []
+
+    def metrics(self) -> dict:
+        with self._lock:
+            counts = dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            due = self.conn.execute(
+                "SELECT COUNT(*), MIN(run_at) FROM jobs WHERE status = 'queued' AND run_at <= ?", (time.time(),)
+            ).fetchone()
+            timings = self.conn.execute(
+                "SELECT AVG(started_at - created_at), AVG(finished_at - started_at) FROM jobs "
+                "WHERE finished_seq > (SELECT COALESCE(MAX(finished_seq), 0) - 1000 FROM jobs)"
+            ).fetchone()
+        return {
+            "counts": counts,
+            "due": due[0],
+            "oldest_due_seconds": round(time.time() - due[1], 3) if due[1] else 0.0,
+            "retried": self.retried,
+            "workers": len(self._workers),
+            "avg_wait_ms": round((timings[0] or 0.0) * 1000, 2),
+            "avg_run_ms": round((timings[1] or 0.0) * 1000, 2),
+        }
+
+
+job_queue = JobQueue()
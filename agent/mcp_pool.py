@@ -0,0 +1,255 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+import anyio
+import httpx
+from strands.tools.mcp import MCPClient
+from strands.types.exceptions import MCPClientInitializationError
+from mcp.client.streamable_http import streamablehttp_client
+from config import (
+    SALESFORCE_ZAPIER_MCP_URL, XERO_MCP_URL, MCP_MAX_IN_FLIGHT, MCP_HEALTH_CHECK_INTERVAL,
+    MCP_RECONNECT_ATTEMPTS, MCP_RECONNECT_BACKOFF, MCP_RECONNECT_BACKOFF_MAX, MCP_ACQUIRE_TIMEOUT
+)
+
+
+class MCPUnavailableError(Exception):
+    """Raised when an MCP server cannot be reached or has no free call slots."""
+
+
+# Errors that mean the session itself is broken, as opposed to a failed tool call
+TRANSPORT_ERRORS = (
+    ConnectionError, TimeoutError, httpx.TransportError, anyio.ClosedResourceError,
+    anyio.BrokenResourceError, anyio.EndOfStream, MCPClientInitializationError
+)
+
+
+def is_transport_error(error) -> bool:
+    """Whether an exception (or what caused it) means the connection to the server broke"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if isinstance(error, TRANSPORT_ERRORS):
+            return True
+        seen.add(id(error))
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class MCPConnection:
+    """
+    A long-lived MCP session to one server.
+    The session is opened on first use, health checked at most every
+    `health_check_interval` seconds and reopened with backoff when it fails.
+
+    Reconnecting swaps in a new client; the old one is closed only once the
+    calls still running on it have finished. `_lock` only guards state and
+    is never held across network calls or backoff sleeps; reconnects are
+    serialized by `_connect_lock`.
+    """
+
+    def __init__(self, name, url, max_in_flight=MCP_MAX_IN_FLIGHT,
+                 health_check_interval=MCP_HEALTH_CHECK_INTERVAL):
+        self.name = name
+        self.url = url
+        self.health_check_interval = health_check_interval
+        self.client = None
+        self.tools = []
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._last_healthy = 0.0
+        self._in_flight = 0
+        # client -> calls running on it; retired clients are closed when theirs reaches zero
+        self._calls = {}
+        self._retired = set()
+        self._reconnects = 0
+        self._failures = 0
+
+    def _close(self, client):
+        try:
+            client.stop(None, None, None)
+        except Exception as e:
+            print(f"MCP {self.name} close error: {e}")
+
+    def _retire(self, client):
+        """Close `client` now if it is idle, otherwise after its last running call"""
+        if client is None:
+            return
+        with self._lock:
+            if self._calls.get(client):
+                self._retired.add(client)
+                return
+        self._close(client)
+
+    def _connect(self):
+        """Open a new client and swap it in. Called with _connect_lock held."""
+        delay = MCP_RECONNECT_BACKOFF
+        last_error = None
+        for attempt in range(1, MCP_RECONNECT_ATTEMPTS + 1):
+            client = None
+            try:
+                client = MCPClient(lambda: streamablehttp_client(self.url))
+                client.start()
+                tools = client.list_tools_sync()
+            except Exception as e:
+                if client is not None:
+                    self._close(client)
+                last_error = e
+                with self._lock:
+                    self._failures += 1
+                print(f"MCP {self.name} connect attempt {attempt} failed: {e}")
+                if attempt < MCP_RECONNECT_ATTEMPTS:
+                    time.sleep(delay + random.uniform(0, delay / 2))
+                    delay = min(delay * 2, MCP_RECONNECT_BACKOFF_MAX)
+                continue
+            with self._lock:
+                old, self.client = self.client, client
+                self.tools = tools
+                self.generation += 1
+                self._last_healthy = time.monotonic()
+            self._retire(old)
+            print(f"MCP {self.name} connected (generation {self.generation})")
+            return
+        with self._lock:
+            old, self.client = self.client, None
+        self._retire(old)
+        raise MCPUnavailableError(f"MCP server {self.name} unavailable: {last_error}")
+
+    def _health_check(self, client):
+        try:
+            tools = client.list_tools_sync()
+        except Exception as e:
+            with self._lock:
+                self._failures += 1
+            print(f"MCP {self.name} health check failed: {e}")
+            return False
+        with self._lock:
+            if self.client is client:
+                self.tools = tools
+                self._last_healthy = time.monotonic()
+        return True
+
+    def _needs_check(self):
+        return self.client is None or time.monotonic() - self._last_healthy > self.health_check_interval
+
+    def ensure_connected(self):
+        if not self._needs_check():
+            return
+        with self._connect_lock:
+            # Another thread may have reconnected or checked while this one waited
+            if not self._needs_check():
+                return
+            if self.client is None:
+                self._connect()
+            elif not self._health_check(self.client):
+                with self._lock:
+                    self._reconnects += 1
+                self._connect()
+
+    def refresh_tools(self):
+        """Re-list the server's tools, which also counts as a health check."""
+        client = self.client
+        if client is None:
+            self.ensure_connected()
+            return self.tools
+        tools = client.list_tools_sync()
+        with self._lock:
+            if self.client is client:
+                self.tools = tools
+                self._last_healthy = time.monotonic()
+        return tools
+
+    def mark_unhealthy(self):
+        """Force a health check before the next call, e.g. after a transport error."""
+        self._last_healthy = 0.0
+
+    @contextmanager
+    def session(self, timeout=MCP_ACQUIRE_TIMEOUT):
+        """Borrow a call slot on this server; yields the connection with a live client."""
+        if not self._slots.acquire(timeout=timeout):
+            raise MCPUnavailableError(f"Too many in-flight calls to MCP server {self.name}")
+        try:
+            self.ensure_connected()
+            with self._lock:
+                client = self.client
+                if client is None:
+                    raise MCPUnavailableError(f"MCP server {self.name} is not connected")
+                self._in_flight += 1
+                self._calls[client] = self._calls.get(client, 0) + 1
+            try:
+                yield self
+            except Exception as e:
+                # Tool and agent errors say nothing about the connection
+                if is_transport_error(e):
+                    self.mark_unhealthy()
+                raise
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                    self._calls[client] -= 1
+                    idle = not self._calls[client]
+                    if idle:
+                        del self._calls[client]
+                    close = idle and client in self._retired
+                    if close:
+                        self._retired.discard(client)
+                if close:
+                    self._close(client)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._connect_lock:
+            with self._lock:
+                client, self.client = self.client, None
+            self._retire(client)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "url": self.url,
+                "connected": self.client is not None,
+                "generation": self.generation,
+                "in_flight": self._in_flight,
+                "retired_clients": len(self._retired),
+                "reconnects": self._reconnects,
+                "failures": self._failures,
+                "seconds_since_healthy": round(time.monotonic() - self._last_healthy, 1) if self._last_healthy else None,
+            }
+
+
+class MCPPool:
+    """Process-wide registry of persistent MCP connections, one per server."""
+
+    def __init__(self):
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, url, **kwargs) -> MCPConnection:
+        with self._lock:
+            if name not in self._connections:
+                self._connections[name] = MCPConnection(name, url, **kwargs)
+            return self._connections[name]
+
+    def get(self, name) -> MCPConnection:
+        return self._connections[name]
+
+    def warm(self, *names):
+        for name in names or list(self._connections):
+            try:
+                self._connections[name].ensure_connected()
+            except MCPUnavailableError as e:
+                print(f"MCP warm-up skipped: {e}")
+
+    def close_all(self):
+        for connection in list(self._connections.values()):
+            connection.close()
+
+    def metrics(self) -> dict:
+        return {name: connection.metrics() for name, connection in self._connections.items()}
+
+
+mcp_pool = MCPPool()
+mcp_pool.register("salesforce", SALESFORCE_ZAPIER_MCP_URL)
+mcp_pool.register("xero", XERO_MCP_URL)
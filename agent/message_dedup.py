@@ -0,0 +1,100 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config import WHATSAPP_DEDUP_TTL, WHATSAPP_DEDUP_MAX_ENTRIES, WHATSAPP_DEDUP_DB
+
+# Expired rows in the shared store are deleted at most this often
+PURGE_INTERVAL = 60.0
+
+
+class MessageDedup:
+    """
+    Remembers webhook message IDs for `ttl` seconds so redelivered messages
+    are handled once.
+
+    Recent IDs are kept in memory as an LRU capped at `max_entries`. With a
+    `path`, IDs are also written to a SQLite file, so they survive restarts
+    and every uvicorn worker on the host agrees on what was already seen;
+    the memory LRU then only saves a database round trip for repeats.
+    """
+
+    def __init__(self, ttl=WHATSAPP_DEDUP_TTL, max_entries=WHATSAPP_DEDUP_MAX_ENTRIES, path=WHATSAPP_DEDUP_DB):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+        self.conn = None
+        if path:
+            self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+            if path != ':memory:':
+                self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS seen_messages (message_id TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+            )
+        self._purged_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def claim(self, message_id) -> bool:
+        """True the first time `message_id` is seen within the TTL, False for a duplicate"""
+        now = time.time()
+        with self._lock:
+            expires_at = self._recent.get(message_id)
+            if expires_at is not None and expires_at > now:
+                self._recent.move_to_end(message_id)
+                self.hits += 1
+                return False
+
+            claimed = True
+            if self.conn is not None:
+                # Inserts a new ID or takes over an expired one; a live row from another worker changes nothing
+                claimed = self.conn.execute(
+                    "INSERT INTO seen_messages (message_id, expires_at) VALUES (?, ?) "
+                    "ON CONFLICT(message_id) DO UPDATE SET expires_at = excluded.expires_at "
+                    "WHERE seen_messages.expires_at <= ?",
+                    (message_id, now + self.ttl, now)
+                ).rowcount == 1
+                if now - self._purged_at > PURGE_INTERVAL:
+                    self._purged_at = now
+                    self.conn.execute("DELETE FROM seen_messages WHERE expires_at <= ?", (now,))
+
+            self._remember(message_id, now + self.ttl)
+            if claimed:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return claimed
+
+    def release(self, message_id):
+        """Forget a claimed ID whose processing could not start, so a redelivery is handled"""
+        with self._lock:
+            self._recent.pop(message_id, None)
+            if self.conn is not None:
+                self.conn.execute("DELETE FROM seen_messages WHERE message_id = ?", (message_id,))
+
+    def _remember(self, message_id, expires_at):
+        self._recent[message_id] = expires_at
+        self._recent.move_to_end(message_id)
+        while len(self._recent) > self.max_entries:
+            self._recent.popitem(last=False)
+            self.evictions += 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            shared = self.conn.execute("SELECT COUNT(*) FROM seen_messages").fetchone()[0] if self.conn is not None else None
+            return {
+                "size": len(self._recent),
+                "max_entries": self.max_entries,
+                "shared_size": shared,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+whatsapp_dedup = MessageDedup()
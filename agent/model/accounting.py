@@ -1,72 +1,443 @@
-import boto3
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import date, datetime, timedelta
 from decimal import Decimal
-import uuid
+import base64
+import json
+import threading
+import time
+from config import PAYMENT_TERMS_DAYS
+from model.repository import (
+    get_invoice_repository, ConflictError,
+    STATUS_INDEX, TYPE_STATUS_INDEX, CUSTOMER_INDEX, DUE_INDEX, TYPE_DUE_INDEX
+)
+
+# Materialized dashboard aggregate (see InvoiceStats)
+DASHBOARD_STATUSES = ('pending', 'processing', 'success', 'fail', 'overdue')
+STATS_FIELDS = {'status', 'amount', 'created_at'}
+STATS_WRITE_ATTEMPTS = 4
+
+# Aging (see InvoiceAging): statuses that still count as owed, and buckets of days past due
+UNPAID_STATUSES = ('pending', 'fail', 'overdue')
+AGING_BUCKETS = (('0-30', 0, 30), ('31-60', 31, 60), ('61-90', 61, 90), ('90+', 91, None))
+# Fields the due date and the aging index keys are derived from
+DUE_FIELDS = {'status', 'invoice_type', 'created_at', 'due_at'}
+# Changes that move a derived (not explicitly set) due date
+DUE_BASIS_FIELDS = {'invoice_type', 'created_at'}
+
+def encode_page_token(last_key):
+    """Opaque pagination token for an API response, None when there are no more pages"""
+    if not last_key:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(last_key, default=str).encode('utf-8')).decode('ascii')
+
+def decode_page_token(token):
+    if not token:
+        return None
+    return json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+
+def stats_delta(old, new):
+    """
+    Aggregate counter changes for an invoice going from `old` to `new`
+    (either may be None): per-status count and amount, and revenue per
+    created_at day for successful invoices.
+    """
+    delta = {}
+    for item, sign in ((old, -1), (new, 1)):
+        if not item:
+            continue
+        status = item.get('status', 'pending')
+        amount = Decimal(str(item.get('amount', 0)))
+        delta[f'count_{status}'] = delta.get(f'count_{status}', 0) + sign
+        delta[f'amount_{status}'] = delta.get(f'amount_{status}', 0) + sign * amount
+        if status == 'success':
+            day = f"revenue_{item.get('created_at', '')[:10]}"
+            delta[day] = delta.get(day, 0) + sign * amount
+    return {key: Decimal(value) for key, value in delta.items() if value != 0}
+
+def payment_terms_days(invoice_type):
+    return PAYMENT_TERMS_DAYS.get(invoice_type, PAYMENT_TERMS_DAYS.get('default', 14))
+
+def with_due_fields(item):
+    """
+    Fill the stored due date fields: due_at (ISO, sortable; created_at plus the
+    type's payment terms unless set), due_day (its date ordinal, so days past
+    due is one subtraction) and the "<invoice_type>#<status>" aging index key.
+    """
+    if not item.get('due_at') and item.get('created_at'):
+        created = datetime.fromisoformat(item['created_at'].replace('Z', '+00:00')).replace(tzinfo=None)
+        item['due_at'] = (created + timedelta(days=payment_terms_days(item.get('invoice_type')))).isoformat()
+    if item.get('due_at'):
+        item['due_day'] = date.fromisoformat(item['due_at'][:10]).toordinal()
+    if item.get('invoice_type') and item.get('status'):
+        item['type_status'] = f"{item['invoice_type']}#{item['status']}"
+    return item
+
+def with_changes(old, changes):
+    """
+    `old` with `changes` applied and the due date fields refreshed. A due_at
+    in the changes is kept as explicit; a derived due_at is recomputed when
+    created_at or invoice_type changes.
+    """
+    item = {**old, **changes}
+    if 'due_at' in changes:
+        item['due_at_explicit'] = bool(changes['due_at'])
+    elif DUE_BASIS_FIELDS.intersection(changes) and not old.get('due_at_explicit'):
+        item.pop('due_at', None)
+        item.pop('due_day', None)
+        item['due_at_explicit'] = False
+    if not item.get('due_at'):
+        item.pop('due_day', None)
+    return with_due_fields(item)
+
+def aging_bucket(overdue_days):
+    """Name of the AGING_BUCKETS range `overdue_days` falls in"""
+    for name, min_days, max_days in AGING_BUCKETS:
+        if overdue_days >= min_days and (max_days is None or overdue_days <= max_days):
+            return name
+    return None
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
 
 class Invoice:
-    def __init__(self):
-        self.dynamodb = boto3.resource('dynamodb', region_name='ap-southeast-5')
-        self.table = self.dynamodb.Table('hackathon-invoice')
+    def __init__(self, repository=None):
+        self.repository = repository or get_invoice_repository()
 
-    def create_invoice(self, invoice_id, customer_name, amount, invoice_type, status='pending'):
-        item = {
+    @staticmethod
+    def new_invoice_item(invoice_id, customer_name, amount, invoice_type, status='pending', created_at=None, **extra):
+        now = datetime.now().isoformat()
+        return with_due_fields({
+            **extra,
             'invoice_id': invoice_id,
             'customer_name': customer_name,
             'amount': Decimal(str(amount)),
             'status': status,
             'invoice_type': invoice_type,
-            'risk_level': 'low',
-            'created_at': datetime.now().isoformat(),
-            'updated_at': datetime.now().isoformat()
-        }
+            'risk_level': extra.get('risk_level', 'low'),
+            'due_at_explicit': bool(extra.get('due_at')),
+            'created_at': created_at or now,
+            'updated_at': now
+        })
+
+    def create_invoice(self, invoice_id, customer_name, amount, invoice_type, status='pending', due_at=None):
+        item = self.new_invoice_item(invoice_id, customer_name, amount, invoice_type, status, due_at=due_at)
 
-        self.table.put_item(Item=item)
+        self._write_with_stats(invoice_id, lambda old: item)
         return invoice_id
     
     def update_invoice(self, invoice_id, **kwargs):
-        update_expr = 'SET '
-        expr_values = {}
-        expr_names = {}
-        
-        for i, (key, value) in enumerate(kwargs.items()):
-            placeholder = f'#key{i}'
-            value_placeholder = f':value{i}'
-            update_expr += f'{placeholder} = {value_placeholder}, '
-            expr_values[value_placeholder] = value if not isinstance(value, float) else Decimal(str(value))
-            expr_names[placeholder] = key
+        changes = {key: value if not isinstance(value, float) else Decimal(str(value)) for key, value in kwargs.items()}
+        changes['updated_at'] = datetime.now().isoformat()
         
-        update_expr += 'updated_at = :updated_at'
-        expr_values[':updated_at'] = datetime.now().isoformat()
-        
-        self.table.update_item(
-            Key={'invoice_id': invoice_id},
-            UpdateExpression=update_expr,
-            ExpressionAttributeValues=expr_values,
-            ExpressionAttributeNames=expr_names
-        )
+        # Only changes to counted or due date fields need the read-modify-write path
+        if not STATS_FIELDS.intersection(kwargs) and not DUE_FIELDS.intersection(kwargs):
+            self.repository.update_fields(invoice_id, changes)
+            return
         
+        self._write_with_stats(invoice_id, lambda old: with_changes(old or {'invoice_id': invoice_id}, changes))
 
     def update_invoice_status(self, invoice_id, status):
-        update_expr = 'SET #status = :status, updated_at = :updated_at'
-        expr_values = {
-            ':status': status,
-            ':updated_at': datetime.now().isoformat()
-        }
-        
-        self.table.update_item(
-            Key={'invoice_id': invoice_id},
-            UpdateExpression=update_expr,
-            ExpressionAttributeValues=expr_values,
-            ExpressionAttributeNames={'#status': 'status'}
-        )
+        self.update_invoice(invoice_id, status=status)
+
+    def claim_reminder(self, invoice_id, reminded_at, reminded_after, attempts=STATS_WRITE_ATTEMPTS):
+        """
+        Set last_reminded_at to `reminded_at` unless the invoice was already
+        reminded after `reminded_after` (ISO timestamps). The write is
+        conditional, so of several campaigns racing for an invoice only one
+        gets True.
+        """
+        for attempt in range(attempts):
+            old = self.repository.get(invoice_id, consistent=True)
+            if old is None or old.get('last_reminded_at', '') > reminded_after:
+                return False
+            new = {**old, 'last_reminded_at': reminded_at, 'updated_at': datetime.now().isoformat()}
+            try:
+                self.repository.write(new, old, {})
+                return True
+            except ConflictError:
+                if attempt == attempts - 1:
+                    raise
+                time.sleep(0.05 * 2 ** attempt)
+
+    def _write_with_stats(self, invoice_id, build, attempts=STATS_WRITE_ATTEMPTS):
+        """
+        Apply one invoice write and the matching stats aggregate change
+        atomically. `build(old_item)` returns the new item. The write is
+        conditioned on the row still being the version that was read, so a
+        concurrent change leads to a re-read and retry instead of double counting.
+        """
+        for attempt in range(attempts):
+            old = self.repository.get(invoice_id, consistent=True)
+            new = build(old)
+            try:
+                self.repository.write(new, old, stats_delta(old, new))
+                return new
+            except ConflictError:
+                if attempt == attempts - 1:
+                    raise
+                time.sleep(0.05 * 2 ** attempt)
+
+    def create_invoices_bulk(self, invoices, parallel_segments=1, progress=None):
+        """
+        Create many invoices in batches. `invoices` is any iterable of dicts
+        with the create_invoice fields (plus optional created_at and extra
+        attributes) and is consumed lazily, so it can stream from a file.
+        Rows that cannot be turned into an invoice (missing columns, CSV
+        cells without a header, bad amounts) are reported as failed like
+        write failures; other extra columns are stored as attributes.
+        Returns a report with counts and items/sec.
+        """
+        failed = []
+
+        def items():
+            for number, invoice in enumerate(invoices, 1):
+                try:
+                    item = self.new_invoice_item(**invoice)
+                    if not item['invoice_id']:
+                        raise ValueError('invoice_id is empty')
+                except Exception as e:
+                    invoice_id = invoice.get('invoice_id') if isinstance(invoice, dict) else None
+                    print(f"Invalid invoice row {number}: {type(e).__name__}: {e}")
+                    failed.append(invoice_id or f'row {number}')
+                    continue
+                yield item
+        return self._bulk_write(items(), lambda chunk, old: chunk, parallel_segments, progress, failed)
+
+    def update_invoices_bulk(self, updates, parallel_segments=1, progress=None):
+        """
+        Apply field updates ({'invoice_id': ..., field: value, ...}) in bulk.
+        Current rows are batch read, merged and written back; unknown invoice
+        IDs and rows without an invoice_id or with a bad amount are reported
+        as failed. Unlike update_invoice this is not guarded against
+        concurrent single writes.
+        """
+        failed = []
+
+        def items():
+            for number, update in enumerate(updates, 1):
+                try:
+                    if not update.get('invoice_id'):
+                        raise ValueError('invoice_id is missing')
+                    changes = {key: Decimal(str(value)) if isinstance(value, float) or key == 'amount' else value
+                               for key, value in update.items()}
+                except Exception as e:
+                    invoice_id = update.get('invoice_id') if isinstance(update, dict) else None
+                    print(f"Invalid update row {number}: {type(e).__name__}: {e}")
+                    failed.append(invoice_id or f'row {number}')
+                    continue
+                yield changes
+
+        def merge(chunk, old):
+            merged = []
+            now = datetime.now().isoformat()
+            for changes in chunk:
+                current = old.get(changes['invoice_id'])
+                if current is None:
+                    continue
+                merged.append(with_changes(current, {**changes, 'updated_at': now}))
+            return merged
+        return self._bulk_write(items(), merge, parallel_segments, progress, failed)
+
+    def _bulk_write(self, items, merge, parallel_segments, progress, failed=None):
+        started = time.perf_counter()
+        # `failed` may be shared with the item generator, which reports rows it could not build
+        report = {'written': 0, 'failed': failed if failed is not None else [], 'retries': 0}
+        lock = threading.Lock()
+
+        def write_chunk(chunk):
+            try:
+                old = self.repository.batch_get([item['invoice_id'] for item in chunk])
+                # Batch writes reject duplicate keys in one call; the last row for an ID wins
+                rows = list({row['invoice_id']: row for row in merge(chunk, old)}.values())
+                missing = [item['invoice_id'] for item in chunk if item['invoice_id'] not in {row['invoice_id'] for row in rows}]
+                retries = self.repository.batch_put(rows)
+                delta = {}
+                for row in rows:
+                    for attribute, value in stats_delta(old.get(row['invoice_id']), row).items():
+                        delta[attribute] = delta.get(attribute, 0) + value
+                self.repository.add_stats({key: value for key, value in delta.items() if value != 0})
+                with lock:
+                    report['written'] += len(rows)
+                    report['retries'] += retries
+                    report['failed'].extend(missing)
+            except Exception as e:
+                print(f"Bulk chunk failed: {e}")
+                with lock:
+                    report['failed'].extend(item.get('invoice_id') for item in chunk)
+            if progress:
+                progress(report['written'], len(report['failed']))
+
+        with ThreadPoolExecutor(max_workers=max(1, parallel_segments)) as executor:
+            pending = set()
+            for chunk in chunked(items, self.repository.batch_size):
+                pending.add(executor.submit(write_chunk, chunk))
+                # Keep memory bounded when streaming large inputs
+                if len(pending) >= parallel_segments * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            wait(pending)
+
+        seconds = time.perf_counter() - started
+        report['seconds'] = round(seconds, 3)
+        report['items_per_second'] = round(report['written'] / seconds, 1) if seconds else 0.0
+        return report
 
     def get_invoice(self, invoice_id):
-        response = self.table.get_item(Key={'invoice_id': invoice_id})
-        return response.get('Item')
+        return self.repository.get(invoice_id)
+
+    def query_by_status(self, status, created_from=None, created_to=None, limit=None, start_key=None, descending=False):
+        """Invoices with one status, optionally within a created_at range. Returns (items, next_start_key)."""
+        return self.repository.query(STATUS_INDEX, status, created_from, created_to,
+                                     limit=limit, start_key=start_key, descending=descending)
+
+    def query_by_type_and_status(self, invoice_type, status, limit=None, start_key=None):
+        return self.repository.query(TYPE_STATUS_INDEX, invoice_type, status, status,
+                                     limit=limit, start_key=start_key)
+
+    def query_by_customer(self, customer_name, limit=None, start_key=None, descending=True):
+        return self.repository.query(CUSTOMER_INDEX, customer_name,
+                                     limit=limit, start_key=start_key, descending=descending)
 
     def get_invoices_by_customer(self, customer_name):
-        response = self.table.scan(
-            FilterExpression='customer_name = :customer_name',
-            ExpressionAttributeValues={':customer_name': customer_name}
+        items, _ = self.query_by_customer(customer_name)
+        return items
+
+    def scan_all(self, page_size=1000):
+        """Yield every invoice; only for maintenance jobs, never request paths"""
+        return self.repository.scan(page_size)
+
+    def ensure_indexes(self):
+        """Create the invoice indexes and stats storage the queries above rely on"""
+        return self.repository.ensure_schema()
+
+    def backfill_due_dates(self, parallel_segments=1, progress=None):
+        """Store due dates on invoices written before they existed, so the aging index sees them"""
+        missing = (
+            {'invoice_id': item['invoice_id']}
+            for item in self.scan_all()
+            if item.get('created_at') and not (item.get('due_at') and item.get('type_status'))
         )
-        return response.get('Items', [])
+        return self.update_invoices_bulk(missing, parallel_segments, progress)
+
+
+class InvoiceStats:
+    """
+    Invoice dashboard counters kept as one aggregate record:
+    count_<status>, amount_<status> and revenue_<YYYY-MM-DD>. Invoice writes
+    update it atomically with the invoice, so the dashboard is a single read.
+    """
+
+    def __init__(self, repository=None):
+        self.repository = repository or get_invoice_repository()
+
+    def get(self):
+        return self.repository.get_stats()
+
+    def dashboard(self, today=None):
+        today = today or datetime.now().date().isoformat()
+        item = self.get()
+        return {
+            'today_revenue': float(item.get(f'revenue_{today}', 0)),
+            'invoice_stats': {
+                status: {
+                    'count': int(item.get(f'count_{status}', 0)),
+                    'amount': float(item.get(f'amount_{status}', 0))
+                }
+                for status in DASHBOARD_STATUSES
+            }
+        }
+
+    def rebuild(self, invoice_model=None, dry_run=False):
+        """
+        Recompute the aggregate from a full scan and overwrite it. Returns the
+        counters that differed as {attribute: (stored, actual)}. Writes that
+        land during the scan can be missed, so run it when traffic is quiet.
+        """
+        totals = {}
+        for item in (invoice_model or Invoice(self.repository)).scan_all():
+            for attribute, value in stats_delta(None, item).items():
+                totals[attribute] = totals.get(attribute, 0) + value
+
+        stored = {key: value for key, value in self.get().items() if key not in ('stat_key', 'rebuilt_at')}
+        differences = {
+            attribute: (stored.get(attribute, 0), totals.get(attribute, 0))
+            for attribute in set(stored) | set(totals)
+            if stored.get(attribute, 0) != totals.get(attribute, 0)
+        }
+
+        if not dry_run:
+            self.repository.put_stats({
+                **{attribute: value for attribute, value in totals.items() if value != 0},
+                'rebuilt_at': datetime.now().isoformat()
+            })
+        return differences
+
+
+class InvoiceAging:
+    """
+    Overdue and aging queries answered from the due date indexes: every
+    question becomes due_at range queries per status, so nothing is scanned
+    and no dates are parsed per row (days past due comes from due_day).
+    """
+
+    def __init__(self, repository=None):
+        self.repository = repository or get_invoice_repository()
+
+    @staticmethod
+    def _partition(status, invoice_type):
+        return (TYPE_DUE_INDEX, f"{invoice_type}#{status}") if invoice_type else (DUE_INDEX, status)
+
+    def overdue(self, status, min_days=1, invoice_type=None, limit=None, start_key=None, now=None):
+        """
+        Invoices with `status` at least `min_days` days past due, most overdue
+        first, each with overdue_days. Days are calendar days, as in buckets(),
+        so every row has overdue_days >= min_days. Returns (items, next_start_key).
+        """
+        now = now or datetime.now()
+        index_name, hash_value = self._partition(status, invoice_type)
+        if min_days:
+            due_before = f"{(now.date() - timedelta(days=min_days)).isoformat()}T23:59:59.999999"
+        else:
+            due_before = now.isoformat()
+        items, next_key = self.repository.query(index_name, hash_value, None, due_before, limit=limit, start_key=start_key)
+        today = now.date().toordinal()
+        for item in items:
+            item['overdue_days'] = today - int(item['due_day'])
+        return items, next_key
+
+    def buckets(self, invoice_type=None, statuses=UNPAID_STATUSES, now=None, page_size=1000):
+        """Count and amount of unpaid invoices per AGING_BUCKETS range of days past due"""
+        now = now or datetime.now()
+        today = now.date()
+        report = {name: {'count': 0, 'amount': Decimal(0)} for name, _, _ in AGING_BUCKETS}
+        for name, min_days, max_days in AGING_BUCKETS:
+            # Whole days: a bucket holds invoices due from (today - max_days) through (today - min_days)
+            due_from = (today - timedelta(days=max_days)).isoformat() if max_days is not None else None
+            due_to = now.isoformat() if min_days == 0 else f"{(today - timedelta(days=min_days)).isoformat()}T23:59:59.999999"
+            for status in statuses:
+                index_name, hash_value = self._partition(status, invoice_type)
+                start_key = None
+                while True:
+                    items, start_key = self.repository.query(index_name, hash_value, due_from, due_to,
+                                                             limit=page_size, start_key=start_key)
+                    report[name]['count'] += len(items)
+                    report[name]['amount'] += sum((Decimal(str(item.get('amount', 0))) for item in items), Decimal(0))
+                    if not start_key:
+                        break
+
+        total_count = sum(bucket['count'] for bucket in report.values())
+        total_amount = sum((bucket['amount'] for bucket in report.values()), Decimal(0))
+        return {
+            'as_of': now.isoformat(),
+            'invoice_type': invoice_type,
+            'statuses': list(statuses),
+            'buckets': {name: {'count': bucket['count'], 'amount': float(bucket['amount'])} for name, bucket in report.items()},
+            'total': {'count': total_count, 'amount': float(total_amount)},
+        }
@@ -0,0 +1,219 @@
+import random
+import time
+from boto3.dynamodb.conditions import Key
+from aws_clients import aws_clients
+from model.repository import InvoiceRepository, ConflictError, INVOICE_INDEXES
+
+INVOICE_TABLE = 'hackathon-invoice'
+STATS_TABLE = 'hackathon-invoice-stats'
+STATS_KEY = 'invoice_stats'
+
+BATCH_MAX_ATTEMPTS = 8
+
+
+def backoff(attempt, base=0.05, cap=5.0):
+    time.sleep(min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.0))
+
+
+def stats_update(delta):
+    """Update entry adding `delta` to the aggregate item, None when nothing changes"""
+    if not delta:
+        return None
+    names = {}
+    values = {}
+    for i, (attribute, value) in enumerate(delta.items()):
+        names[f'#s{i}'] = attribute
+        values[f':s{i}'] = value
+    return {
+        'TableName': STATS_TABLE,
+        'Key': {'stat_key': STATS_KEY},
+        'UpdateExpression': 'ADD ' + ', '.join(f'#s{i} :s{i}' for i in range(len(delta))),
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values
+    }
+
+
+class DynamoDBInvoiceRepository(InvoiceRepository):
+    batch_size = 25
+
+    def __init__(self, dynamodb=None):
+        self.dynamodb = dynamodb or aws_clients.resource('dynamodb')
+        self.client = self.dynamodb.meta.client
+        self.table = self.dynamodb.Table(INVOICE_TABLE)
+        self.stats_table = self.dynamodb.Table(STATS_TABLE)
+
+    def get(self, invoice_id, consistent=False):
+        return self.table.get_item(Key={'invoice_id': invoice_id}, ConsistentRead=consistent).get('Item')
+
+    def batch_get(self, invoice_ids):
+        found = {}
+        request = {INVOICE_TABLE: {'Keys': [{'invoice_id': invoice_id} for invoice_id in dict.fromkeys(invoice_ids)], 'ConsistentRead': True}}
+        for attempt in range(BATCH_MAX_ATTEMPTS):
+            response = self.client.batch_get_item(RequestItems=request)
+            for item in response.get('Responses', {}).get(INVOICE_TABLE, []):
+                found[item['invoice_id']] = item
+            request = response.get('UnprocessedKeys')
+            if not request:
+                return found
+            backoff(attempt)
+        raise RuntimeError(f"{len(request[INVOICE_TABLE]['Keys'])} invoice reads still unprocessed after retries")
+
+    def write(self, item, previous, delta):
+        put = {'TableName': INVOICE_TABLE, 'Item': item}
+        # The write only lands if the row is still the version that was read
+        if previous is None:
+            put['ConditionExpression'] = 'attribute_not_exists(invoice_id)'
+        elif 'updated_at' in previous:
+            put['ConditionExpression'] = '#guard_updated_at = :guard_updated_at'
+            put['ExpressionAttributeNames'] = {'#guard_updated_at': 'updated_at'}
+            put['ExpressionAttributeValues'] = {':guard_updated_at': previous['updated_at']}
+        else:
+            put['ConditionExpression'] = 'attribute_exists(invoice_id) AND attribute_not_exists(updated_at)'
+
+        items = [{'Put': put}]
+        update = stats_update(delta)
+        if update:
+            items.append({'Update': update})
+
+        try:
+            self.client.transact_write_items(TransactItems=items)
+        except self.client.exceptions.TransactionCanceledException as e:
+            raise ConflictError(str(e))
+
+    def update_fields(self, invoice_id, changes):
+        update_expr = 'SET '
+        expr_values = {}
+        expr_names = {}
+
+        for i, (key, value) in enumerate(changes.items()):
+            placeholder = f'#key{i}'
+            value_placeholder = f':value{i}'
+            update_expr += f'{placeholder} = {value_placeholder}, '
+            expr_values[value_placeholder] = value
+            expr_names[placeholder] = key
+
+        self.table.update_item(
+            Key={'invoice_id': invoice_id},
+            UpdateExpression=update_expr.rstrip(', '),
+            ExpressionAttributeValues=expr_values,
+            ExpressionAttributeNames=expr_names
+        )
+
+    def batch_put(self, items):
+        if not items:
+            return 0
+        request = {INVOICE_TABLE: [{'PutRequest': {'Item': item}} for item in items]}
+        for attempt in range(BATCH_MAX_ATTEMPTS):
+            response = self.client.batch_write_item(RequestItems=request)
+            request = response.get('UnprocessedItems')
+            if not request:
+                return attempt
+            backoff(attempt)
+        raise RuntimeError(f"{len(request[INVOICE_TABLE])} invoice writes still unprocessed after retries")
+
+    def query(self, index_name, hash_value, range_from=None, range_to=None,
+              limit=None, start_key=None, descending=False):
+        hash_key, range_key = INVOICE_INDEXES[index_name]
+        condition = Key(hash_key).eq(hash_value)
+        if range_from is not None and range_to is not None:
+            condition = condition & (Key(range_key).eq(range_from) if range_from == range_to else Key(range_key).between(range_from, range_to))
+        elif range_from is not None:
+            condition = condition & Key(range_key).gte(range_from)
+        elif range_to is not None:
+            condition = condition & Key(range_key).lte(range_to)
+
+        kwargs = {
+            'IndexName': index_name,
+            'KeyConditionExpression': condition,
+            'ScanIndexForward': not descending
+        }
+        # Follow LastEvaluatedKey until `limit` items are read (all items when limit is None)
+        items = []
+        while True:
+            if limit is not None:
+                kwargs['Limit'] = limit - len(items)
+            if start_key:
+                kwargs['ExclusiveStartKey'] = start_key
+            response = self.table.query(**kwargs)
+            items.extend(response.get('Items', []))
+            start_key = response.get('LastEvaluatedKey')
+            if not start_key or (limit is not None and len(items) >= limit):
+                return items, start_key
+
+    def scan(self, page_size=1000):
+        kwargs = {'Limit': page_size}
+        while True:
+            response = self.table.scan(**kwargs)
+            for item in response.get('Items', []):
+                yield item
+            if not response.get('LastEvaluatedKey'):
+                return
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def get_stats(self):
+        return self.stats_table.get_item(Key={'stat_key': STATS_KEY}).get('Item', {})
+
+    def add_stats(self, delta):
+        update = stats_update(delta)
+        if update:
+            self.client.update_item(**update)
+
+    def put_stats(self, item):
+        self.stats_table.put_item(Item={**item, 'stat_key': STATS_KEY})
+
+    def ensure_schema(self, read_capacity=5, write_capacity=5):
+        """
+        Create the stats table and any missing invoice GSIs. DynamoDB only
+        allows one index creation at a time, so each one is awaited until ACTIVE.
+        """
+        created = []
+        try:
+            self.client.describe_table(TableName=STATS_TABLE)
+        except self.client.exceptions.ResourceNotFoundException:
+            self.client.create_table(
+                TableName=STATS_TABLE,
+                KeySchema=[{'AttributeName': 'stat_key', 'KeyType': 'HASH'}],
+                AttributeDefinitions=[{'AttributeName': 'stat_key', 'AttributeType': 'S'}],
+                BillingMode='PAY_PER_REQUEST'
+            )
+            self.client.get_waiter('table_exists').wait(TableName=STATS_TABLE)
+            created.append(STATS_TABLE)
+
+        for index_name, (hash_key, range_key) in INVOICE_INDEXES.items():
+            description = self.client.describe_table(TableName=INVOICE_TABLE)['Table']
+            existing = {index['IndexName'] for index in description.get('GlobalSecondaryIndexes', [])}
+            if index_name in existing:
+                continue
+
+            index = {
+                'IndexName': index_name,
+                'KeySchema': [
+                    {'AttributeName': hash_key, 'KeyType': 'HASH'},
+                    {'AttributeName': range_key, 'KeyType': 'RANGE'},
+                ],
+                'Projection': {'ProjectionType': 'ALL'},
+            }
+            if description.get('BillingModeSummary', {}).get('BillingMode') != 'PAY_PER_REQUEST':
+                index['ProvisionedThroughput'] = {'ReadCapacityUnits': read_capacity, 'WriteCapacityUnits': write_capacity}
+
+            print(f"Creating index {index_name}")
+            self.client.update_table(
+                TableName=INVOICE_TABLE,
+                AttributeDefinitions=[
+                    {'AttributeName': hash_key, 'AttributeType': 'S'},
+                    {'AttributeName': range_key, 'AttributeType': 'S'},
+                ],
+                GlobalSecondaryIndexUpdates=[{'Create': index}]
+            )
+            self._wait_for_index(index_name)
+            created.append(index_name)
+        return created
+
+    def _wait_for_index(self, index_name, poll_seconds=10):
+        while True:
+            description = self.client.describe_table(TableName=INVOICE_TABLE)['Table']
+            statuses = {index['IndexName']: index['IndexStatus'] for index in description.get('GlobalSecondaryIndexes', [])}
+            if statuses.get(index_name) == 'ACTIVE':
+                print(f"Index {index_name} is active")
+                return
+            time.sleep(poll_seconds)
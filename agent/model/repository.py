@@ -0,0 +1,106 @@
+import threading
+from abc import ABC, abstractmethod
+from config import INVOICE_STORE, INVOICE_SQLITE_PATH
+
+# Secondary indexes (name -> hash key, range key) every backend has to serve
+STATUS_INDEX = 'status-created_at-index'
+TYPE_STATUS_INDEX = 'invoice_type-status-index'
+CUSTOMER_INDEX = 'customer_name-created_at-index'
+# Aging: unpaid invoices by due date, across types and per "<invoice_type>#<status>"
+DUE_INDEX = 'status-due_at-index'
+TYPE_DUE_INDEX = 'type_status-due_at-index'
+
+INVOICE_INDEXES = {
+    STATUS_INDEX: ('status', 'created_at'),
+    TYPE_STATUS_INDEX: ('invoice_type', 'status'),
+    CUSTOMER_INDEX: ('customer_name', 'created_at'),
+    DUE_INDEX: ('status', 'due_at'),
+    TYPE_DUE_INDEX: ('type_status', 'due_at'),
+}
+
+
+class ConflictError(Exception):
+    """Raised when an invoice changed between being read and being written."""
+
+
+class InvoiceRepository(ABC):
+    """
+    Storage for invoices and the dashboard stats aggregate.
+
+    Semantics follow DynamoDB: items are dicts keyed by invoice_id, numbers
+    are Decimals, index queries only see items that have both index keys,
+    and pagination uses an opaque start key (a dict) returned with each page.
+    """
+
+    # Items per batch_put / batch_get call
+    batch_size = 25
+
+    @abstractmethod
+    def get(self, invoice_id, consistent=False):
+        ...
+
+    @abstractmethod
+    def batch_get(self, invoice_ids) -> dict:
+        """invoice_id -> item for the IDs that exist"""
+
+    @abstractmethod
+    def write(self, item, previous, delta):
+        """
+        Store `item` only if the stored row still matches `previous` (None:
+        must not exist yet), adding `delta` to the stats aggregate in the
+        same atomic step. Raises ConflictError otherwise.
+        """
+
+    @abstractmethod
+    def update_fields(self, invoice_id, changes):
+        """Set fields on an invoice (creating it if missing) without touching stats."""
+
+    @abstractmethod
+    def batch_put(self, items) -> int:
+        """Store up to batch_size items unconditionally. Returns how many retries it took."""
+
+    @abstractmethod
+    def query(self, index_name, hash_value, range_from=None, range_to=None,
+              limit=None, start_key=None, descending=False):
+        """
+        Items of one index partition, optionally within [range_from, range_to]
+        on the index range key, in range key order. Returns (items, next_start_key).
+        """
+
+    @abstractmethod
+    def scan(self, page_size=1000):
+        """Iterate over every invoice; maintenance jobs only."""
+
+    @abstractmethod
+    def get_stats(self) -> dict:
+        ...
+
+    @abstractmethod
+    def add_stats(self, delta):
+        ...
+
+    @abstractmethod
+    def put_stats(self, item):
+        """Replace the whole stats aggregate."""
+
+    @abstractmethod
+    def ensure_schema(self) -> list:
+        """Create missing tables and indexes. Returns what was created."""
+
+
+_repository = None
+_repository_lock = threading.Lock()
+
+
+def get_invoice_repository() -> InvoiceRepository:
+    """Process-wide repository chosen by INVOICE_STORE (dynamodb or sqlite)."""
+    global _repository
+    with _repository_lock:
+        if _repository is None:
+            if INVOICE_STORE == 'sqlite':
+                from model.sqlite_repository import SQLiteInvoiceRepository
+                _repository = SQLiteInvoiceRepository(INVOICE_SQLITE_PATH)
+            else:
+                from model.dynamodb_repository import DynamoDBInvoiceRepository
+                _repository = DynamoDBInvoiceRepository()
+        return _repository
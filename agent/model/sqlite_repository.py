@@ -0,0 +1,225 @@
+import json
+import sqlite3
+import threading
+from decimal import Decimal, InvalidOperation
+from model.repository import InvoiceRepository, ConflictError, INVOICE_INDEXES
+
+# Attributes that get their own column so the index queries can use SQL indexes
+INDEXED_ATTRIBUTES = sorted({attribute for keys in INVOICE_INDEXES.values() for attribute in keys})
+
+
+def encode_item(item):
+    # Decimals are tagged so they come back as Decimals, like DynamoDB numbers
+    return json.dumps(item, default=lambda value: {'__decimal__': str(value)}, separators=(',', ':'))
+
+
+def decode_item(data):
+    return json.loads(data, object_hook=lambda value: Decimal(value['__decimal__']) if '__decimal__' in value else value)
+
+
+def parse_stat(value):
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        return value
+
+
+class SQLiteInvoiceRepository(InvoiceRepository):
+    """
+    Local invoice store with the same query semantics as the DynamoDB table
+    and its GSIs, for development, load tests and benchmarks without AWS.
+    Items are stored as JSON next to one column per index key attribute;
+    pass ':memory:' for a throwaway store.
+    """
+
+    batch_size = 500
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ':memory:':
+            self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        # One connection shared by all threads; transactions are serialized here
+        self.lock = threading.RLock()
+        self.ensure_schema()
+
+    def ensure_schema(self):
+        created = []
+        with self.lock:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS invoices (invoice_id TEXT PRIMARY KEY, data TEXT NOT NULL)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS invoice_stats (attribute TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            columns = {row[1] for row in self.conn.execute('PRAGMA table_info(invoices)')}
+            for attribute in INDEXED_ATTRIBUTES:
+                if attribute not in columns:
+                    self.conn.execute(f'ALTER TABLE invoices ADD COLUMN "{attribute}" TEXT')
+                    self._backfill_column(attribute)
+            existing = {row[1] for row in self.conn.execute('PRAGMA index_list(invoices)')}
+            for index_name, (hash_key, range_key) in INVOICE_INDEXES.items():
+                if index_name not in existing:
+                    self.conn.execute(f'CREATE INDEX "{index_name}" ON invoices ("{hash_key}", "{range_key}", invoice_id)')
+                    created.append(index_name)
+        return created
+
+    def _backfill_column(self, attribute):
+        rows = self.conn.execute('SELECT invoice_id, data FROM invoices').fetchall()
+        self.conn.executemany(
+            f'UPDATE invoices SET "{attribute}" = ? WHERE invoice_id = ?',
+            [(self._column_value(decode_item(data).get(attribute)), invoice_id) for invoice_id, data in rows]
+        )
+
+    @staticmethod
+    def _column_value(value):
+        return None if value is None else str(value)
+
+    def _row(self, item):
+        return (item['invoice_id'], encode_item(item), *(self._column_value(item.get(attribute)) for attribute in INDEXED_ATTRIBUTES))
+
+    def _put_many(self, items):
+        columns = ', '.join(f'"{attribute}"' for attribute in ['invoice_id', 'data', *INDEXED_ATTRIBUTES])
+        placeholders = ', '.join('?' for _ in range(len(INDEXED_ATTRIBUTES) + 2))
+        self.conn.executemany(f'INSERT OR REPLACE INTO invoices ({columns}) VALUES ({placeholders})', [self._row(item) for item in items])
+
+    def _add_stats(self, delta):
+        for attribute, value in delta.items():
+            row = self.conn.execute('SELECT value FROM invoice_stats WHERE attribute = ?', (attribute,)).fetchone()
+            total = (Decimal(row[0]) if row else Decimal(0)) + Decimal(value)
+            self.conn.execute('INSERT OR REPLACE INTO invoice_stats (attribute, value) VALUES (?, ?)', (attribute, str(total)))
+
+    def _fetch(self, invoice_id):
+        row = self.conn.execute('SELECT data FROM invoices WHERE invoice_id = ?', (invoice_id,)).fetchone()
+        return decode_item(row[0]) if row else None
+
+    def get(self, invoice_id, consistent=False):
+        with self.lock:
+            return self._fetch(invoice_id)
+
+    def batch_get(self, invoice_ids):
+        invoice_ids = list(dict.fromkeys(invoice_ids))
+        found = {}
+        with self.lock:
+            # Stay under SQLite's bound parameter limit
+            for start in range(0, len(invoice_ids), 900):
+                chunk = invoice_ids[start:start + 900]
+                placeholders = ', '.join('?' for _ in chunk)
+                for (data,) in self.conn.execute(f'SELECT data FROM invoices WHERE invoice_id IN ({placeholders})', chunk):
+                    item = decode_item(data)
+                    found[item['invoice_id']] = item
+        return found
+
+    def write(self, item, previous, delta):
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                current = self._fetch(item['invoice_id'])
+                if previous is None:
+                    matches = current is None
+                else:
+                    matches = current is not None and current.get('updated_at') == previous.get('updated_at')
+                if not matches:
+                    raise ConflictError(f"Invoice {item['invoice_id']} changed since it was read")
+                self._put_many([item])
+                self._add_stats(delta)
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+
+    def update_fields(self, invoice_id, changes):
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                current = self._fetch(invoice_id) or {'invoice_id': invoice_id}
+                self._put_many([{**current, **changes}])
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+
+    def batch_put(self, items):
+        if not items:
+            return 0
+        with self.lock:
+            self.conn.execute('BEGIN')
+            try:
+                self._put_many(items)
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+        return 0
+
+    def query(self, index_name, hash_value, range_from=None, range_to=None,
+              limit=None, start_key=None, descending=False):
+        hash_key, range_key = INVOICE_INDEXES[index_name]
+        # Like a GSI, only items that have both index keys are visible
+        sql = f'SELECT data, "{range_key}", invoice_id FROM invoices WHERE "{hash_key}" = ? AND "{range_key}" IS NOT NULL'
+        params = [str(hash_value)]
+        if range_from is not None:
+            sql += f' AND "{range_key}" >= ?'
+            params.append(str(range_from))
+        if range_to is not None:
+            sql += f' AND "{range_key}" <= ?'
+            params.append(str(range_to))
+        if start_key:
+            sql += f' AND ("{range_key}", invoice_id) {"<" if descending else ">"} (?, ?)'
+            params.extend([str(start_key[range_key]), start_key['invoice_id']])
+        order = 'DESC' if descending else 'ASC'
+        sql += f' ORDER BY "{range_key}" {order}, invoice_id {order}'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        items = [decode_item(data) for data, _, _ in rows]
+        next_key = None
+        if limit is not None and len(rows) == limit:
+            # Same shape as a DynamoDB LastEvaluatedKey for this index
+            _, last_range, last_id = rows[-1]
+            next_key = {'invoice_id': last_id, hash_key: str(hash_value), range_key: last_range}
+        return items, next_key
+
+    def scan(self, page_size=1000):
+        last_id = ''
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    'SELECT invoice_id, data FROM invoices WHERE invoice_id > ? ORDER BY invoice_id LIMIT ?',
+                    (last_id, page_size)
+                ).fetchall()
+            for _, data in rows:
+                yield decode_item(data)
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1][0]
+
+    def get_stats(self):
+        with self.lock:
+            return {attribute: parse_stat(value) for attribute, value in self.conn.execute('SELECT attribute, value FROM invoice_stats')}
+
+    def add_stats(self, delta):
+        if not delta:
+            return
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._add_stats(delta)
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+
+    def put_stats(self, item):
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                self.conn.execute('DELETE FROM invoice_stats')
+                self.conn.executemany(
+                    'INSERT INTO invoice_stats (attribute, value) VALUES (?, ?)',
+                    [(attribute, str(value)) for attribute, value in item.items() if attribute != 'stat_key']
+                )
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
@@ -0,0 +1,37 @@
+import json
+from invoice_service import publish_notification
+from job_queue import job_queue
+
+
+def payment_key(data: dict) -> str:
+    """Events for the same opportunity / invoice are processed in order; unknown payloads share one lane"""
+    for field in ("opportunity_id", "opportunity", "invoice_id", "invoice_number", "customer"):
+        if isinstance(data.get(field), (str, int)):
+            return str(data[field])
+    return "payments"
+
+
+def process_payment_success(data: dict):
+    # Update Salesforce opportunity status
+    from tools import salesforceAgent
+    sf_query = f"Update opportunity status to 'Closed Won' and description to 'Payment received' for payment: {json.dumps(data)}"
+    sf_result = salesforceAgent(sf_query)
+    print(f"Salesforce update result: {sf_result}")
+    return {"salesforce": str(sf_result)[:500]}
+
+
+def process_payment_fail(data: dict):
+    # Send SNS notification for payment failure
+    message = f"Payment Failed: {json.dumps(data, indent=2)}"
+    message_id = publish_notification(message, "Payment Failure Alert")
+    print("SNS notification sent for payment failure")
+    return {"message_id": message_id}
+
+
+def enqueue_payment_event(kind: str, data: dict) -> str:
+    """Store a payment webhook as a job before it is acknowledged; same-key events run in order"""
+    return job_queue.enqueue(kind, data, ordering_key=f"payment:{payment_key(data)}")
+
+
+job_queue.register("payment_success", process_payment_success)
+job_queue.register("payment_fail", process_payment_fail)
@@ -0,0 +1,192 @@
+import importlib.util
+import multiprocessing
+import os
+import subprocess
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from config import WKHTMLTOPDF_PATH, PDF_ENGINE, PDF_WORKERS, PDF_RENDER_TIMEOUT, PDF_ASSET_CACHE_SIZE
+
+# The invoice template is static HTML/CSS, so wkhtmltopdf runs without JavaScript or a render delay
+WKHTMLTOPDF_ARGS = [
+    '--quiet',
+    '--disable-javascript',
+    '--enable-local-file-access',
+    '--load-error-handling', 'ignore',
+    '--load-media-error-handling', 'ignore',
+    '--encoding', 'utf-8',
+]
+
+# Per worker process: WeasyPrint module and fetched stylesheets/images, loaded once
+# (at most PDF_ASSET_CACHE_SIZE assets, least recently used dropped first)
+_weasyprint = None
+_asset_cache = OrderedDict()
+
+
+class PDFRenderError(Exception):
+    """Raised when an invoice could not be rendered to PDF."""
+
+
+def weasyprint_available() -> bool:
+    return importlib.util.find_spec('weasyprint') is not None
+
+
+def _init_weasyprint_worker():
+    global _weasyprint
+    import weasyprint
+    _weasyprint = weasyprint
+    # The first render pays for font discovery; do it before real work arrives
+    _weasyprint.HTML(string='<p></p>').write_pdf()
+
+
+def _cached_url_fetcher(url, timeout=10):
+    entry = _asset_cache.get(url)
+    if entry is None:
+        entry = _weasyprint.default_url_fetcher(url, timeout=timeout)
+        if 'string' not in entry and 'file_obj' in entry:
+            entry = {**entry, 'string': entry.pop('file_obj').read()}
+        _asset_cache[url] = entry
+        while len(_asset_cache) > PDF_ASSET_CACHE_SIZE:
+            _asset_cache.popitem(last=False)
+    else:
+        _asset_cache.move_to_end(url)
+    return dict(entry)
+
+
+def _render_weasyprint(html):
+    if _weasyprint is None:
+        _init_weasyprint_worker()
+    started = time.perf_counter()
+    pdf_bytes = _weasyprint.HTML(string=html, url_fetcher=_cached_url_fetcher).write_pdf()
+    # The worker's asset cache size rides along so the parent can report it
+    return pdf_bytes, time.perf_counter() - started, (os.getpid(), len(_asset_cache))
+
+
+def _render_wkhtmltopdf(html, timeout=PDF_RENDER_TIMEOUT):
+    started = time.perf_counter()
+    process = subprocess.run(
+        [WKHTMLTOPDF_PATH, *WKHTMLTOPDF_ARGS, '-', '-'],
+        input=html.encode('utf-8'),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=timeout,
+    )
+    # wkhtmltopdf exits 1 when a resource failed to load but the PDF was still written
+    if process.returncode not in (0, 1) or not process.stdout:
+        raise PDFRenderError(f"wkhtmltopdf exited with {process.returncode}: {process.stderr.decode('utf-8', 'replace')[:500]}")
+    return process.stdout, time.perf_counter() - started, None
+
+
+class PDFRenderer:
+    """
+    Renders invoice HTML to PDF on a persistent pool of workers.
+
+    The "weasyprint" engine renders in-process in a pool of long-lived worker
+    processes (WeasyPrint is CPU bound), so fonts and fetched assets are loaded
+    once per worker instead of once per invoice. The "wkhtmltopdf" engine
+    keeps the external binary but caps concurrent processes at the pool size
+    and drops the JavaScript delay. "auto" picks WeasyPrint when it is installed.
+    """
+
+    def __init__(self, engine=PDF_ENGINE, workers=PDF_WORKERS, timeout=PDF_RENDER_TIMEOUT):
+        if engine == 'auto':
+            engine = 'weasyprint' if weasyprint_available() else 'wkhtmltopdf'
+        if engine not in ('weasyprint', 'wkhtmltopdf'):
+            raise ValueError(f"Unknown PDF engine {engine}")
+        self.engine = engine
+        self.workers = workers
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+        self.rendered = 0
+        self.failed = 0
+        self.render_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.recent_ms = deque(maxlen=500)
+        # WeasyPrint worker pid -> assets cached in that worker
+        self.asset_cache_entries = {}
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if self.engine == 'weasyprint':
+                    # spawn, not fork: the API process is multi-threaded by the time the first invoice renders
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn'),
+                        initializer=_init_weasyprint_worker
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='pdf')
+            return self._executor
+
+    def submit(self, html):
+        """Future for one render; the result is the PDF bytes"""
+        submitted = time.perf_counter()
+        if self.engine == 'weasyprint':
+            future = self._get_executor().submit(_render_weasyprint, html)
+        else:
+            future = self._get_executor().submit(_render_wkhtmltopdf, html, self.timeout)
+        result = Future()
+
+        def record(done):
+            try:
+                pdf_bytes, render_seconds, asset_cache = done.result()
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                result.set_exception(e if isinstance(e, PDFRenderError) else PDFRenderError(str(e)))
+                return
+            with self._lock:
+                self.rendered += 1
+                self.render_seconds += render_seconds
+                self.wait_seconds += max(0.0, time.perf_counter() - submitted - render_seconds)
+                self.recent_ms.append(render_seconds * 1000)
+                if asset_cache:
+                    pid, entries = asset_cache
+                    self.asset_cache_entries[pid] = entries
+            result.set_result(pdf_bytes)
+
+        future.add_done_callback(record)
+        return result
+
+    def render(self, html) -> bytes:
+        return self.submit(html).result(timeout=self.timeout * 2)
+
+    def render_many(self, htmls) -> list:
+        """Render a batch in parallel; results keep the input order"""
+        futures = [self.submit(html) for html in htmls]
+        return [future.result(timeout=self.timeout * 2) for future in futures]
+
+    def warm(self):
+        """Start the workers (and WeasyPrint's font setup) before the first invoice"""
+        executor = self._get_executor()
+        if self.engine == 'weasyprint':
+            for future in [executor.submit(_render_weasyprint, '<p></p>') for _ in range(self.workers)]:
+                future.result()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+                self.asset_cache_entries.clear()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            recent = sorted(self.recent_ms)
+            return {
+                "engine": self.engine,
+                "workers": self.workers,
+                "rendered": self.rendered,
+                "failed": self.failed,
+                "average_render_ms": round(self.render_seconds / self.rendered * 1000, 3) if self.rendered else 0.0,
+                "average_wait_ms": round(self.wait_seconds / self.rendered * 1000, 3) if self.rendered else 0.0,
+                "p95_render_ms": round(recent[max(0, int(len(recent) * 0.95) - 1)], 3) if recent else 0.0,
+                "asset_cache_entries": sum(self.asset_cache_entries.values()),
+                "asset_cache_max_per_worker": PDF_ASSET_CACHE_SIZE,
+            }
+
+
+pdf_renderer = PDFRenderer()
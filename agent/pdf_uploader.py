@@ -0,0 +1,88 @@
+import io
+import threading
+import time
+from boto3.s3.transfer import TransferConfig
+from aws_clients import aws_clients
+from config import (
+    S3_BUCKET_PDF, PDF_URL_EXPIRY, PDF_MULTIPART_THRESHOLD, PDF_MULTIPART_CHUNKSIZE,
+    PDF_UPLOAD_CONCURRENCY
+)
+
+
+class PDFUploader:
+    """
+    Uploads rendered invoice PDFs straight to S3 with the shared client.
+
+    The renderer's bytes go into the request body as is: no base64, no
+    JSON wrapper, no extra copies. Documents above the multipart threshold
+    are split into parts uploaded in parallel by the transfer manager. The
+    returned presigned GET URL is only handed out once S3 has acknowledged
+    the object, i.e. once it is durable.
+    """
+
+    def __init__(self, bucket=S3_BUCKET_PDF, prefix="invoices/"):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.transfer_config = TransferConfig(
+            multipart_threshold=PDF_MULTIPART_THRESHOLD,
+            multipart_chunksize=PDF_MULTIPART_CHUNKSIZE,
+            max_concurrency=PDF_UPLOAD_CONCURRENCY,
+        )
+        self._lock = threading.Lock()
+        self.uploaded = 0
+        self.multipart = 0
+        self.failed = 0
+        self.bytes = 0
+        self.upload_seconds = 0.0
+
+    def key_for(self, invoice_number):
+        return f"{self.prefix}{invoice_number}.pdf"
+
+    def upload(self, invoice_number, pdf_bytes) -> str:
+        """Upload and return a presigned download URL"""
+        s3 = aws_clients.s3_for_bucket(self.bucket)
+        key = self.key_for(invoice_number)
+        started = time.perf_counter()
+        multipart = len(pdf_bytes) >= PDF_MULTIPART_THRESHOLD
+        try:
+            if multipart:
+                s3.upload_fileobj(
+                    io.BytesIO(pdf_bytes), self.bucket, key,
+                    ExtraArgs={"ContentType": "application/pdf"},
+                    Config=self.transfer_config
+                )
+            else:
+                s3.put_object(Bucket=self.bucket, Key=key, Body=pdf_bytes, ContentType="application/pdf")
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+
+        with self._lock:
+            self.uploaded += 1
+            self.multipart += int(multipart)
+            self.bytes += len(pdf_bytes)
+            self.upload_seconds += time.perf_counter() - started
+        return self.presign(key)
+
+    def presign(self, key) -> str:
+        """Download URL for an uploaded invoice; signed locally, no request to S3"""
+        return aws_clients.s3_for_bucket(self.bucket).generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": key},
+            ExpiresIn=PDF_URL_EXPIRY
+        )
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "uploaded": self.uploaded,
+                "multipart": self.multipart,
+                "failed": self.failed,
+                "megabytes": round(self.bytes / 1e6, 3),
+                "average_upload_ms": round(self.upload_seconds / self.uploaded * 1000, 3) if self.uploaded else 0.0,
+                "megabytes_per_second": round(self.bytes / 1e6 / self.upload_seconds, 3) if self.upload_seconds else 0.0,
+            }
+
+
+pdf_uploader = PDFUploader()
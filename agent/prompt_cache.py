@@ -0,0 +1,105 @@
+import threading
+from collections import deque
+from strands.hooks import HookProvider, HookRegistry, BeforeInvocationEvent, AfterInvocationEvent
+from config import PROMPT_CACHE
+
+USAGE_KEYS = ("inputTokens", "outputTokens", "cacheReadInputTokens", "cacheWriteInputTokens")
+
+
+def model_cache_config() -> dict:
+    """BedrockModel arguments placing cache points after the system prompt and the tool specs"""
+    return {"cache_prompt": PROMPT_CACHE, "cache_tools": PROMPT_CACHE} if PROMPT_CACHE else {}
+
+
+class RoleCacheStats:
+    def __init__(self):
+        self.calls = 0
+        self.hits = 0
+        self.writes = 0
+        self.misses = 0
+        self.input_tokens = 0
+        self.cache_read_tokens = 0
+        self.cache_write_tokens = 0
+
+    def snapshot(self) -> dict:
+        prompt_tokens = self.input_tokens + self.cache_read_tokens + self.cache_write_tokens
+        return {
+            "calls": self.calls,
+            "hits": self.hits,
+            "writes": self.writes,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / self.calls, 3) if self.calls else 0.0,
+            "input_tokens": self.input_tokens,
+            "cache_read_tokens": self.cache_read_tokens,
+            "cache_write_tokens": self.cache_write_tokens,
+            "cached_share": round(self.cache_read_tokens / prompt_tokens, 3) if prompt_tokens else 0.0,
+        }
+
+
+class PromptCacheMetrics:
+    """Prompt cache usage of every agent call, per agent role."""
+
+    def __init__(self, history=200):
+        self._lock = threading.Lock()
+        self.roles = {}
+        self.recent = deque(maxlen=history)
+
+    def record(self, call: dict):
+        with self._lock:
+            stats = self.roles.setdefault(call["role"], RoleCacheStats())
+            stats.calls += 1
+            if call["cacheReadInputTokens"]:
+                stats.hits += 1
+            elif call["cacheWriteInputTokens"]:
+                stats.writes += 1
+            else:
+                stats.misses += 1
+            stats.input_tokens += call["inputTokens"]
+            stats.cache_read_tokens += call["cacheReadInputTokens"]
+            stats.cache_write_tokens += call["cacheWriteInputTokens"]
+            self.recent.append(call)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "cache_point": PROMPT_CACHE,
+                "roles": {role: stats.snapshot() for role, stats in self.roles.items()},
+                "recent_calls": list(self.recent)[-20:],
+            }
+
+
+prompt_cache_metrics = PromptCacheMetrics()
+
+
+class PromptCacheHook(HookProvider):
+    """
+    Records the cache reads and writes Bedrock reports for each call of an
+    agent, from the change in its accumulated usage over the invocation.
+    Use one instance per agent.
+    """
+
+    def __init__(self, role: str):
+        self.role = role
+        self._started = {}
+
+    def register_hooks(self, registry: HookRegistry, **kwargs) -> None:
+        registry.add_callback(BeforeInvocationEvent, self._before)
+        registry.add_callback(AfterInvocationEvent, self._after)
+
+    @staticmethod
+    def _usage(agent) -> dict:
+        usage = agent.event_loop_metrics.accumulated_usage
+        return {key: usage.get(key, 0) for key in USAGE_KEYS}
+
+    def _before(self, event: BeforeInvocationEvent):
+        self._started = self._usage(event.agent)
+
+    def _after(self, event: AfterInvocationEvent):
+        usage = self._usage(event.agent)
+        call = {key: usage[key] - self._started.get(key, 0) for key in USAGE_KEYS}
+        call["role"] = self.role
+        prompt_cache_metrics.record(call)
+        print(
+            f"Prompt cache {self.role}: read {call['cacheReadInputTokens']}, written {call['cacheWriteInputTokens']}, "
+            f"uncached {call['inputTokens']} input tokens"
+        )
@@ -0,0 +1,17 @@
+import argparse
+from model.accounting import InvoiceStats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild or reconcile the invoice dashboard aggregate from the invoice table")
+    parser.add_argument("--dry-run", action="store_true", help="Only report counters that drifted")
+    args = parser.parse_args()
+
+    stats = InvoiceStats()
+    created = stats.repository.ensure_schema()
+    if created:
+        print(f"Created: {created}")
+
+    differences = stats.rebuild(dry_run=args.dry_run)
+    for attribute, (stored, actual) in sorted(differences.items()):
+        print(f"{attribute}: stored {stored}, actual {actual}")
+    print(f"{len(differences)} counters {'differ' if args.dry_run else 'corrected'}")
@@ -0,0 +1,482 @@
+import json
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from aws_clients import aws_clients
+from config import (
+    SNS_TOPIC_ARN, REMINDER_SCHEDULE, REMINDER_MIN_DAYS, REMINDER_INTERVAL_DAYS, REMINDER_ESCALATE_DAYS,
+    REMINDER_RATE_PER_SECOND, REMINDER_MAX_ATTEMPTS, REMINDER_AGENT_CONCURRENCY, REMINDER_HISTORY,
+    REMINDER_LOCK_DB, REMINDER_LOCK_SECONDS
+)
+from model.accounting import Invoice, InvoiceAging, UNPAID_STATUSES, aging_bucket, chunked
+from template_cache import template_cache
+
+# SNS PublishBatch accepts at most 10 entries per call
+SNS_BATCH_SIZE = 10
+# SNS rejects subjects longer than this
+SUBJECT_MAX_LENGTH = 100
+
+
+class RateLimiter:
+    """Token bucket: acquire(n) blocks until n more messages fit under `rate` per second."""
+
+    def __init__(self, rate, burst=SNS_BATCH_SIZE):
+        self.rate = rate
+        self.capacity = max(rate, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, count=1):
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= count:
+                    self.tokens -= count
+                    return
+                delay = (count - self.tokens) / self.rate
+                self.waited += delay
+                time.sleep(delay)
+
+
+class CampaignRunning(Exception):
+    """Raised when another reminder campaign holds the campaign lock."""
+
+
+class CampaignLock:
+    """
+    One running campaign at a time across the processes on this host
+    (uvicorn workers, schedulers, run_reminder_campaign.py), as a row in a
+    SQLite file. The lock expires after `seconds` so a crashed campaign
+    does not block the next one; invoices are also claimed one by one
+    before sending (Invoice.claim_reminder), which keeps campaigns on
+    other hosts from reminding the same customer twice.
+    """
+
+    def __init__(self, path=REMINDER_LOCK_DB, seconds=REMINDER_LOCK_SECONDS):
+        self.seconds = seconds
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        if path != ':memory:':
+            self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS campaign_lock (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+
+    def acquire(self, owner, name="reminders"):
+        """Take (or renew) the lock for `owner`. Returns None on success, else the current holder"""
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT owner, expires_at FROM campaign_lock WHERE name = ?", (name,)).fetchone()
+                if row is not None and row[0] != owner and row[1] > now:
+                    self.conn.execute("ROLLBACK")
+                    return row[0]
+                self.conn.execute(
+                    "INSERT INTO campaign_lock (name, owner, expires_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at",
+                    (name, owner, now + self.seconds)
+                )
+                self.conn.execute("COMMIT")
+                return None
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def release(self, owner, name="reminders"):
+        with self._lock:
+            self.conn.execute("DELETE FROM campaign_lock WHERE name = ? AND owner = ?", (name, owner))
+
+
+campaign_lock = CampaignLock()
+
+
+class ReminderCampaign:
+    """
+    One run of payment reminders for overdue invoices.
+
+    Invoices are selected from the due date index (at least min_days past
+    due, not reminded in the last interval_days) and reminders are rendered
+    from the reminder templates. Only exceptions - high risk customers,
+    invoices escalate_days or more overdue, or a template that fails to
+    render - are drafted by the reminder agent. Messages go out through SNS
+    PublishBatch, 10 per call, under a rate limit; entries SNS reports as
+    failed on its side are retried with backoff.
+
+    A campaign that sends holds campaign_lock while it runs, and claims
+    each invoice (a conditional write of last_reminded_at) before drafting
+    its reminder; invoices another campaign claimed first are skipped, and
+    claims whose reminder was not sent are released.
+    """
+
+    def __init__(self, invoice_type=None, statuses=UNPAID_STATUSES, min_days=REMINDER_MIN_DAYS,
+                 interval_days=REMINDER_INTERVAL_DAYS, escalate_days=REMINDER_ESCALATE_DAYS,
+                 rate=REMINDER_RATE_PER_SECOND, max_attempts=REMINDER_MAX_ATTEMPTS, dry_run=False,
+                 invoice_model=None, aging=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.invoice_type = invoice_type
+        self.statuses = tuple(statuses)
+        self.min_days = min_days
+        self.interval_days = interval_days
+        self.escalate_days = escalate_days
+        self.max_attempts = max_attempts
+        self.dry_run = dry_run
+        self.invoice_model = invoice_model or Invoice()
+        self.aging = aging or InvoiceAging(self.invoice_model.repository)
+        self.limiter = RateLimiter(rate)
+        self.status = "pending"
+        self.error = None
+        self.items = []
+        self.skipped_recent = 0
+        self.skipped_claimed = 0
+        self.publish_calls = 0
+        self.retried = 0
+        self.started_at = None
+        self.finished_at = None
+        self.seconds = 0.0
+
+    # -- selection -------------------------------------------------------------
+
+    def select(self, now, page_size=500):
+        """Overdue invoices to remind, most overdue first per status"""
+        reminded_after = (now - timedelta(days=self.interval_days)).isoformat()
+        for status in self.statuses:
+            start_key = None
+            while True:
+                invoices, start_key = self.aging.overdue(
+                    status, min_days=self.min_days, invoice_type=self.invoice_type,
+                    limit=page_size, start_key=start_key, now=now
+                )
+                for invoice in invoices:
+                    if invoice.get("last_reminded_at", "") > reminded_after:
+                        self.skipped_recent += 1
+                        continue
+                    yield invoice
+                if not start_key:
+                    break
+
+    # -- composing -------------------------------------------------------------
+
+    def is_exception(self, invoice) -> bool:
+        return invoice.get("risk_level") == "high" or invoice["overdue_days"] >= self.escalate_days
+
+    def draft_with_agent(self, invoice) -> tuple:
+        from tools import reminder_agents
+        facts = {key: invoice.get(key) for key in ("invoice_id", "customer_name", "amount", "due_at", "overdue_days", "risk_level", "invoice_type")}
+        query = (
+            "Draft a payment reminder email for this overdue invoice. It has not been paid after earlier "
+            "reminders, so be firm but courteous and ask the customer to pay or contact us about a payment plan. "
+            f"Return only the email body.\n{json.dumps(facts, default=str)}"
+        )
+        with reminder_agents.acquire() as agent:
+            body = str(agent(query)).strip()
+        return f"Urgent: invoice {invoice['invoice_id']} is {invoice['overdue_days']} days overdue", body
+
+    def compose(self, item):
+        invoice = item["invoice"]
+        escalate = self.is_exception(invoice)
+        if not escalate:
+            try:
+                item["subject"], item["message"] = template_cache.render_reminder(invoice, item["bucket"])
+                item["drafted_by"] = "template"
+                return
+            except Exception as e:
+                # The template could not handle this invoice, which makes it an exception case
+                item["template_error"] = str(e)
+        try:
+            item["subject"], item["message"] = self.draft_with_agent(invoice)
+            item["drafted_by"] = "agent"
+            return
+        except Exception as e:
+            item["agent_error"] = str(e)
+        if escalate:
+            # A template reminder still beats no reminder
+            try:
+                item["subject"], item["message"] = template_cache.render_reminder(invoice, item["bucket"])
+                item["drafted_by"] = "template"
+                return
+            except Exception as e:
+                item["template_error"] = str(e)
+        item["status"] = "failed"
+        item["error"] = f"compose: {item.get('template_error') or item['agent_error']}"
+
+    # -- publishing ------------------------------------------------------------
+
+    def publish(self, items, now):
+        sns = aws_clients.client("sns")
+        pending = items
+        for attempt in range(1, self.max_attempts + 1):
+            retry = []
+            for chunk in chunked(pending, SNS_BATCH_SIZE):
+                entries = {f"r{item['index']}": item for item in chunk}
+                self.limiter.acquire(len(chunk))
+                try:
+                    response = sns.publish_batch(
+                        TopicArn=SNS_TOPIC_ARN,
+                        PublishBatchRequestEntries=[
+                            {"Id": entry_id, "Subject": item["subject"][:SUBJECT_MAX_LENGTH], "Message": item["message"]}
+                            for entry_id, item in entries.items()
+                        ]
+                    )
+                except Exception as e:
+                    for item in chunk:
+                        item["error"] = f"publish: {e}"
+                    retry.extend(chunk)
+                    continue
+                finally:
+                    self.publish_calls += 1
+
+                for success in response.get("Successful", []):
+                    item = entries[success["Id"]]
+                    item["status"] = "sent"
+                    item["message_id"] = success["MessageId"]
+                    item["error"] = None
+                    self.mark_reminded(item, now)
+                for failure in response.get("Failed", []):
+                    item = entries[failure["Id"]]
+                    item["error"] = f"{failure.get('Code')}: {failure.get('Message', '')}"
+                    if failure.get("SenderFault"):
+                        # The entry itself is invalid; sending it again would fail the same way
+                        item["status"] = "failed"
+                    else:
+                        retry.append(item)
+
+            pending = retry
+            if not pending:
+                return
+            if attempt < self.max_attempts:
+                self.retried += len(pending)
+                time.sleep(min(30.0, 2 ** attempt) * random.uniform(0.5, 1.0))
+        for item in pending:
+            item["status"] = "failed"
+
+    def mark_reminded(self, item, now):
+        # last_reminded_at was set when the invoice was claimed
+        try:
+            self.invoice_model.update_invoice(item["invoice_id"], last_reminder_message_id=item["message_id"])
+        except Exception as e:
+            print(f"Could not record reminder for {item['invoice_id']}: {e}")
+
+    def claim(self, item, now) -> bool:
+        reminded_after = (now - timedelta(days=self.interval_days)).isoformat()
+        try:
+            claimed = self.invoice_model.claim_reminder(item["invoice_id"], now.isoformat(), reminded_after)
+        except Exception as e:
+            item["status"] = "failed"
+            item["error"] = f"claim: {e}"
+            return False
+        item["claimed"] = claimed
+        if not claimed:
+            item["status"] = "skipped"
+            item["error"] = "reminded by another campaign"
+            self.skipped_claimed += 1
+        return claimed
+
+    def release(self, item):
+        """Give back the claim of an invoice whose reminder was not sent"""
+        try:
+            self.invoice_model.update_invoice(
+                item["invoice_id"], last_reminded_at=item["invoice"].get("last_reminded_at", "")
+            )
+        except Exception as e:
+            print(f"Could not release reminder claim for {item['invoice_id']}: {e}")
+
+    # -- run -------------------------------------------------------------------
+
+    def run(self, now=None) -> dict:
+        now = now or datetime.now()
+        self.started_at = now.isoformat()
+        started = time.perf_counter()
+        if not self.dry_run:
+            holder = campaign_lock.acquire(self.id)
+            if holder is not None:
+                self.status = "skipped"
+                self.error = f"Campaign {holder} is already running"
+                self.finished_at = datetime.now().isoformat()
+                print(f"Reminder campaign {self.id} skipped: {self.error}")
+                return self.report()
+        self.status = "running"
+        try:
+            for invoice in self.select(now):
+                self.items.append({
+                    "index": len(self.items),
+                    "invoice_id": invoice["invoice_id"],
+                    "customer_name": invoice.get("customer_name"),
+                    "amount": float(invoice.get("amount", 0)),
+                    "overdue_days": invoice["overdue_days"],
+                    "bucket": aging_bucket(invoice["overdue_days"]),
+                    "status": "queued",
+                    "drafted_by": None,
+                    "error": None,
+                    "invoice": invoice,
+                })
+
+            claimed = self.items if self.dry_run else [item for item in self.items if self.claim(item, now)]
+
+            # Template reminders render in microseconds; only agent drafts benefit from the pool
+            with ThreadPoolExecutor(max_workers=max(1, REMINDER_AGENT_CONCURRENCY), thread_name_prefix="reminder") as executor:
+                list(executor.map(self.compose, claimed))
+
+            ready = [item for item in claimed if item["status"] == "queued"]
+            if self.dry_run:
+                for item in ready:
+                    item["status"] = "rendered"
+            else:
+                self.publish(ready, now)
+            self.status = "completed"
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+            print(f"Reminder campaign {self.id} failed: {e}")
+        finally:
+            if not self.dry_run:
+                for item in self.items:
+                    if item.get("claimed") and item["status"] != "sent":
+                        self.release(item)
+                campaign_lock.release(self.id)
+        self.seconds = time.perf_counter() - started
+        self.finished_at = datetime.now().isoformat()
+        return self.report()
+
+    def report(self, include_messages=False) -> dict:
+        counts = {}
+        drafted_by = {}
+        for item in self.items:
+            counts[item["status"]] = counts.get(item["status"], 0) + 1
+            if item["drafted_by"]:
+                drafted_by[item["drafted_by"]] = drafted_by.get(item["drafted_by"], 0) + 1
+        hidden = {"invoice"} if include_messages else {"invoice", "message"}
+        return {
+            "campaign_id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "dry_run": self.dry_run,
+            "invoice_type": self.invoice_type,
+            "statuses": list(self.statuses),
+            "min_days": self.min_days,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "seconds": round(self.seconds, 3),
+            "selected": len(self.items),
+            "skipped_recently_reminded": self.skipped_recent,
+            "skipped_claimed_elsewhere": self.skipped_claimed,
+            "counts": counts,
+            "drafted_by": drafted_by,
+            "publish_calls": self.publish_calls,
+            "retried_entries": self.retried,
+            "rate_limit_wait_seconds": round(self.limiter.waited, 3),
+            "items": [{key: value for key, value in item.items() if key not in hidden} for item in self.items],
+        }
+
+
+# Recent campaigns by ID, for the API report endpoint
+_campaigns = OrderedDict()
+_campaigns_lock = threading.Lock()
+
+
+def start_campaign(**options) -> ReminderCampaign:
+    """
+    Run a campaign on a background thread and return it immediately.
+    Raises CampaignRunning when a campaign that sends is already running.
+    """
+    campaign = ReminderCampaign(**options)
+    if not campaign.dry_run:
+        # Taken here so the caller hears about a running campaign; run() renews it under the same owner
+        holder = campaign_lock.acquire(campaign.id)
+        if holder is not None:
+            raise CampaignRunning(f"Campaign {holder} is already running")
+    with _campaigns_lock:
+        _campaigns[campaign.id] = campaign
+        while len(_campaigns) > REMINDER_HISTORY:
+            _campaigns.popitem(last=False)
+    threading.Thread(target=campaign.run, name=f"reminder-campaign-{campaign.id}", daemon=True).start()
+    return campaign
+
+
+def get_campaign(campaign_id):
+    with _campaigns_lock:
+        return _campaigns.get(campaign_id)
+
+
+def recent_campaigns() -> list:
+    with _campaigns_lock:
+        campaigns = list(_campaigns.values())
+    return [
+        {key: value for key, value in campaign.report().items() if key != "items"}
+        for campaign in reversed(campaigns)
+    ]
+
+
+# -- schedule ------------------------------------------------------------------
+
+def cron_field_matches(field, value, low, high) -> bool:
+    for part in field.split(","):
+        spec, _, step = part.partition("/")
+        if spec == "*":
+            start, end = low, high
+        elif "-" in spec:
+            start, end = (int(bound) for bound in spec.split("-", 1))
+        else:
+            start = end = int(spec)
+            if step:
+                end = high
+        if start <= value <= end and (value - start) % int(step or 1) == 0:
+            return True
+    return False
+
+
+def cron_matches(expression, moment) -> bool:
+    """Whether a 5-field cron expression (minute hour day month weekday, Sunday = 0 or 7) fires at `moment`"""
+    minute, hour, day, month, weekday = expression.split()
+    cron_weekday = (moment.weekday() + 1) % 7
+    return (
+        cron_field_matches(minute, moment.minute, 0, 59)
+        and cron_field_matches(hour, moment.hour, 0, 23)
+        and cron_field_matches(day, moment.day, 1, 31)
+        and cron_field_matches(month, moment.month, 1, 12)
+        and (cron_field_matches(weekday, cron_weekday, 0, 7) or (cron_weekday == 0 and cron_field_matches(weekday, 7, 0, 7)))
+    )
+
+
+class ReminderScheduler:
+    """Starts a campaign every minute that matches `schedule` (cron syntax)."""
+
+    def __init__(self, schedule=REMINDER_SCHEDULE, **campaign_options):
+        cron_matches(schedule, datetime.now())  # fail fast on a malformed expression
+        self.schedule = schedule
+        self.campaign_options = campaign_options
+        self._stopping = threading.Event()
+        self._thread = None
+        self.last_campaign_id = None
+
+    def _loop(self):
+        while True:
+            now = datetime.now()
+            next_minute = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+            if self._stopping.wait((next_minute - now).total_seconds()):
+                return
+            if cron_matches(self.schedule, next_minute):
+                try:
+                    campaign = start_campaign(**self.campaign_options)
+                except CampaignRunning as e:
+                    # Every uvicorn worker runs a scheduler; the first one to take the lock sends
+                    print(f"Scheduled reminder campaign skipped: {e}")
+                    continue
+                self.last_campaign_id = campaign.id
+                print(f"Scheduled reminder campaign {campaign.id} started")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="reminder-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
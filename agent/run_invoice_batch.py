@@ -0,0 +1,57 @@
+import argparse
+import json
+from invoice_batch import InvoiceBatch, opportunity_sources, recurring_sources
+
+def parse_concurrency(values):
+    concurrency = {}
+    for value in values or []:
+        stage, workers = value.split("=", 1)
+        concurrency[stage.strip()] = int(workers)
+    return concurrency
+
+def print_event(event):
+    if event["type"] == "batch":
+        print(f"Batch {event['batch_id']} {event['status']}: {json.dumps({k: v for k, v in event.items() if k not in ('seq', 'type', 'batch_id', 'status')})}", flush=True)
+    elif event["status"] != "done":
+        detail = event.get("invoice_number") or event.get("error") or ""
+        print(f"  [{event['index']}] {event['stage']} {event['status']} {detail}", flush=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate, upload and send invoices in bulk without the chat agent")
+    parser.add_argument("--opportunity", action="append", default=[], help="Opportunity ID or name (repeatable)")
+    parser.add_argument("--opportunities-file", help="File with one opportunity ID or name per line")
+    parser.add_argument("--recurring", metavar="STATUS", help="Bill every recurring invoice with this status, e.g. pending")
+    parser.add_argument("--concurrency", action="append", metavar="STAGE=N", help="Workers for a stage, e.g. pdf=8 (repeatable)")
+    parser.add_argument("--no-notify", action="store_true", help="Skip the email notification")
+    parser.add_argument("--dry-run", action="store_true", help="Fetch, render and build PDFs only; nothing is uploaded, sent or recorded")
+    parser.add_argument("--report", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    references = list(args.opportunity)
+    if args.opportunities_file:
+        with open(args.opportunities_file, encoding="utf-8") as handle:
+            references.extend(handle.read().splitlines())
+    sources = opportunity_sources(references)
+    if args.recurring:
+        sources.extend(recurring_sources(args.recurring))
+    if not sources:
+        parser.error("nothing to bill: pass --opportunity, --opportunities-file or --recurring")
+
+    batch = InvoiceBatch(
+        sources,
+        concurrency=parse_concurrency(args.concurrency),
+        notify=not args.no_notify,
+        dry_run=args.dry_run,
+        on_event=print_event
+    )
+    report = batch.run()
+
+    print(f"Counts: {report['counts']}")
+    print(f"Elapsed: {report['seconds']}s, average stage seconds: {report['average_stage_seconds']}")
+    for item in report["items"]:
+        if item["status"] == "failed":
+            print(f"Failed: {json.dumps(item['source'])} - {item['error']}")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2, default=str)
+        print(f"Report written to {args.report}")
@@ -0,0 +1,21 @@
+import argparse
+import signal
+import invoice_service  # registers the invoice job handlers
+import payment_events  # registers the payment webhook handlers
+from job_queue import job_queue
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run background jobs (invoice PDF, upload, email, payment webhooks) outside the API process")
+    parser.add_argument("--threads", type=int, default=2, help="Worker threads in this process")
+    args = parser.parse_args()
+
+    signal.signal(signal.SIGTERM, lambda *_: job_queue.stop())
+    print(f"Working jobs from {job_queue.path} with {args.threads} thread(s); handlers: {', '.join(sorted(job_queue.handlers))}")
+    job_queue.start_workers(args.threads - 1)
+    try:
+        job_queue.work("main")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        job_queue.stop()
+    print(f"Stopped: {job_queue.metrics()['counts']}")
@@ -0,0 +1,36 @@
+import argparse
+import json
+from model.accounting import UNPAID_STATUSES
+from reminder_campaign import ReminderCampaign
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send payment reminders for overdue invoices (e.g. from cron)")
+    parser.add_argument("--type", dest="invoice_type", help="Only invoices of this type, e.g. recurring")
+    parser.add_argument("--status", action="append", help=f"Invoice status to chase (repeatable, default: {', '.join(UNPAID_STATUSES)})")
+    parser.add_argument("--min-days", type=int, help="Only invoices at least this many days past due")
+    parser.add_argument("--dry-run", action="store_true", help="Select and render reminders without sending or recording them")
+    parser.add_argument("--report", help="Write the JSON report, including the messages, to this file")
+    args = parser.parse_args()
+
+    options = {"invoice_type": args.invoice_type, "dry_run": args.dry_run}
+    if args.status:
+        options["statuses"] = args.status
+    if args.min_days is not None:
+        options["min_days"] = args.min_days
+    campaign = ReminderCampaign(**options)
+    report = campaign.run()
+
+    print(f"Campaign {report['campaign_id']} {report['status']} in {report['seconds']}s")
+    if report["status"] == "skipped":
+        print(report["error"])
+    print(f"Selected {report['selected']}, skipped {report['skipped_recently_reminded']} reminded recently, "
+          f"{report['skipped_claimed_elsewhere']} claimed by another campaign")
+    print(f"Counts: {report['counts']}, drafted by: {report['drafted_by']}")
+    print(f"SNS batch calls: {report['publish_calls']}, retried entries: {report['retried_entries']}")
+    for item in report["items"]:
+        if item["status"] == "failed":
+            print(f"Failed: {item['invoice_id']} - {item['error']}")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as handle:
+            json.dump(campaign.report(include_messages=True), handle, indent=2, default=str)
+        print(f"Report written to {args.report}")
@@ -0,0 +1,317 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from config import (
+    SF_CACHE_MAX_ENTRIES, SF_CACHE_TTL_ACCOUNT, SF_CACHE_TTL_CONTACT,
+    SF_CACHE_TTL_OPPORTUNITY, SF_CACHE_TTL_PRODUCTS
+)
+
+# Salesforce record IDs: Account 001, Contact 003, Opportunity 006 (15 or 18 characters)
+SALESFORCE_ID_PATTERN = re.compile(r'\b(00[136][a-zA-Z0-9]{12}(?:[a-zA-Z0-9]{3})?)\b')
+
+WRITE_INTENT_PATTERN = re.compile(r'\b(update|create|delete|remove|close|mark|set|change|insert|upsert)\b', re.IGNORECASE)
+
+# "create an invoice" or "set up a reminder" only read from Salesforce
+LOCAL_OUTPUT_PATTERN = re.compile(r'\b(create|make|set up)\s+(?:an?\s+|the\s+)?(invoice|bill|reminder|email|draft)s?\b', re.IGNORECASE)
+
+INTENT_REQUIREMENTS = [
+    (re.compile(r'\b(invoice|bill|billing)\b', re.IGNORECASE), ("account", "contact", "opportunity", "products")),
+    (re.compile(r'\b(product|products|line items?)\b', re.IGNORECASE), ("opportunity", "products")),
+    (re.compile(r'\b(opportunity|opportunities|deal)\b', re.IGNORECASE), ("opportunity",)),
+    (re.compile(r'\b(contact|contacts|email|phone)\b', re.IGNORECASE), ("contact",)),
+]
+
+
+def normalize_name(value) -> str:
+    return re.sub(r'\s+', ' ', str(value or '')).strip().lower()
+
+
+def is_write_query(query: str) -> bool:
+    return bool(WRITE_INTENT_PATTERN.search(LOCAL_OUTPUT_PATTERN.sub('', query or '')))
+
+
+def required_entities(query: str) -> tuple:
+    """Which entities a cached answer must contain to satisfy this query."""
+    required = {"account"}
+    for pattern, entities in INTENT_REQUIREMENTS:
+        if pattern.search(query):
+            required.update(entities)
+    return tuple(sorted(required))
+
+
+class SalesforceCache:
+    """
+    Normalized cache of Salesforce entities returned by salesforceAgent.
+
+    Accounts, contacts and opportunities are stored once and indexed by
+    both Salesforce ID and normalized name; products are stored per
+    opportunity. A lookup finds the entity a query is about (by ID, or the
+    longest cached name it mentions) and rebuilds the salesforceAgent
+    response shape from the cached pieces, so "show account X" followed by
+    "invoice X" only reaches Salesforce once.
+    """
+
+    def __init__(self, max_entries=SF_CACHE_MAX_ENTRIES, ttls=None):
+        self.max_entries = max_entries
+        self.ttls = ttls or {
+            "account": SF_CACHE_TTL_ACCOUNT,
+            "contact": SF_CACHE_TTL_CONTACT,
+            "opportunity": SF_CACHE_TTL_OPPORTUNITY,
+            "products": SF_CACHE_TTL_PRODUCTS,
+        }
+        # (kind, id) -> (record, expires_at), least recently used first
+        self._records = OrderedDict()
+        # (kind, normalized name) -> id
+        self._names = {}
+        # account id -> contact id / set of opportunity ids, with the reverse
+        # maps used to prune them when the contact or opportunity is dropped
+        self._account_contact = {}
+        self._account_opportunities = {}
+        self._contact_account = {}
+        self._opportunity_account = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # -- storage -----------------------------------------------------------
+
+    def _put(self, kind, record_id, record):
+        key = (kind, record_id)
+        self._records[key] = (record, time.monotonic() + self.ttls[kind])
+        self._records.move_to_end(key)
+        name = record.get("name") if isinstance(record, dict) else None
+        if name:
+            self._names[(kind, normalize_name(name))] = record_id
+        while len(self._records) > self.max_entries:
+            self._drop(*next(iter(self._records)))
+            self.evictions += 1
+
+    def _get(self, kind, record_id):
+        key = (kind, record_id)
+        entry = self._records.get(key)
+        if entry is None:
+            return None
+        record, expires_at = entry
+        if expires_at < time.monotonic():
+            self._drop(kind, record_id)
+            return None
+        self._records.move_to_end(key)
+        return record
+
+    def _drop(self, kind, record_id):
+        entry = self._records.pop((kind, record_id), None)
+        if entry and isinstance(entry[0], dict) and entry[0].get("name"):
+            self._names.pop((kind, normalize_name(entry[0]["name"])), None)
+        # Links only live as long as the record they point to, so they stay within max_entries
+        if kind == "contact":
+            account_id = self._contact_account.pop(record_id, None)
+            if account_id is not None and self._account_contact.get(account_id) == record_id:
+                del self._account_contact[account_id]
+        elif kind == "opportunity":
+            account_id = self._opportunity_account.pop(record_id, None)
+            opportunity_ids = self._account_opportunities.get(account_id)
+            if opportunity_ids is not None:
+                opportunity_ids.discard(record_id)
+                if not opportunity_ids:
+                    del self._account_opportunities[account_id]
+        return entry is not None
+
+    def _link_contact(self, account_id, contact_id):
+        previous = self._account_contact.get(account_id)
+        if previous is not None and previous != contact_id:
+            self._contact_account.pop(previous, None)
+        old_account = self._contact_account.get(contact_id)
+        if old_account is not None and old_account != account_id and self._account_contact.get(old_account) == contact_id:
+            del self._account_contact[old_account]
+        self._account_contact[account_id] = contact_id
+        self._contact_account[contact_id] = account_id
+
+    def _link_opportunity(self, account_id, opportunity_id):
+        old_account = self._opportunity_account.get(opportunity_id)
+        if old_account is not None and old_account != account_id:
+            opportunity_ids = self._account_opportunities.get(old_account, set())
+            opportunity_ids.discard(opportunity_id)
+            if not opportunity_ids:
+                self._account_opportunities.pop(old_account, None)
+        self._account_opportunities.setdefault(account_id, set()).add(opportunity_id)
+        self._opportunity_account[opportunity_id] = account_id
+
+    def store(self, sf_data: dict):
+        """Index the entities of a sanitized salesforceAgent response."""
+        if not isinstance(sf_data, dict) or sf_data.get("error"):
+            return
+
+        account = sf_data.get("account") if isinstance(sf_data.get("account"), dict) else None
+        contact = sf_data.get("contact")
+        if isinstance(contact, list):
+            contact = contact[0] if contact else None
+        opportunity = sf_data.get("opportunity") if isinstance(sf_data.get("opportunity"), dict) else None
+        products = sf_data.get("products")
+        if products is None and opportunity:
+            products = opportunity.get("line_items")
+
+        with self._lock:
+            account_id = (account or {}).get("id") or (opportunity or {}).get("account_id")
+            if not account_id and isinstance(contact, dict):
+                account_id = contact.get("account_id")
+            if account and account.get("id"):
+                self._put("account", account["id"], account)
+            if isinstance(contact, dict) and contact.get("id"):
+                self._put("contact", contact["id"], contact)
+                if account_id and ("contact", contact["id"]) in self._records:
+                    self._link_contact(account_id, contact["id"])
+            if opportunity and opportunity.get("id"):
+                self._put("opportunity", opportunity["id"], opportunity)
+                if account_id and ("opportunity", opportunity["id"]) in self._records:
+                    self._link_opportunity(account_id, opportunity["id"])
+                if isinstance(products, list):
+                    self._put("products", opportunity["id"], products)
+
+    # -- lookup ------------------------------------------------------------
+
+    def _find_anchor(self, query):
+        for record_id in SALESFORCE_ID_PATTERN.findall(query):
+            for kind in ("opportunity", "account"):
+                if (kind, record_id) in self._records:
+                    return kind, record_id
+
+        normalized = normalize_name(query)
+        best = None
+        for (kind, name), record_id in self._names.items():
+            if kind not in ("opportunity", "account") or not name or name not in normalized:
+                continue
+            # Prefer the longest name, and an opportunity over an account of the same name
+            rank = (len(name), kind == "opportunity")
+            if best is None or rank > best[0]:
+                best = (rank, kind, record_id)
+        return (best[1], best[2]) if best else None
+
+    def _assemble(self, kind, record_id):
+        result = {}
+        if kind == "opportunity":
+            opportunity = self._get("opportunity", record_id)
+            if opportunity is None:
+                return None
+            result["opportunity"] = opportunity
+            account_id = opportunity.get("account_id")
+        else:
+            account_id = record_id
+            opportunity_ids = [
+                opportunity_id for opportunity_id in self._account_opportunities.get(account_id, ())
+                if self._get("opportunity", opportunity_id) is not None
+            ]
+            # Only an unambiguous single opportunity can stand in for an account level query
+            if len(opportunity_ids) == 1:
+                result["opportunity"] = self._get("opportunity", opportunity_ids[0])
+
+        if account_id:
+            account = self._get("account", account_id)
+            if account is not None:
+                result["account"] = account
+            contact_id = self._account_contact.get(account_id)
+            contact = self._get("contact", contact_id) if contact_id else None
+            if contact is not None:
+                result["contact"] = contact
+
+        if "opportunity" in result:
+            products = self._get("products", result["opportunity"].get("id"))
+            if products is not None:
+                result["products"] = products
+        return result
+
+    def lookup(self, query: str):
+        """Return a cached salesforceAgent-shaped response for a read query, or None."""
+        if not query or is_write_query(query):
+            return None
+        with self._lock:
+            anchor = self._find_anchor(query)
+            result = self._assemble(*anchor) if anchor else None
+            if result and all(key in result for key in required_entities(query)):
+                self.hits += 1
+                return result
+            self.misses += 1
+            return None
+
+    # -- invalidation ------------------------------------------------------
+
+    def invalidate_opportunity(self, id_or_name) -> bool:
+        with self._lock:
+            record_id = self._names.get(("opportunity", normalize_name(id_or_name)), id_or_name)
+            dropped = self._drop("opportunity", record_id)
+            dropped = self._drop("products", record_id) or dropped
+            if dropped:
+                self.invalidations += 1
+            return dropped
+
+    def invalidate_kind(self, kind):
+        with self._lock:
+            for key in [key for key in self._records if key[0] == kind]:
+                self._drop(*key)
+            self.invalidations += 1
+
+    def invalidate_for_query(self, query: str):
+        """Drop whatever a write query could have changed."""
+        with self._lock:
+            anchor = self._find_anchor(query)
+        if anchor and anchor[0] == "opportunity":
+            self.invalidate_opportunity(anchor[1])
+        elif anchor:
+            with self._lock:
+                for opportunity_id in list(self._account_opportunities.get(anchor[1], ())):
+                    self._drop("opportunity", opportunity_id)
+                    self._drop("products", opportunity_id)
+                self._drop("account", anchor[1])
+                self.invalidations += 1
+        else:
+            self.invalidate_kind("opportunity")
+
+    def invalidate_payment(self, payload):
+        """
+        Drop the opportunity a payment webhook refers to. Every string in the
+        payload is tried as an opportunity ID or name; if none matches, all
+        cached opportunities are dropped since the webhook may use its own IDs.
+        """
+        values = []
+
+        def collect(value):
+            if isinstance(value, dict):
+                for item in value.values():
+                    collect(item)
+            elif isinstance(value, list):
+                for item in value:
+                    collect(item)
+            elif isinstance(value, str):
+                values.append(value)
+
+        collect(payload)
+        if not any([self.invalidate_opportunity(value) for value in values]):
+            self.invalidate_kind("opportunity")
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._names.clear()
+            self._account_contact.clear()
+            self._account_opportunities.clear()
+            self._contact_account.clear()
+            self._opportunity_account.clear()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._records),
+                "max_entries": self.max_entries,
+                "links": len(self._contact_account) + len(self._opportunity_account),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+salesforce_cache = SalesforceCache()
@@ -0,0 +1,320 @@
+import re
+import threading
+from urllib.parse import quote
+import requests
+from config import (
+    SF_DOMAIN, SF_USERNAME, SF_PASSWORD, SF_SECURITY_TOKEN,
+    SF_CLIENT_ID, SF_CLIENT_SECRET, SF_API_VERSION, SF_REQUEST_TIMEOUT
+)
+from salesforce_cache import SALESFORCE_ID_PATTERN, is_write_query
+
+OPPORTUNITY_FIELDS = (
+    "Id, Name, StageName, Amount, CloseDate, AccountId, "
+    "Account.Id, Account.Name, Account.Phone, Account.Industry, "
+    "Account.BillingStreet, Account.BillingCity, Account.BillingState, Account.BillingPostalCode, Account.BillingCountry, "
+    "Pricebook2Id, Pricebook2.Name, "
+    "(SELECT Id, Product2Id, Product2.Name, ProductCode, Description, Quantity, UnitPrice, TotalPrice FROM OpportunityLineItems), "
+    "(SELECT ContactId, Contact.Name, Contact.Email, Contact.Phone, Role, IsPrimary FROM OpportunityContactRoles ORDER BY IsPrimary DESC)"
+)
+
+ACCOUNT_FIELDS = (
+    "Id, Name, Phone, Industry, BillingStreet, BillingCity, BillingState, BillingPostalCode, BillingCountry, "
+    "(SELECT Id, Name, Email, Phone, Title FROM Contacts ORDER BY CreatedDate LIMIT 1), "
+    "(SELECT Id, Name, StageName, Amount, CloseDate, IsClosed FROM Opportunities ORDER BY CloseDate DESC LIMIT 20)"
+)
+
+CONTACT_FIELDS = "Id, Name, Email, Phone, Title, AccountId"
+
+# Name of the record a query is about: "invoice for Acme Cloud Deal", "show account 'Acme'", ...
+NAME_PATTERNS = [
+    re.compile(r'"([^"]{2,120})"'),
+    re.compile(r"'([^']{2,120})'"),
+    re.compile(r'\b(?:opportunity|account|invoice|bill|details|info|information|data)\s+(?:for|of|on|named|called)\s+(.{2,120}?)\s*[.?!]*$', re.IGNORECASE),
+    re.compile(r'\b(?:opportunity|account)\s+(?!for\b|of\b|on\b)(.{2,120}?)\s*[.?!]*$', re.IGNORECASE),
+]
+
+TRAILING_NOISE = re.compile(r'\s+(?:opportunity|account|please|from salesforce|in salesforce)\s*$', re.IGNORECASE)
+LEADING_NOISE = re.compile(r'^(?:the|our|my)\s+', re.IGNORECASE)
+
+
+class SalesforceError(Exception):
+    """Raised when the Salesforce REST API rejects a request."""
+
+
+def soql_literal(value: str) -> str:
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def extract_record_reference(query: str):
+    """Return ('id', value) or ('name', value) for the record a query names, or None when unclear."""
+    ids = set(SALESFORCE_ID_PATTERN.findall(query or ""))
+    if len(ids) == 1:
+        return "id", ids.pop()
+    if ids:
+        return None
+
+    for pattern in NAME_PATTERNS:
+        match = pattern.search(query.strip())
+        if match:
+            name = LEADING_NOISE.sub("", TRAILING_NOISE.sub("", match.group(1).strip()))
+            if name:
+                return "name", name
+    return None
+
+
+class SalesforceClient:
+    """
+    Minimal Salesforce REST client (OAuth password flow) with a reused
+    HTTP session and cached access token, refreshed once on 401.
+    """
+
+    def __init__(self):
+        self.http = requests.Session()
+        self._lock = threading.Lock()
+        self._access_token = None
+        self._instance_url = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(SF_USERNAME and SF_PASSWORD and SF_CLIENT_ID and SF_CLIENT_SECRET)
+
+    def _authenticate(self):
+        auth_url = f"https://{SF_DOMAIN}.salesforce.com/services/oauth2/token"
+        auth_data = {
+            'grant_type': 'password',
+            'client_id': SF_CLIENT_ID,
+            'client_secret': SF_CLIENT_SECRET,
+            'username': SF_USERNAME,
+            'password': SF_PASSWORD + SF_SECURITY_TOKEN
+        }
+        response = self.http.post(auth_url, data=auth_data, timeout=SF_REQUEST_TIMEOUT)
+        auth_json = response.json()
+        if 'access_token' not in auth_json:
+            raise SalesforceError(f"Salesforce authentication failed: {auth_json.get('error_description', auth_json)}")
+        self._access_token = auth_json['access_token']
+        self._instance_url = auth_json['instance_url']
+
+    def _request(self, method, path, **kwargs):
+        for attempt in range(2):
+            with self._lock:
+                if self._access_token is None:
+                    self._authenticate()
+                token, instance_url = self._access_token, self._instance_url
+
+            response = self.http.request(
+                method,
+                f"{instance_url}/services/data/{SF_API_VERSION}{path}",
+                headers={'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'},
+                timeout=SF_REQUEST_TIMEOUT,
+                **kwargs
+            )
+            if response.status_code == 401 and attempt == 0:
+                with self._lock:
+                    if self._access_token == token:
+                        self._access_token = None
+                continue
+            if response.status_code >= 400:
+                raise SalesforceError(f"Salesforce API error {response.status_code}: {response.text[:500]}")
+            return response.json()
+
+    def query(self, soql: str) -> list:
+        """Run a SOQL query and return all records, following pagination."""
+        data = self._request("GET", "/query", params={'q': soql})
+        records = data.get('records', [])
+        while not data.get('done', True) and data.get('nextRecordsUrl'):
+            data = self._request("GET", data['nextRecordsUrl'].split(f"/{SF_API_VERSION}", 1)[1])
+            records.extend(data.get('records', []))
+        return records
+
+    def composite_query(self, queries: dict) -> dict:
+        """
+        Run several SOQL queries in one composite request. Later queries may
+        reference earlier results, e.g. '@{opportunity.records[0].AccountId}'.
+        Returns referenceId -> records (None for a failed sub request).
+        """
+        request = {
+            "allOrNone": False,
+            "compositeRequest": [
+                {
+                    "method": "GET",
+                    "url": f"/services/data/{SF_API_VERSION}/query?q={quote(soql, safe='@{}[].,()*=')}",
+                    "referenceId": reference_id,
+                }
+                for reference_id, soql in queries.items()
+            ]
+        }
+        data = self._request("POST", "/composite", json=request)
+        results = {}
+        for item in data.get('compositeResponse', []):
+            body = item.get('body')
+            results[item['referenceId']] = body.get('records', []) if item.get('httpStatusCode') == 200 and isinstance(body, dict) else None
+        return results
+
+    # -- invoice shapes ------------------------------------------------------
+
+    def fetch_opportunity_bundle(self, kind: str, value: str):
+        """
+        Opportunity with account, primary contact, pricebook and line items in
+        one composite round trip. Returns None unless exactly one opportunity matches.
+        """
+        where = f"Id = {soql_literal(value)}" if kind == "id" else f"Name = {soql_literal(value)}"
+        results = self.composite_query({
+            "opportunity": f"SELECT {OPPORTUNITY_FIELDS} FROM Opportunity WHERE {where} LIMIT 2",
+            "contact": f"SELECT {CONTACT_FIELDS} FROM Contact WHERE AccountId = '@{{opportunity.records[0].AccountId}}' ORDER BY CreatedDate LIMIT 1",
+        })
+        opportunities = results.get("opportunity") or []
+        if len(opportunities) != 1:
+            return None
+        return opportunity_bundle(opportunities[0], results.get("contact") or [])
+
+    def fetch_account_bundle(self, kind: str, value: str):
+        """
+        Account with its primary contact (and its opportunity when it has only one),
+        plus the IDs of its open opportunities. Returns None unless exactly one account matches.
+        """
+        where = f"Id = {soql_literal(value)}" if kind == "id" else f"Name = {soql_literal(value)}"
+        accounts = self.query(f"SELECT {ACCOUNT_FIELDS} FROM Account WHERE {where} LIMIT 2")
+        if len(accounts) != 1:
+            return None
+        record = accounts[0]
+        result = {"account": account_shape(record)}
+        contacts = (record.get("Contacts") or {}).get("records") or []
+        if contacts:
+            result["contact"] = contact_shape(contacts[0], record["Id"])
+        opportunities = (record.get("Opportunities") or {}).get("records") or []
+        if len(opportunities) == 1:
+            item = opportunities[0]
+            result["opportunity"] = {
+                "id": item["Id"],
+                "name": item["Name"],
+                "stage": item.get("StageName"),
+                "amount": item.get("Amount"),
+                "close_date": item.get("CloseDate"),
+                "account_id": record["Id"],
+            }
+        open_ids = [item["Id"] for item in opportunities if not item.get("IsClosed")]
+        return result, open_ids
+
+
+def account_shape(record: dict) -> dict:
+    address = ", ".join(
+        part for part in (
+            record.get("BillingStreet"), record.get("BillingCity"), record.get("BillingState"),
+            record.get("BillingPostalCode"), record.get("BillingCountry")
+        ) if part
+    )
+    return {
+        "id": record.get("Id"),
+        "name": record.get("Name"),
+        "phone": record.get("Phone"),
+        "industry": record.get("Industry"),
+        "billing_address": address or None,
+    }
+
+
+def contact_shape(record: dict, account_id=None, role=None) -> dict:
+    return {
+        "id": record.get("Id"),
+        "name": record.get("Name"),
+        "email": record.get("Email"),
+        "phone": record.get("Phone"),
+        "role": role or record.get("Title"),
+        "account_id": record.get("AccountId") or account_id,
+    }
+
+
+def opportunity_bundle(record: dict, account_contacts: list) -> dict:
+    """Map an Opportunity SOQL record to the salesforceAgent invoice schema (see SALESFORCE_AGENT_PROMPT)."""
+    account_id = record.get("AccountId")
+    products = [
+        {
+            "id": item.get("Id"),
+            "product_id": item.get("Product2Id"),
+            "name": (item.get("Product2") or {}).get("Name"),
+            "code": item.get("ProductCode"),
+            "description": item.get("Description"),
+            "quantity": item.get("Quantity"),
+            "unit_price": item.get("UnitPrice"),
+            "total_price": item.get("TotalPrice"),
+        }
+        for item in (record.get("OpportunityLineItems") or {}).get("records") or []
+    ]
+
+    result = {
+        "opportunity": {
+            "id": record.get("Id"),
+            "name": record.get("Name"),
+            "stage": record.get("StageName"),
+            "amount": record.get("Amount"),
+            "close_date": record.get("CloseDate"),
+            "account_id": account_id,
+        },
+        "products": products,
+    }
+
+    if record.get("Account"):
+        result["account"] = account_shape(record["Account"])
+
+    roles = (record.get("OpportunityContactRoles") or {}).get("records") or []
+    if roles and roles[0].get("Contact"):
+        contact = dict(roles[0]["Contact"], Id=roles[0].get("ContactId"))
+        result["contact"] = contact_shape(contact, account_id, role=roles[0].get("Role"))
+    elif account_contacts:
+        result["contact"] = contact_shape(account_contacts[0], account_id)
+
+    if record.get("Pricebook2Id"):
+        result["pricebook"] = {
+            "id": record["Pricebook2Id"],
+            "name": (record.get("Pricebook2") or {}).get("Name"),
+        }
+
+    missing = [key for key in ("account", "contact") if key not in result]
+    if not products:
+        missing.append("products")
+    if missing:
+        result["missing_fields"] = missing
+    return result
+
+
+salesforce_client = SalesforceClient()
+
+
+def salesforce_fast_path(query: str):
+    """
+    Answer well-known read shapes (opportunity + line items + primary contact
+    + pricebook, or an account) with direct REST queries and no model call.
+    Returns None when the query is a write, names no single record, or is
+    ambiguous, so the caller falls back to the LLM agent.
+    """
+    if not salesforce_client.configured or is_write_query(query):
+        return None
+
+    reference = extract_record_reference(query)
+    if reference is None:
+        return None
+    kind, value = reference
+
+    try:
+        if kind == "id" and value.startswith("001"):
+            bundle = None
+        else:
+            bundle = salesforce_client.fetch_opportunity_bundle(kind, value)
+        if bundle is not None:
+            return bundle
+
+        if kind == "id" and not value.startswith("001"):
+            return None
+        found = salesforce_client.fetch_account_bundle(kind, value)
+        if found is None:
+            return None
+
+        account, open_ids = found
+        # An invoice for an account is only unambiguous with a single open opportunity
+        if re.search(r'\b(invoice|bill|billing|products?|line items?)\b', query, re.IGNORECASE):
+            if len(open_ids) != 1:
+                return None
+            return salesforce_client.fetch_opportunity_bundle("id", open_ids[0])
+        return account
+    except Exception as e:
+        print(f"Salesforce fast path failed, falling back to agent: {e}")
+        return None
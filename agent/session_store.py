@@ -0,0 +1,303 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from strands.session.repository_session_manager import RepositorySessionManager
+from strands.session.session_repository import SessionRepository
+from strands.types.exceptions import SessionException
+from strands.types.session import Session, SessionAgent, SessionMessage
+from config import (
+    SESSION_STORE, S3_SESSION_BUCKET, SESSION_S3_PREFIX, SESSION_LOCAL_DIR, SESSION_FLUSH_INTERVAL,
+    SESSION_CACHE_SIZE
+)
+
+# Snapshot layout: {"session": {...}, "agents": {agent_id: {"agent": {...}, "messages": {message_id: {...}}}}}
+
+
+class LocalSessionBackend:
+    """One JSON snapshot file per session in `directory`, for development and tests."""
+
+    def __init__(self, directory=SESSION_LOCAL_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, session_id):
+        return os.path.join(self.directory, f"{session_id}.json")
+
+    def load(self, session_id):
+        try:
+            with open(self._path(session_id), encoding="utf-8") as handle:
+                return json.load(handle)
+        except FileNotFoundError:
+            return None
+
+    def save(self, session_id, data: bytes):
+        # Write then rename, so a crash never leaves a half written snapshot
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(descriptor, "wb") as handle:
+            handle.write(data)
+        os.replace(temporary, self._path(session_id))
+
+
+class S3SessionBackend:
+    """
+    One snapshot object per session (<prefix>snapshots/<session_id>.json).
+    Sessions written by S3SessionManager, one object per message, are read
+    once from that layout and compacted into a snapshot.
+    """
+
+    def __init__(self, bucket=S3_SESSION_BUCKET, prefix=SESSION_S3_PREFIX):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.compacted = 0
+
+    def _client(self):
+        from aws_clients import aws_clients
+        return aws_clients.client("s3", aws_clients.bucket_region(self.bucket))
+
+    def load(self, session_id):
+        s3 = self._client()
+        try:
+            response = s3.get_object(Bucket=self.bucket, Key=f"{self.prefix}snapshots/{session_id}.json")
+            return json.loads(response["Body"].read())
+        except s3.exceptions.NoSuchKey:
+            return self._load_message_objects(s3, session_id)
+
+    def _load_message_objects(self, s3, session_id):
+        root = f"{self.prefix}session_{session_id}/"
+        snapshot = None
+        agents = {}
+        for page in s3.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=root):
+            for entry in page.get("Contents", []):
+                key = entry["Key"]
+                relative = key[len(root):].split("/")
+                document = json.loads(s3.get_object(Bucket=self.bucket, Key=key)["Body"].read())
+                if relative == ["session.json"]:
+                    snapshot = {"session": document, "agents": agents}
+                elif len(relative) == 3 and relative[2] == "agent.json":
+                    agents.setdefault(relative[1][len("agent_"):], {"messages": {}})["agent"] = document
+                elif len(relative) == 4 and relative[2] == "messages":
+                    agent = agents.setdefault(relative[1][len("agent_"):], {"messages": {}})
+                    agent["messages"][str(document["message_id"])] = document
+        if snapshot is not None:
+            self.compacted += 1
+            self.save(session_id, json.dumps(snapshot).encode("utf-8"))
+        return snapshot
+
+    def save(self, session_id, data: bytes):
+        self._client().put_object(
+            Bucket=self.bucket, Key=f"{self.prefix}snapshots/{session_id}.json",
+            Body=data, ContentType="application/json"
+        )
+
+
+class WriteBehindSessionRepository(SessionRepository):
+    """
+    Strands session repository that keeps hot sessions in memory and writes
+    them behind the conversation.
+
+    Agent turns only touch memory. A background thread writes every session
+    that changed since the last flush as one snapshot, every flush_interval
+    seconds, so the many small message writes of a turn become one PUT.
+    Restoring a session is one GET of its snapshot. At most cache_size
+    sessions stay in memory; the least recently used are flushed and dropped.
+    """
+
+    def __init__(self, backend, flush_interval=SESSION_FLUSH_INTERVAL, cache_size=SESSION_CACHE_SIZE):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        self._sessions = OrderedDict()
+        self._dirty = set()
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._flush_loop, name="session-flush", daemon=True)
+        self._thread.start()
+        self.hits = 0
+        self.loads = 0
+        self.flushes = 0
+        self.flushed_sessions = 0
+        self.flush_errors = 0
+        self.flush_seconds = 0.0
+
+    # -- hot set ---------------------------------------------------------------
+
+    def _snapshot(self, session_id, load=True):
+        with self._lock:
+            snapshot = self._sessions.get(session_id)
+            if snapshot is not None:
+                self._sessions.move_to_end(session_id)
+                self.hits += 1
+                return snapshot
+        if not load:
+            return None
+        loaded = self.backend.load(session_id)
+        with self._lock:
+            self.loads += 1
+            # Another thread may have created or loaded it meanwhile; the in-memory copy wins
+            snapshot = self._sessions.get(session_id) or loaded
+            if snapshot is not None:
+                self._cache(session_id, snapshot)
+        return snapshot
+
+    def _cache(self, session_id, snapshot):
+        self._sessions[session_id] = snapshot
+        self._sessions.move_to_end(session_id)
+        self._evict()
+
+    def _evict(self):
+        # Least recently used first; sessions not written yet stay until a flush
+        excess = len(self._sessions) - self.cache_size
+        for session_id in list(self._sessions):
+            if excess <= 0:
+                return
+            if session_id not in self._dirty:
+                del self._sessions[session_id]
+                excess -= 1
+
+    def _agent(self, session_id, agent_id):
+        snapshot = self._snapshot(session_id)
+        if snapshot is None:
+            raise SessionException(f"Session {session_id} does not exist")
+        agent = snapshot["agents"].get(agent_id)
+        if agent is None:
+            raise SessionException(f"Agent {agent_id} does not exist in session {session_id}")
+        return agent
+
+    def _changed(self, session_id):
+        self._dirty.add(session_id)
+
+    # -- SessionRepository -----------------------------------------------------
+
+    def create_session(self, session: Session, **kwargs) -> Session:
+        if self._snapshot(session.session_id) is not None:
+            raise SessionException(f"Session {session.session_id} already exists")
+        with self._lock:
+            self._cache(session.session_id, {"session": session.to_dict(), "agents": {}})
+            self._changed(session.session_id)
+        return session
+
+    def read_session(self, session_id: str, **kwargs):
+        snapshot = self._snapshot(session_id)
+        return Session.from_dict(snapshot["session"]) if snapshot else None
+
+    def create_agent(self, session_id: str, session_agent: SessionAgent, **kwargs) -> None:
+        snapshot = self._snapshot(session_id)
+        if snapshot is None:
+            raise SessionException(f"Session {session_id} does not exist")
+        with self._lock:
+            snapshot["agents"][session_agent.agent_id] = {"agent": session_agent.to_dict(), "messages": {}}
+            self._changed(session_id)
+
+    def read_agent(self, session_id: str, agent_id: str, **kwargs):
+        snapshot = self._snapshot(session_id)
+        if snapshot is None or agent_id not in snapshot["agents"]:
+            return None
+        return SessionAgent.from_dict(snapshot["agents"][agent_id]["agent"])
+
+    def update_agent(self, session_id: str, session_agent: SessionAgent, **kwargs) -> None:
+        agent = self._agent(session_id, session_agent.agent_id)
+        with self._lock:
+            # Keep the original creation time, as S3SessionManager does
+            session_agent.created_at = agent["agent"].get("created_at", session_agent.created_at)
+            agent["agent"] = session_agent.to_dict()
+            self._changed(session_id)
+
+    def create_message(self, session_id: str, agent_id: str, session_message: SessionMessage, **kwargs) -> None:
+        agent = self._agent(session_id, agent_id)
+        with self._lock:
+            agent["messages"][str(session_message.message_id)] = session_message.to_dict()
+            self._changed(session_id)
+
+    def read_message(self, session_id: str, agent_id: str, message_id: int, **kwargs):
+        agent = self._agent(session_id, agent_id)
+        message = agent["messages"].get(str(message_id))
+        return SessionMessage.from_dict(message) if message else None
+
+    def update_message(self, session_id: str, agent_id: str, session_message: SessionMessage, **kwargs) -> None:
+        agent = self._agent(session_id, agent_id)
+        with self._lock:
+            if str(session_message.message_id) not in agent["messages"]:
+                raise SessionException(f"Message {session_message.message_id} does not exist")
+            session_message.created_at = agent["messages"][str(session_message.message_id)].get("created_at", session_message.created_at)
+            agent["messages"][str(session_message.message_id)] = session_message.to_dict()
+            self._changed(session_id)
+
+    def list_messages(self, session_id: str, agent_id: str, limit=None, offset: int = 0, **kwargs) -> list:
+        agent = self._agent(session_id, agent_id)
+        with self._lock:
+            messages = [agent["messages"][key] for key in sorted(agent["messages"], key=int)]
+        end = None if limit is None else offset + limit
+        return [SessionMessage.from_dict(message) for message in messages[offset:end]]
+
+    # -- write-behind ------------------------------------------------------------
+
+    def flush(self):
+        """Write every changed session now. Returns how many were written."""
+        with self._flush_lock:
+            with self._lock:
+                dirty = list(self._dirty)
+                self._dirty.clear()
+                # Serialized under the lock so a turn can't change a snapshot mid-write
+                payloads = {
+                    session_id: json.dumps(self._sessions[session_id], default=str).encode("utf-8")
+                    for session_id in dirty if session_id in self._sessions
+                }
+            if not payloads:
+                return 0
+            started = time.perf_counter()
+            written = 0
+            for session_id, data in payloads.items():
+                try:
+                    self.backend.save(session_id, data)
+                    written += 1
+                except Exception as e:
+                    print(f"Session {session_id} flush failed, will retry: {e}")
+                    with self._lock:
+                        self._dirty.add(session_id)
+                        self.flush_errors += 1
+            with self._lock:
+                self.flushes += 1
+                self.flushed_sessions += written
+                self.flush_seconds += time.perf_counter() - started
+                self._evict()
+            return written
+
+    def _flush_loop(self):
+        while not self._stopping.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Session flush error: {e}")
+
+    def close(self):
+        """Stop the background writer and write what is left"""
+        self._stopping.set()
+        self.flush()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "backend": type(self.backend).__name__,
+                "cached": len(self._sessions),
+                "dirty": len(self._dirty),
+                "hits": self.hits,
+                "loads": self.loads,
+                "compacted": getattr(self.backend, "compacted", 0),
+                "flushes": self.flushes,
+                "flushed_sessions": self.flushed_sessions,
+                "flush_errors": self.flush_errors,
+                "average_flush_ms": round(self.flush_seconds / self.flushes * 1000, 3) if self.flushes else 0.0,
+            }
+
+
+session_repository = WriteBehindSessionRepository(
+    LocalSessionBackend() if SESSION_STORE == "local" else S3SessionBackend()
+)
+
+
+def session_manager(session_id: str) -> RepositorySessionManager:
+    return RepositorySessionManager(session_id=session_id, session_repository=session_repository)
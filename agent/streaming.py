@@ -0,0 +1,151 @@
+import asyncio
+import json
+import re
+from agent_runner import agent_runner
+
+INVOICE_PREVIEW_PATTERN = re.compile(r'"type"\s*:\s*"invoice_preview"')
+
+# How much text after a "{" is held back before we know it is not an invoice preview
+PREVIEW_LOOKAHEAD = 48
+
+_DONE = object()
+
+
+def clean_agent_response(response: str) -> str:
+    """Strip thinking text and code fences around an invoice preview so only its JSON is left."""
+    if '"type": "invoice_preview"' in response:
+        # Clean invoice preview responses - extract everything after </thinking>
+        thinking_end = response.find('</thinking>')
+        if thinking_end != -1:
+            response = response[thinking_end + len('</thinking>'):].strip()
+
+        # Remove markdown code blocks
+        response = re.sub(r'^```json\s*|\s*```$', '', response.strip(), flags=re.MULTILINE)
+        response = response.strip()
+
+        # Extract only the invoice_preview JSON if multiple JSON objects exist
+        preview_start = response.find('{"type": "invoice_preview"')
+        if preview_start != -1:
+            response = response[preview_start:]
+    return response
+
+
+def frame(frame_type: str, **fields) -> str:
+    return json.dumps({"type": frame_type, **fields}, ensure_ascii=False, default=str)
+
+
+class FrameBuilder:
+    """
+    Turns strands stream events into WebSocket frames:
+    delta / tool_start / tool_end / final.
+
+    Text that turns out to be an invoice preview is never streamed as deltas,
+    it only arrives once, cleaned, in the final frame.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.forwarded = 0
+        self.suppressed = False
+        self.tools = {}
+
+    def _pending_delta(self, final=False):
+        if self.suppressed:
+            return None
+        if INVOICE_PREVIEW_PATTERN.search(self.text, self.forwarded):
+            self.suppressed = True
+            return None
+
+        end = len(self.text)
+        if not final:
+            brace = self.text.find("{", max(self.forwarded, end - PREVIEW_LOOKAHEAD))
+            if brace != -1:
+                end = brace
+        if end <= self.forwarded:
+            return None
+
+        delta = self.text[self.forwarded:end]
+        self.forwarded = end
+        return delta
+
+    def on_event(self, event: dict) -> list:
+        frames = []
+
+        if "data" in event:
+            self.text += event["data"]
+            delta = self._pending_delta()
+            if delta:
+                frames.append(frame("delta", text=delta))
+
+        tool_use = event.get("current_tool_use")
+        if tool_use and tool_use.get("toolUseId") and tool_use["toolUseId"] not in self.tools:
+            self.tools[tool_use["toolUseId"]] = tool_use.get("name")
+            frames.append(frame("tool_start", tool_use_id=tool_use["toolUseId"], tool=tool_use.get("name")))
+
+        message = event.get("message")
+        if message and message.get("role") == "user":
+            for block in message.get("content", []):
+                result = block.get("toolResult")
+                if result:
+                    tool_use_id = result.get("toolUseId")
+                    frames.append(frame(
+                        "tool_end",
+                        tool_use_id=tool_use_id,
+                        tool=self.tools.get(tool_use_id),
+                        status=result.get("status")
+                    ))
+
+        return frames
+
+    def finish(self, response: str) -> list:
+        frames = []
+        if not self.suppressed and not INVOICE_PREVIEW_PATTERN.search(response):
+            delta = self._pending_delta(final=True)
+            if delta:
+                frames.append(frame("delta", text=delta))
+
+        text = clean_agent_response(response)
+        frames.append(frame(
+            "final",
+            text=text,
+            invoice_preview=bool(INVOICE_PREVIEW_PATTERN.search(text))
+        ))
+        return frames
+
+
+async def stream_agent_frames(agent, message, runner=agent_runner, **kwargs):
+    """
+    Run an agent turn on the agent pool and yield JSON frames as it streams.
+    The agent's own async stream runs in the worker thread so tool calls never
+    block the server event loop.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def produce():
+        async def consume():
+            result = None
+            async for event in agent.stream_async(message, **kwargs):
+                if "result" in event:
+                    result = event["result"]
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            return result
+
+        return asyncio.run(consume())
+
+    builder = FrameBuilder()
+    task = asyncio.ensure_future(runner.run_sync(produce))
+    # Completion is scheduled after every event the worker queued, so _DONE always comes last
+    task.add_done_callback(lambda _: queue.put_nowait(_DONE))
+
+    while True:
+        event = await queue.get()
+        if event is _DONE:
+            break
+        for item in builder.on_event(event):
+            yield item
+
+    result = await task
+    response = str(result) if result is not None else builder.text
+    for item in builder.finish(response):
+        yield item
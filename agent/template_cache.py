@@ -0,0 +1,274 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from jinja2 import BaseLoader, Environment, FileSystemBytecodeCache, TemplateNotFound
+from jinja2.loaders import split_template_path
+from aws_clients import aws_clients
+from config import (
+    S3_TEMPLATE_BUCKET, TEMPLATE_S3_PREFIX, TEMPLATE_LOCAL_DIR, TEMPLATE_TTL,
+    TEMPLATE_CACHE_SIZE, TEMPLATE_BYTECODE_DIR, TEMPLATE_WARM, TEMPLATE_MISSING_MAX
+)
+
+DEFAULT_INVOICE_TEMPLATE = "invoice_template.html"
+DEFAULT_REMINDER_TEMPLATE = "reminder_email.txt"
+
+
+def template_slug(value) -> str:
+    return re.sub(r'[^a-z0-9]+', '-', str(value or '').lower()).strip('-')
+
+
+class S3TemplateLoader(BaseLoader):
+    """
+    Jinja loader for templates kept in S3 with the repo's templates/ folder
+    as fallback. A loaded template is trusted for `ttl` seconds; after that
+    Jinja's uptodate check revalidates it with a conditional GET on the
+    stored ETag, so an unchanged template is neither downloaded nor
+    recompiled. Missing names are remembered for `ttl` too (at most
+    `max_missing` of them, least recently looked up dropped first), which
+    keeps select_template fallbacks from hitting S3 on every render. S3 is read
+    outside the lock, so a slow GET only holds up renders of that template.
+    """
+
+    def __init__(self, bucket, prefix, local_dir, ttl, max_missing=TEMPLATE_MISSING_MAX):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.local_dir = local_dir
+        self.ttl = ttl
+        self.max_missing = max_missing
+        # name -> {"source", "filename", "etag", "mtime", "checked_at"}
+        self._entries = {}
+        # name -> monotonic time until which it is known to be missing, oldest first
+        self._missing = OrderedDict()
+        self._lock = threading.Lock()
+        self.s3_fetches = 0
+        self.not_modified = 0
+        self.local_loads = 0
+        self.s3_errors = 0
+
+    def _fetch_s3(self, name, entry):
+        """(new entry, changed); changed is False on a 304, entry is None when the key does not exist"""
+        s3 = aws_clients.s3_for_bucket(self.bucket)
+        kwargs = {"Bucket": self.bucket, "Key": self.prefix + name}
+        if entry and entry.get("etag"):
+            kwargs["IfNoneMatch"] = entry["etag"]
+        try:
+            response = s3.get_object(**kwargs)
+        except s3.exceptions.NoSuchKey:
+            return None, True
+        except Exception as e:
+            code = str(getattr(e, "response", {}).get("Error", {}).get("Code", ""))
+            if code in ("304", "NotModified"):
+                with self._lock:
+                    self.not_modified += 1
+                return entry, False
+            if code in ("404", "NoSuchKey"):
+                return None, True
+            raise
+        with self._lock:
+            self.s3_fetches += 1
+        return {
+            "source": response["Body"].read().decode("utf-8"),
+            "filename": f"s3://{self.bucket}/{self.prefix}{name}",
+            "etag": response.get("ETag"),
+        }, True
+
+    def _local_path(self, name):
+        """Path of `name` under local_dir, or None for names that would leave it"""
+        if name.startswith("/"):
+            return None
+        try:
+            pieces = split_template_path(name)
+        except TemplateNotFound:
+            return None
+        root = os.path.realpath(self.local_dir)
+        path = os.path.realpath(os.path.join(root, *pieces))
+        return path if path.startswith(root + os.sep) else None
+
+    def _load_local(self, name):
+        path = self._local_path(name)
+        if path is None or not os.path.isfile(path):
+            return None
+        with open(path, encoding="utf-8") as handle:
+            source = handle.read()
+        with self._lock:
+            self.local_loads += 1
+        return {"source": source, "filename": path, "mtime": os.path.getmtime(path)}
+
+    def _fetch(self, name, entry):
+        """Current version of a template, reusing `entry` when it has not changed"""
+        if self.bucket:
+            try:
+                found, changed = self._fetch_s3(name, entry if entry and entry.get("etag") else None)
+                if found is not None:
+                    return found, changed
+            except Exception as e:
+                with self._lock:
+                    self.s3_errors += 1
+                print(f"Template {name} could not be read from S3, using local copy: {e}")
+                if entry:
+                    return entry, False
+        if entry and entry.get("mtime") is not None and os.path.isfile(entry["filename"]) \
+                and os.path.getmtime(entry["filename"]) == entry["mtime"]:
+            return entry, False
+        return self._load_local(name), True
+
+    def _remember_missing(self, name):
+        """Caller holds _lock"""
+        now = time.monotonic()
+        self._missing[name] = now + self.ttl
+        self._missing.move_to_end(name)
+        while self._missing and (len(self._missing) > self.max_missing or next(iter(self._missing.values())) <= now):
+            self._missing.popitem(last=False)
+
+    def _uptodate(self, name, entry):
+        with self._lock:
+            if self._entries.get(name) is not entry:
+                return False
+            if time.monotonic() - entry["checked_at"] < self.ttl:
+                return True
+        current, changed = self._fetch(name, entry)
+        with self._lock:
+            if current is None:
+                self._entries.pop(name, None)
+                return False
+            current["checked_at"] = time.monotonic()
+            self._entries[name] = current
+            return not changed
+
+    def get_source(self, environment, template):
+        # Same rules as Jinja's FileSystemLoader: no "..", no absolute names
+        if template.startswith("/"):
+            raise TemplateNotFound(template)
+        split_template_path(template)
+        with self._lock:
+            missing_until = self._missing.get(template)
+            if missing_until and missing_until > time.monotonic():
+                self._missing.move_to_end(template)
+                raise TemplateNotFound(template)
+            entry = self._entries.get(template)
+            fresh = entry is not None and time.monotonic() - entry["checked_at"] < self.ttl
+
+        if not fresh:
+            entry, _ = self._fetch(template, entry)
+            with self._lock:
+                if entry is None:
+                    self._remember_missing(template)
+                    raise TemplateNotFound(template)
+                entry["checked_at"] = time.monotonic()
+                self._entries[template] = entry
+                self._missing.pop(template, None)
+
+        return entry["source"], entry["filename"], lambda: self._uptodate(template, entry)
+
+    def forget(self, name=None):
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+                self._missing.clear()
+            else:
+                self._entries.pop(name, None)
+                self._missing.pop(name, None)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": sorted(self._entries),
+                "missing": sorted(self._missing),
+                "s3_fetches": self.s3_fetches,
+                "not_modified": self.not_modified,
+                "local_loads": self.local_loads,
+                "s3_errors": self.s3_errors,
+            }
+
+
+class TemplateCache:
+    """
+    Compiled invoice templates shared across requests. A Jinja Environment
+    keeps up to `cache_size` compiled templates in memory (so per-customer
+    and per-locale variants stay warm side by side) and a bytecode cache on
+    disk lets a restarted worker skip compilation.
+    """
+
+    def __init__(self, bucket=S3_TEMPLATE_BUCKET, prefix=TEMPLATE_S3_PREFIX, local_dir=TEMPLATE_LOCAL_DIR,
+                 ttl=TEMPLATE_TTL, cache_size=TEMPLATE_CACHE_SIZE, bytecode_dir=TEMPLATE_BYTECODE_DIR):
+        self.loader = S3TemplateLoader(bucket, prefix, local_dir, ttl)
+        bytecode_cache = None
+        if bytecode_dir:
+            os.makedirs(bytecode_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(bytecode_dir)
+        self.environment = Environment(
+            loader=self.loader,
+            cache_size=cache_size,
+            auto_reload=True,
+            bytecode_cache=bytecode_cache,
+        )
+        self.renders = 0
+        self.render_seconds = 0.0
+
+    def get(self, name):
+        return self.environment.get_template(name)
+
+    def invoice_template(self, invoice_data: dict):
+        """
+        Most specific invoice template available: a named variant
+        (invoice_template.<template-slug>.html), then one per customer
+        (invoice_template.<account-slug>.html), then per locale, then the
+        default. Invoice data only ever picks a variant, never a path.
+        """
+        candidates = []
+        if template_slug(invoice_data.get("template")):
+            candidates.append(f"invoice_template.{template_slug(invoice_data['template'])}.html")
+        account = invoice_data.get("account")
+        account_name = account.get("name") if isinstance(account, dict) else account
+        if template_slug(account_name):
+            candidates.append(f"invoice_template.{template_slug(account_name)}.html")
+        if template_slug(invoice_data.get("locale")):
+            candidates.append(f"invoice_template.{template_slug(invoice_data['locale'])}.html")
+        candidates.append(DEFAULT_INVOICE_TEMPLATE)
+        return self.environment.select_template(candidates)
+
+    def render_invoice(self, invoice_data: dict) -> str:
+        started = time.perf_counter()
+        html = self.invoice_template(invoice_data).render(invoice=invoice_data)
+        self.renders += 1
+        self.render_seconds += time.perf_counter() - started
+        return html
+
+    def render_reminder(self, invoice: dict, bucket: str) -> tuple:
+        """
+        (subject, body) of a payment reminder from reminder_email.<bucket>.txt
+        or the default reminder template; the first line is the subject.
+        """
+        started = time.perf_counter()
+        template = self.environment.select_template([
+            f"reminder_email.{template_slug(bucket)}.txt", DEFAULT_REMINDER_TEMPLATE
+        ])
+        subject, _, body = template.render(invoice=invoice, bucket=bucket).strip().partition("\n")
+        self.renders += 1
+        self.render_seconds += time.perf_counter() - started
+        return subject.strip(), body.strip()
+
+    def warm(self, names=TEMPLATE_WARM):
+        for name in names:
+            try:
+                self.get(name)
+            except TemplateNotFound:
+                print(f"Template {name} not found, skipping warm-up")
+
+    def invalidate(self, name=None):
+        """Forget a template (or all of them); compiled copies fail their uptodate check and reload"""
+        self.loader.forget(name)
+
+    def metrics(self) -> dict:
+        return {
+            **self.loader.metrics(),
+            "compiled": len(self.environment.cache),
+            "cache_size": self.environment.cache.capacity,
+            "renders": self.renders,
+            "average_render_ms": round(self.render_seconds / self.renders * 1000, 3) if self.renders else 0.0,
+        }
+
+
+template_cache = TemplateCache()
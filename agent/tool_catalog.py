@@ -0,0 +1,174 @@
+import copy
+import hashlib
+import json
+import re
+import threading
+import time
+from strands.tools.mcp.mcp_agent_tool import MCPAgentTool
+from config import MCP_TOOL_CATALOG_TTL
+
+
+def sanitize_property_name(prop_name):
+    """Convert invalid property names to valid ones"""
+    # Replace __COLON__ with underscore
+    sanitized = prop_name.replace('__COLON__', '_')
+    # Replace any other invalid patterns
+    sanitized = re.sub(r'[^a-zA-Z0-9_.-]', '_', sanitized)
+    # Limit to 64 characters
+    return sanitized[:64]
+
+
+def sanitize_input_schema(schema):
+    """
+    Return a Bedrock compatible copy of an MCP input schema and the
+    sanitized -> original property name map needed to call the tool.
+    """
+    if not isinstance(schema, dict) or 'properties' not in schema:
+        return schema, {}
+
+    fixed_props = {}
+    reverse_names = {}
+    for prop_name, prop_value in schema['properties'].items():
+        fixed_name = sanitize_property_name(prop_name)
+        if fixed_name in reverse_names:
+            print(f"Duplicate sanitized property name {fixed_name} for {prop_name}, keeping {reverse_names[fixed_name]}")
+            continue
+        fixed_props[fixed_name] = prop_value
+        reverse_names[fixed_name] = prop_name
+
+    forward_names = {original: fixed for fixed, original in reverse_names.items()}
+    new_schema = copy.deepcopy({k: v for k, v in schema.items() if k != 'properties'})
+    new_schema['properties'] = fixed_props
+    if isinstance(schema.get('required'), list):
+        new_schema['required'] = [forward_names[name] for name in schema['required'] if name in forward_names]
+
+    # Only keep names that actually changed, the rest pass through untouched
+    reverse_names = {fixed: original for fixed, original in reverse_names.items() if fixed != original}
+    return new_schema, reverse_names
+
+
+def restore_property_names(arguments, reverse_names):
+    if not reverse_names or not isinstance(arguments, dict):
+        return arguments
+    return {reverse_names.get(key, key): value for key, value in arguments.items()}
+
+
+def catalog_digest(tools):
+    """Content hash of a tool catalog as listed by the MCP server."""
+    payload = [
+        {
+            "name": tool.mcp_tool.name,
+            "description": tool.mcp_tool.description,
+            "inputSchema": tool.mcp_tool.inputSchema,
+        }
+        for tool in tools
+    ]
+    payload.sort(key=lambda item: item["name"])
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class SanitizedMCPAgentTool(MCPAgentTool):
+    """MCP tool exposed with Bedrock safe property names, mapped back to the server's names on call."""
+
+    def __init__(self, mcp_tool, mcp_client, reverse_names):
+        super().__init__(mcp_tool, mcp_client)
+        self.reverse_names = reverse_names
+
+    async def stream(self, tool_use, invocation_state, **kwargs):
+        if self.reverse_names:
+            tool_use = {**tool_use, "input": restore_property_names(tool_use.get("input"), self.reverse_names)}
+        async for event in super().stream(tool_use, invocation_state, **kwargs):
+            yield event
+
+
+class _CatalogEntry:
+    def __init__(self, digest, schemas, generation, tools):
+        self.digest = digest
+        # tool name -> (sanitized mcp.types.Tool, reverse name map)
+        self.schemas = schemas
+        self.generation = generation
+        self.tools = tools
+        self.fetched_at = time.monotonic()
+
+
+class ToolCatalogCache:
+    """
+    Sanitized MCP tool catalogs keyed by server URL.
+
+    Within the TTL the cached tools are returned as is. After the TTL the
+    server is listed again, but the catalog is only re-sanitized when its
+    content hash changed. A reconnect (new client generation) only rebinds
+    the cached schemas to the new client.
+    """
+
+    def __init__(self, ttl=MCP_TOOL_CATALOG_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.refreshes = 0
+        self.sanitizations = 0
+
+    def get_tools(self, connection):
+        """Tools for a live mcp_pool.MCPConnection, listing the server only when the entry is stale."""
+        with self._lock:
+            entry = self._entries.get(connection.url)
+            now = time.monotonic()
+            if entry and entry.generation == connection.generation and now - entry.fetched_at < self.ttl:
+                self.hits += 1
+                return entry.tools
+
+            if entry and now - entry.fetched_at >= self.ttl:
+                connection.refresh_tools()
+            self.refreshes += 1
+            raw_tools = connection.tools
+            digest = catalog_digest(raw_tools)
+
+            if entry and entry.digest == digest:
+                schemas = entry.schemas
+            else:
+                schemas = {}
+                for tool in raw_tools:
+                    schema, reverse_names = sanitize_input_schema(tool.mcp_tool.inputSchema)
+                    schemas[tool.mcp_tool.name] = (tool.mcp_tool.model_copy(update={"inputSchema": schema}), reverse_names)
+                self.sanitizations += 1
+
+            if entry and entry.digest == digest and entry.generation == connection.generation:
+                tools = entry.tools
+            else:
+                tools = [
+                    SanitizedMCPAgentTool(mcp_tool, connection.client, reverse_names)
+                    for mcp_tool, reverse_names in schemas.values()
+                ]
+
+            self._entries[connection.url] = _CatalogEntry(digest, schemas, connection.generation, tools)
+            return tools
+
+    def reverse_names(self, url, tool_name):
+        """Sanitized -> original property names for one tool, empty if nothing was renamed."""
+        entry = self._entries.get(url)
+        if not entry or tool_name not in entry.schemas:
+            return {}
+        return entry.schemas[tool_name][1]
+
+    def invalidate(self, url=None):
+        """
+        Mark one server's catalog, or every catalog when no URL is given, as
+        stale so the next get_tools lists the server again.
+        """
+        with self._lock:
+            for entry_url, entry in self._entries.items():
+                if url is None or entry_url == url:
+                    entry.fetched_at = float("-inf")
+
+    def metrics(self) -> dict:
+        return {
+            "ttl": self.ttl,
+            "servers": len(self._entries),
+            "hits": self.hits,
+            "refreshes": self.refreshes,
+            "sanitizations": self.sanitizations,
+        }
+
+
+tool_catalog = ToolCatalogCache()
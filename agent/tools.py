@@ -1,23 +1,38 @@
-from strands import Agent, tool
+from strands import Agent, ToolContext, tool
 from strands.models import BedrockModel as StrandsBedrockModel
-from strands.tools.mcp import MCPClient
 from strands.types.tools import ToolResult, ToolUse
-from mcp.client.streamable_http import streamablehttp_client
-from config import SALESFORCE_ZAPIER_MCP_URL, STRIPE_MCP_URL, XERO_MCP_URL, MODEL_ID, WKHTMLTOPDF_PATH
+from config import MODEL_ID, SNS_TOPIC_ARN
+from invoice_service import (
+    InvoiceDataError, InvoiceSendError, normalize_products, build_invoice_preview,
+    send_invoice_document, publish_notification
+)
+from job_queue import job_queue
+from mcp_pool import mcp_pool
+from tool_catalog import tool_catalog
+from agent_factory import AgentPool
+from salesforce_cache import salesforce_cache, is_write_query
+from salesforce_client import salesforce_fast_path
 from prompts import SALESFORCE_AGENT_PROMPT, REMINDER_AGENT_PROMPT
+from prompt_cache import PromptCacheHook, model_cache_config
 from typing import Any
 import re
-import copy
 import json
-import boto3
-from datetime import datetime, timedelta
-import pdfkit
-import uuid
-from jinja2 import Template
-import requests
-import base64
+from datetime import datetime
 
-model = StrandsBedrockModel(model_id=MODEL_ID, region="us-east-1")
+# System prompts and MCP tool specs are the same on every call: cache them as the prompt prefix
+model = StrandsBedrockModel(model_id=MODEL_ID, region="us-east-1", **model_cache_config())
+
+# Sub-agents are pre-built and reset between calls; Salesforce agents are keyed by the MCP tool list they were built with
+salesforce_agents = AgentPool(
+    "salesforce",
+    lambda tools: Agent(
+        system_prompt=SALESFORCE_AGENT_PROMPT, model=model, tools=tools or [], hooks=[PromptCacheHook("salesforce")]
+    )
+)
+reminder_agents = AgentPool(
+    "reminder",
+    lambda _: Agent(system_prompt=REMINDER_AGENT_PROMPT, model=model, hooks=[PromptCacheHook("reminder")])
+)
 
 VALID_KEYS = {
     "account", "contact", "opportunity", "product", "products",
@@ -51,40 +66,8 @@ def sanitize_salesforce_response(raw: str) -> dict:
 
     return sanitized
 
-def sanitize_property_name(prop_name):
-    """Convert invalid property names to valid ones"""
-    # Replace __COLON__ with underscore
-    sanitized = prop_name.replace('__COLON__', '_')
-    # Replace any other invalid patterns
-    sanitized = re.sub(r'[^a-zA-Z0-9_.-]', '_', sanitized)
-    # Limit to 64 characters
-    return sanitized[:64]
-
-def fix_tool_schema(tool):
-    """Fix tool input schema to be Bedrock compatible"""
-    try:
-        if hasattr(tool, 'mcp_tool') and tool.mcp_tool.inputSchema:
-            schema = tool.mcp_tool.inputSchema
-            if isinstance(schema, dict) and 'properties' in schema:
-                original_props = schema['properties']
-                fixed_props = {}
-                
-                for prop_name, prop_value in original_props.items():
-                    fixed_name = sanitize_property_name(prop_name)
-                    fixed_props[fixed_name] = prop_value
-                
-                # Create new schema with fixed properties
-                new_schema = copy.deepcopy(schema)
-                new_schema['properties'] = fixed_props
-                tool.mcp_tool.inputSchema = new_schema
-                
-        return tool
-    except Exception as e:
-        print(f"Error fixing tool schema: {e}")
-        return tool
-
-salesforce_mcp_client = MCPClient(lambda: streamablehttp_client(SALESFORCE_ZAPIER_MCP_URL))
-xero_mcp_client = MCPClient(lambda: streamablehttp_client(XERO_MCP_URL))
+salesforce_mcp = mcp_pool.get("salesforce")
+xero_mcp = mcp_pool.get("xero")
 
 @tool
 def orchestratedInvoice(query: str) -> str:
@@ -108,9 +91,7 @@ def orchestratedInvoice(query: str) -> str:
         return json.dumps({"type": "error", "message": sf_data.get("error")})
 
     # Normalize products: ensure all line items are under "products" key
-    if "opportunity" in sf_data and "line_items" in sf_data["opportunity"]:
-        if "products" not in sf_data:
-            sf_data["products"] = sf_data["opportunity"]["line_items"]
+    normalize_products(sf_data)
 
     # Now generate invoice preview
     return generateInvoicePreview(query, sf_data=sf_data)
@@ -130,19 +111,32 @@ def salesforceAgent(query: str) -> str:
     Query Salesforce safely via LLM + MCP.
     Returns validated JSON only.
     """
+    # Reads are answered from the entity cache when it holds everything the query needs
+    write = is_write_query(query)
+    if not write:
+        cached = salesforce_cache.lookup(query)
+        if cached is not None:
+            return json.dumps(cached, ensure_ascii=False, indent=2)
+
+        # Well-known shapes (opportunity + line items + contact, account) come straight from the REST API
+        direct = salesforce_fast_path(query)
+        if direct is not None:
+            sf_data = sanitize_salesforce_response(json.dumps(direct))
+            salesforce_cache.store(sf_data)
+            return json.dumps(sf_data, ensure_ascii=False, indent=2)
+
     try:
-        with salesforce_mcp_client:
-            tools = salesforce_mcp_client.list_tools_sync()
-            fixed_tools = [fix_tool_schema(tool) for tool in tools]
-
-            agent = Agent(
-                system_prompt=SALESFORCE_AGENT_PROMPT,
-                model=model,
-                tools=fixed_tools
-            )
+        with salesforce_mcp.session() as connection:
+            fixed_tools = tool_catalog.get_tools(connection)
 
-            raw = str(agent(query))  # LLM actually queries Salesforce here
+            with salesforce_agents.acquire(fixed_tools) as agent:
+                raw = str(agent(query))  # LLM actually queries Salesforce here
             sf_data = sanitize_salesforce_response(raw)
+
+            if write:
+                salesforce_cache.invalidate_for_query(query)
+            else:
+                salesforce_cache.store(sf_data)
             return json.dumps(sf_data, ensure_ascii=False, indent=2)
 
     except Exception as e:
@@ -154,26 +148,16 @@ def salesforceAgent(query: str) -> str:
 def sendSNSEmail(query: str) -> str:
     
     try:
-        # Initialize SNS client for ap-southeast-5 region
-        sns_client = boto3.client('sns', region_name='ap-southeast-5')
-        
-        # Static topic ARN
-        topic_arn = 'arn:aws:sns:ap-southeast-5:757834573545:HackathonTopic'
-        
         # Parse the query to extract message details
         message_data = parse_message_query(query)
         
         # Send SNS message
-        response = sns_client.publish(
-            TopicArn=topic_arn,
-            Message=message_data['message'],
-            Subject=message_data.get('subject', 'Customer Notification')
-        )
+        message_id = publish_notification(message_data['message'], message_data.get('subject', 'Customer Notification'))
         
         return json.dumps({
             "status": "success",
-            "message_id": response['MessageId'],
-            "topic_arn": topic_arn,
+            "message_id": message_id,
+            "topic_arn": SNS_TOPIC_ARN,
             "message": message_data['message'],
             "subject": message_data.get('subject', 'Customer Notification'),
             "timestamp": datetime.now().isoformat()
@@ -214,12 +198,8 @@ def parse_message_query(query):
 
 @tool
 def reminderAgent(query: str) -> str:
-    agent = Agent(
-        system_prompt=REMINDER_AGENT_PROMPT,
-        model=model,
-    )
-   
-    return str(agent(query))
+    with reminder_agents.acquire() as agent:
+        return str(agent(query))
 
 @tool(name="generate_invoice_preview")
 def generateInvoicePreview(query: str, sf_data: dict = None) -> str:
@@ -229,77 +209,14 @@ def generateInvoicePreview(query: str, sf_data: dict = None) -> str:
             "message": "Missing Salesforce data. Please let the Orchestrator fetch Salesforce info first."
         }, indent=2)
 
-    account = sf_data.get("account", {})
-    contact = sf_data.get("contact", {})
-    opportunity = sf_data.get("opportunity", {})
-
-    # Build line items from products (priority: top-level products → product → opportunity.line_items)
-    line_items = []
-    total_amount = 0
-
-    if sf_data.get("products"):
-        line_items = [
-            {
-                "product": item.get("name", "Product"),
-                "code": item.get("code", "N/A"),
-                "qty": item.get("quantity", 1),
-                "unit_price": item.get("unit_price", 0),
-                "total": item.get("total_price", 0)
-            }
-            for item in sf_data["products"]
-        ]
-        total_amount = sum(item["total"] for item in line_items)
-
-    elif sf_data.get("product"):
-        product = sf_data["product"]
-        line_items = [{
-            "product": product.get("name", "Product"),
-            "code": product.get("code", "N/A"),
-            "qty": product.get("quantity", 1),
-            "unit_price": product.get("unit_price", 0),
-            "total": product.get("total_price", 0)
-        }]
-        total_amount = line_items[0]["total"]
-
-    elif opportunity.get("line_items"):
-        line_items = [
-            {
-                "product": item.get("product_name", "Product"),
-                "code": item.get("product_code", "N/A"),
-                "qty": item.get("quantity", 1),
-                "unit_price": item.get("unit_price", 0),
-                "total": item.get("total_price", 0)
-            }
-            for item in opportunity["line_items"]
-        ]
-        total_amount = sum(item["total"] for item in line_items)
-
-    else:
+    try:
+        return json.dumps(build_invoice_preview(sf_data), indent=2)
+    except InvoiceDataError as e:
         return json.dumps({
             "type": "error",
-            "message": "No product data was found in Salesforce response."
+            "message": str(e)
         }, indent=2)
 
-    # Dates & metadata
-    invoice_id = f"DRAFT-{datetime.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:6]}"
-    issue_date = datetime.now().strftime("%Y-%m-%d")
-    due_date = (datetime.now() + timedelta(days=14)).strftime("%Y-%m-%d")
-
-    invoice_preview = {
-        "type": "invoice_preview",
-        "invoice_id": invoice_id,
-        "status": "Draft",
-        "issue_date": issue_date,
-        "due_date": due_date,
-        "account": account,
-        "contact": contact,
-        "line_items": line_items,
-        "total_amount": total_amount,
-        "currency": "USD",
-        "actions": ["✓ Approve & Send Invoice PDF to Email"]
-    }
-    return json.dumps(invoice_preview, indent=2)
-
 @tool
 def updateInvoiceDatabase(tool: ToolUse, **kwargs: Any) -> ToolResult:
     import json
@@ -314,13 +231,12 @@ def updateInvoiceDatabase(tool: ToolUse, **kwargs: Any) -> ToolResult:
     status = tool["input"]["status"]
 
     try:
-        from model.accounting import InvoicePayment
+        from model.accounting import Invoice
 
-        # Initialize payment model
-        payment_model = InvoicePayment()
+        invoice_model = Invoice()
         
         if action == 'create':
-            payment_id = payment_model.create_payment(
+            invoice_model.create_invoice(
                 invoice_id=invoice_id,
                 customer_name=customer_name,
                 amount=amount,
@@ -336,7 +252,7 @@ def updateInvoiceDatabase(tool: ToolUse, **kwargs: Any) -> ToolResult:
             })
             
         elif action == 'update':
-            payment_model.update_payment_status(
+            invoice_model.update_invoice_status(
                 invoice_id=invoice_id,
                 status=status,
             )
@@ -344,7 +260,7 @@ def updateInvoiceDatabase(tool: ToolUse, **kwargs: Any) -> ToolResult:
             return json.dumps({
                 "status": "success",
                 "action": "updated",
-                "payment_id": payment_id,
+                "invoice_id": invoice_id,
                 "new_status": status,
                 "timestamp": datetime.now().isoformat()
             })
@@ -358,48 +274,29 @@ def updateInvoiceDatabase(tool: ToolUse, **kwargs: Any) -> ToolResult:
             "timestamp": datetime.now().isoformat()
         })
 
-@tool
-def approveAndSendInvoice(query: str) -> str:
-    """Generate PDF and send SNS email for approved invoice."""
+@tool(context=True)
+def approveAndSendInvoice(query: str, tool_context: ToolContext) -> str:
+    """Queue PDF generation and SNS email for an approved invoice; returns a job handle right away."""
     try:
         # Parse invoice JSON from query
         json_start = query.find('{')
         if json_start == -1:
             return json.dumps({"error": "No invoice data found"})
 
-        invoice_json = query[json_start:]
-        invoice_data = json.loads(invoice_json)
+        invoice_data = json.loads(query[json_start:])
 
-        # Step 1: Generate PDF
-        pdf_result = sendInvoice(invoice_json)
-        pdf_data = json.loads(pdf_result)
-
-        # Step 2: Check PDF generation success
-        if pdf_data.get("type") == "error":
-            return pdf_result  # Stop here if PDF failed
-
-        # Step 3: Prepare and send SNS email
-        account_name = invoice_data.get("account", {}).get("name", "Customer")
-        invoice_number = pdf_data.get("invoice_number", "Unknown")
-        pdf_url = pdf_data.get("pdf_s3_url", "N/A")
-
-        sns_message = (
-            f"Invoice {invoice_number} has been generated for {account_name}. "
-            f"PDF available at: {pdf_url}"
+        # PDF, upload and email run on the job workers; the chat session is told when the job finishes
+        job_id = job_queue.enqueue(
+            "approve_and_send_invoice",
+            invoice_data,
+            session_id=tool_context.agent.state.get("session_id")
         )
-
-        sns_result = sendSNSEmail(
-            f'subject: "Invoice Generated" message: "{sns_message}"'
-        )
-
-        # Step 4: Return structured response
         return json.dumps({
-            "type": "invoice_approved_sent",
-            "invoice_number": invoice_number,
-            "account": account_name,
-            "pdf_url": pdf_url,
-            "sns_status": json.loads(sns_result).get("status"),
-            "message": f"Invoice {invoice_number} approved, PDF generated, and email notification sent"
+            "type": "invoice_job_queued",
+            "job_id": job_id,
+            "status": "queued",
+            "account": invoice_data.get("account", {}).get("name", "Customer"),
+            "message": "Invoice approved. The PDF and email notification are being prepared; you will be notified when they are sent."
         })
 
     except Exception as e:
@@ -410,9 +307,10 @@ def approveAndSendInvoice(query: str) -> str:
 @tool(name="send_invoice")
 def sendInvoice(query: str) -> str:
     """
-    Generate invoice PDF from HTML template stored in S3,
+    Generate invoice PDF from the cached HTML template,
     assign final invoice number with UUID, upload PDF to S3,
     and return structured response including final HTML.
+    Sending the same invoice content again reuses the uploaded PDF.
     """
     # 1. Parse invoice data JSON
     try:
@@ -423,109 +321,10 @@ def sendInvoice(query: str) -> str:
             "message": f"Invalid JSON input: {str(e)}"
         })
 
-    # Get bucket region first
-    s3_default = boto3.client("s3")
     try:
-        response = s3_default.get_bucket_location(Bucket=S3_BUCKET_PDF)
-        region = response.get('LocationConstraint') or 'us-east-1'
-    except:
-        region = 'us-east-1'
-    
-    s3 = boto3.client("s3", region_name=region, config=boto3.session.Config(signature_version='s3v4'))
-    S3_BUCKET_PDF = "hackathon-generated-invoice-agent-pdf"
-    S3_TEMPLATE_BUCKET = "hackathon-static-invoice-template"
-    TEMPLATE_KEY = "invoice_template.html"
-
-    # 2. Assign final invoice number
-    today_str = datetime.now().strftime("%Y%m%d")
-    unique_suffix = str(uuid.uuid4())[:8]
-    invoice_number = f"INV-{today_str}-{unique_suffix}"
-    invoice_data["invoice_number"] = invoice_number
-    invoice_data["invoice_id"] = invoice_number
-
-    # 3. Fetch HTML template from S3
-    try:
-        template_obj = s3.get_object(Bucket=S3_TEMPLATE_BUCKET, Key=TEMPLATE_KEY)
-        template_content = template_obj['Body'].read().decode('utf-8')
-        template = Template(template_content)
-
-        # Render template with invoice data
-        html_content = template.render(invoice=invoice_data)
-    except Exception as e:
-        return json.dumps({
-            "type": "error",
-            "message": f"Template fetching/rendering failed: {str(e)}"
-        })
-
-    # 4. Convert HTML to PDF
-    try:
-        config = pdfkit.configuration(wkhtmltopdf=WKHTMLTOPDF_PATH)
-        options = {
-            'enable-local-file-access': None,
-            'load-error-handling': 'ignore',
-            'load-media-error-handling': 'ignore',
-            'no-stop-slow-scripts': None,
-            'debug-javascript': None,
-            'javascript-delay': 1000
-        }
-        pdf_bytes = pdfkit.from_string(html_content, False, configuration=config, options=options)
-    except Exception as e:
+        return json.dumps(send_invoice_document(invoice_data), indent=2)
+    except InvoiceSendError as e:
         return json.dumps({
             "type": "error",
-            "message": f"PDF generation failed: {str(e)}"
+            "message": str(e)
         })
-
-    # 5. Upload PDF via API Gateway with fallback to direct S3
-    file_key = f"invoices/{invoice_number}.pdf"
-    presigned_url = None
-    
-    try:
-        # Try API Gateway first
-        api_endpoint = "https://14kxucu9dh.execute-api.ap-southeast-5.amazonaws.com/get-presigned-url"
-        payload = {
-            "fileName": f"{invoice_number}.pdf",
-            "fileContent": base64.b64encode(pdf_bytes).decode('utf-8'),
-            "contentType": "application/pdf"
-        }
-        
-        response = requests.post(api_endpoint, json=payload, timeout=30)
-        
-        if response.status_code == 200:
-            api_response = response.json()
-            presigned_url = api_response.get('downloadUrl')
-            
-    except Exception as api_error:
-        print(f"API Gateway failed: {api_error}")
-        
-    # Fallback to direct S3 upload if API Gateway failed
-    if not presigned_url:
-        try:
-            s3.put_object(
-                Bucket=S3_BUCKET_PDF,
-                Key=file_key,
-                Body=pdf_bytes,
-                ContentType="application/pdf"
-            )
-            
-            presigned_url = s3.generate_presigned_url(
-                "get_object",
-                Params={"Bucket": S3_BUCKET_PDF, "Key": file_key},
-                ExpiresIn=86400
-            )
-            
-        except Exception as s3_error:
-            return json.dumps({
-                "type": "error",
-                "message": f"Both API Gateway and S3 upload failed: {str(s3_error)}"
-            })
-
-    # 7. Return structured response
-    return json.dumps({
-        "type": "invoice_sent",
-        "invoice_number": invoice_number,
-        "account": invoice_data.get("account", {}).get("name", "Unknown"),
-        "contact": invoice_data.get("contact", {}).get("name", "Unknown"),
-        "pdf_s3_url": presigned_url,
-        "final_html": html_content,
-        "status": "Invoice PDF uploaded to S3"
-    }, indent=2)
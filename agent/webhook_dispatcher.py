@@ -0,0 +1,135 @@
+import asyncio
+import time
+from collections import deque
+from config import WEBHOOK_MAX_CONCURRENCY, WEBHOOK_MAX_PENDING
+
+
+class WebhookBacklogFull(Exception):
+    """Raised when too many webhook events are waiting; the sender should retry later."""
+
+
+class SourceStats:
+    def __init__(self):
+        self.accepted = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.ack_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.processing_seconds = 0.0
+        self.recent_ack_ms = deque(maxlen=500)
+        self.recent_processing_ms = deque(maxlen=500)
+
+
+def p95(samples):
+    ordered = sorted(samples)
+    return round(ordered[max(0, int(len(ordered) * 0.95) - 1)], 3) if ordered else 0.0
+
+
+class WebhookDispatcher:
+    """
+    Runs webhook work in the background so handlers can answer 200 right
+    after parsing, before Meta times out and retries. Work queued here is
+    lost if the process stops; events that must not be lost (payments) go
+    to the durable job_queue instead.
+
+    Events with the same (source, key) - e.g. one WhatsApp sender - run
+    one at a time in arrival order; different keys run
+    in parallel, at most max_concurrency at once. Must be used from the
+    event loop.
+
+    Metrics separate ack latency (request received -> queued) from
+    processing latency (request received -> work finished).
+    """
+
+    def __init__(self, max_concurrency=WEBHOOK_MAX_CONCURRENCY, max_pending=WEBHOOK_MAX_PENDING):
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self._semaphore = None
+        self._queues = {}
+        self._pending = 0
+        self._in_flight = 0
+        self._stats = {}
+        # The event loop only keeps weak references to tasks
+        self._tasks = set()
+
+    def submit(self, source, key, handler, *args, received_at=None):
+        """
+        Queue `await handler(*args)` behind earlier events for the same key.
+        `received_at` is the time.perf_counter() when the request came in.
+        """
+        stats = self._stats.setdefault(source, SourceStats())
+        if self.max_pending and self._pending >= self.max_pending:
+            stats.rejected += 1
+            raise WebhookBacklogFull(f"{self._pending} webhook events are already waiting")
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        received_at = received_at or time.perf_counter()
+        queue_key = (source, key)
+        queue = self._queues.get(queue_key)
+        start = queue is None
+        if start:
+            queue = self._queues[queue_key] = deque()
+        queue.append((handler, args, received_at))
+        self._pending += 1
+
+        ack = time.perf_counter() - received_at
+        stats.accepted += 1
+        stats.ack_seconds += ack
+        stats.recent_ack_ms.append(ack * 1000)
+        if start:
+            task = asyncio.get_running_loop().create_task(self._drain(source, queue_key, stats))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _drain(self, source, queue_key, stats):
+        queue = self._queues[queue_key]
+        while queue:
+            handler, args, received_at = queue[0]
+            async with self._semaphore:
+                queue.popleft()
+                self._pending -= 1
+                self._in_flight += 1
+                started = time.perf_counter()
+                try:
+                    await handler(*args)
+                    stats.processed += 1
+                except Exception as e:
+                    stats.failed += 1
+                    print(f"Webhook {source} {queue_key[1]} failed: {e}")
+                finally:
+                    self._in_flight -= 1
+            finished = time.perf_counter()
+            stats.wait_seconds += started - received_at
+            stats.processing_seconds += finished - received_at
+            stats.recent_processing_ms.append((finished - received_at) * 1000)
+        # Nothing was awaited since the last check, so no event can have slipped in
+        del self._queues[queue_key]
+
+    def metrics(self) -> dict:
+        sources = {}
+        for source, stats in self._stats.items():
+            finished = stats.processed + stats.failed
+            sources[source] = {
+                "accepted": stats.accepted,
+                "processed": stats.processed,
+                "failed": stats.failed,
+                "rejected": stats.rejected,
+                "average_ack_ms": round(stats.ack_seconds / stats.accepted * 1000, 3) if stats.accepted else 0.0,
+                "p95_ack_ms": p95(stats.recent_ack_ms),
+                "average_wait_ms": round(stats.wait_seconds / finished * 1000, 3) if finished else 0.0,
+                "average_processing_ms": round(stats.processing_seconds / finished * 1000, 3) if finished else 0.0,
+                "p95_processing_ms": p95(stats.recent_processing_ms),
+            }
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "in_flight": self._in_flight,
+            "active_keys": len(self._queues),
+            "sources": sources,
+        }
+
+
+webhook_dispatcher = WebhookDispatcher()
@@ -121,6 +121,7 @@ export default function Home() {
       html?: string;
       data?: any;
       actions?: string[];
+      streaming?: boolean;
     }[]
   >([{ text: "Hi, how can I help you?", isUser: false }]);
   const [input, setInput] = useState("");
@@ -298,7 +299,7 @@ export default function Home() {
 
   useEffect(() => {
     setIsConnected(false);
-    const websocket = new WebSocket("ws://localhost:8000/ws/admin");
+    const websocket = new WebSocket("ws://localhost:8000/ws/admin?stream=1");
 
     websocket.onopen = () => {
       console.log("Connected to admin WebSocket");
@@ -306,21 +307,66 @@ export default function Home() {
     };
 
     websocket.onmessage = (event) => {
-      const cleanMessage = event.data.replace(/^admin bot:\s*/i, "");
+      let frame: any = null;
+      try {
+        frame = JSON.parse(event.data);
+      } catch (e) {
+        // Not a frame, handled as a plain text reply below
+      }
+
+      if (frame && frame.type === "delta") {
+        setIsTyping(false);
+        setMessages((prev) => {
+          const last = prev[prev.length - 1];
+          if (last && last.streaming) {
+            return [...prev.slice(0, -1), { ...last, text: (last.text || "") + frame.text }];
+          }
+          return [...prev, { text: frame.text, isUser: false, streaming: true }];
+        });
+        return;
+      }
+
+      if (frame && (frame.type === "tool_start" || frame.type === "tool_end")) {
+        return;
+      }
+
+      if (frame && frame.type === "job") {
+        // A background job (invoice approval) finished; it may arrive while a reply is streaming
+        const text = frame.status === "succeeded"
+          ? frame.result?.message ?? `Invoice ${frame.result?.invoice_number ?? ""} sent`
+          : `Invoice job ${frame.job_id} failed${frame.error ? `: ${frame.error}` : ""}`;
+        setMessages((prev) => {
+          const last = prev[prev.length - 1];
+          if (last && last.streaming) {
+            return [...prev.slice(0, -1), { text, isUser: false }, last];
+          }
+          return [...prev, { text, isUser: false }];
+        });
+        return;
+      }
+
+      const cleanMessage = (frame && (frame.type === "final" || frame.type === "error")
+        ? (frame.text ?? frame.message)
+        : event.data
+      ).replace(/^admin bot:\s*/i, "");
       setIsTyping(false);
 
+      // Drop the streamed draft, the final frame carries the complete reply
+      const withoutDraft = (prev: typeof messages) =>
+        prev.length && prev[prev.length - 1].streaming ? prev.slice(0, -1) : prev;
+
       // Try to parse as JSON for structured responses
       try {
         const parsed = JSON.parse(cleanMessage);
         if (parsed.type === "invoice_preview") {
-          setMessages((prev) => [...prev, { ...parsed, isUser: false }]);
+          setMessages((prev) => [...withoutDraft(prev), { ...parsed, isUser: false }]);
           return;
         }
       } catch (e) {
         // Not JSON, treat as regular text
       }
 
-      setMessages((prev) => [...prev, { text: cleanMessage, isUser: false }]);
+      setMessages((prev) => [...withoutDraft(prev), { text: cleanMessage, isUser: false }]);
     };
 
     websocket.onerror = (error) => {